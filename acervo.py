@@ -0,0 +1,471 @@
+"""
+Acervo de boletins em arquivo binário de registros de tamanho fixo.
+
+O arquivo começa com um cabeçalho de TAMANHO_CABECALHO bytes (MAGIA_ACERVO,
+versão e tamanho do registro) e segue com um registro DTYPE_REGISTRO por
+boletim, só acrescentados no fim:
+
+    d   recebido_em (segundos desde 1970)
+    4 x 6s os grupos do cabeçalho (METCMQ, LaLaLaLoLoLo, YYGoGoGoG, hhhPdPdPd)
+    I   máscara das zonas presentes (bit i = zona i)
+    32 x (B zona, H direção em dezenas de mils, H velocidade em nós,
+          H temperatura em décimos de K, H pressão em mb)
+
+é o layout do quadro binário do protocolo (protocolo.py) com o horário na
+frente, em little-endian e sem magia nem CRC: 324 bytes por boletim. Como
+o tamanho é fixo, o registro i está em TAMANHO_CABECALHO + i * 324 e o
+acesso a qualquer boletim é O(1).
+
+A leitura é por mmap: Acervo.registros é um array estruturado NumPy sobre
+o próprio arquivo, sem cópia, e colunas como
+registros["zonas"]["temperatura"][:, 8] são varridas pelo NumPy sem criar
+um objeto Python por boletim. Só boletim() e boletins() montam as strings
+dos campos, para quem precisa do boletim como lista.
+
+Um índice de tempo fica ao lado, em CAMINHO.idx: pares (recebido_em,
+número do registro) ordenados pelo tempo, para buscas por intervalo com
+np.searchsorted. Enquanto os boletins chegam em ordem, o índice só cresce
+junto com o acervo; um acréscimo fora de ordem faz o índice ser refeito
+(uma ordenação do NumPy) na próxima consulta. O índice é sempre derivável
+do acervo: se faltar, estiver atrasado ou não bater, é refeito.
+
+Só um processo deve gravar em um acervo; leitores em outros processos
+chamam atualizar() para enxergar os registros novos. Um registro cortado
+no fim (queda no meio de uma gravação) é ignorado na leitura e descartado
+quando o acervo é aberto para gravação.
+
+O caminho usado pelo app de consulta pode ser definido pela variável de
+ambiente STANAG_ACERVO. Uso pela linha de comando:
+    python acervo.py info boletins.acervo
+    python acervo.py medir --boletins 1000000
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from banco import FORMATO_ZONA
+from decodificador import decodificar_zonas, empacotar_zonas
+from protocolo import FORMATO_BINARIO, MAGIA, TAMANHO_CRC, VERSAO_BINARIA
+from stanag import CAMPOS_CABECALHO, NUMERO_ZONAS
+from validade import inicios_validade
+
+CAMINHO_ACERVO = os.environ.get("STANAG_ACERVO", "")
+EXTENSAO_INDICE = ".idx"
+
+MAGIA_ACERVO = b"STANAGAC"
+MAGIA_INDICE = b"STANAGIX"
+VERSAO_ACERVO = 1
+TAMANHO_CABECALHO = 64
+CABECALHO = struct.Struct("<8sHH")
+
+# Zona como no quadro binário do protocolo (valores como transmitidos)
+DTYPE_ZONA_ACERVO = np.dtype([
+    ("zona", np.uint8),
+    ("direcao_vento", "<u2"),     # dezenas de mils
+    ("velocidade_vento", "<u2"),  # nós
+    ("temperatura", "<u2"),       # décimos de Kelvin
+    ("pressao", "<u2"),           # mb
+])
+
+DTYPE_REGISTRO = np.dtype(
+    [("recebido_em", "<f8")]
+    + [(campo, "S6") for campo in CAMPOS_CABECALHO]
+    + [("presentes", "<u4"), ("zonas", DTYPE_ZONA_ACERVO, (NUMERO_ZONAS,))]
+)
+
+# O quadro binário do protocolo (big-endian), para reenviar registros do acervo
+DTYPE_QUADRO = np.dtype([
+    ("magia", np.uint8), ("versao", np.uint8), ("comprimento", ">u2"), ("cabecalho", "S24"),
+    ("presentes", ">u4"), ("zonas", DTYPE_ZONA_ACERVO.newbyteorder(">"), (NUMERO_ZONAS,)), ("crc", ">u4"),
+])
+
+DTYPE_INDICE = np.dtype([("recebido_em", "<f8"), ("registro", "<u8")])
+
+_BITS_ZONAS = np.uint32(1) << np.arange(NUMERO_ZONAS, dtype=np.uint32)
+
+
+# Função para converter boletins (listas de 36 campos) em registros do acervo
+def registros_de_boletins(boletins, recebido_em=None):
+    """
+    Retorna um array DTYPE_REGISTRO com os boletins. `recebido_em` é um
+    número ou uma sequência (um por boletim); o padrão é agora. Zonas vazias
+    ou inválidas ficam fora da máscara de presentes.
+    """
+    boletins = list(boletins)
+    registros = np.zeros(len(boletins), dtype=DTYPE_REGISTRO)
+    if not boletins:
+        return registros
+    registros["recebido_em"] = time.time() if recebido_em is None else recebido_em
+    for i, campo in enumerate(CAMPOS_CABECALHO):
+        registros[campo] = [boletim[i].strip().encode("ascii", "replace")[:6] for boletim in boletins]
+
+    zonas, validos = decodificar_zonas(empacotar_zonas(zona for boletim in boletins for zona in boletim[4:]))
+    registros["presentes"] = (validos * _BITS_ZONAS).sum(axis=1, dtype=np.uint32)
+    destino = registros["zonas"]
+    destino["zona"] = zonas["zona"]
+    destino["direcao_vento"] = zonas["direcao_vento"] // 10
+    destino["velocidade_vento"] = zonas["velocidade_vento"]
+    destino["temperatura"] = np.rint(zonas["temperatura"] * 10)
+    destino["pressao"] = zonas["pressao"]
+    return registros
+
+
+# Função para montar os 36 campos de um registro do acervo
+def campos_do_registro(registro):
+    # tolist() converte cada parte de uma vez, em vez de campo a campo
+    _, *cabecalho, presentes, _ = registro.tolist()
+    zonas = registro["zonas"].tolist()
+    campos = [grupo.decode("ascii") for grupo in cabecalho]
+    campos.extend(FORMATO_ZONA % zona if presentes >> i & 1 else "" for i, zona in enumerate(zonas))
+    return campos
+
+
+# Função para converter registros do acervo em quadros binários do protocolo
+def quadros_binarios(registros):
+    """
+    Retorna um array DTYPE_QUADRO com o quadro (versão 1) de cada registro,
+    igual ao de protocolo.codificar_boletim; o quadro i é
+    array[i].tobytes(). Só o CRC é calculado boletim a boletim.
+    """
+    quadros = np.zeros(len(registros), dtype=DTYPE_QUADRO)
+    quadros["magia"] = MAGIA
+    quadros["versao"] = VERSAO_BINARIA
+    quadros["comprimento"] = FORMATO_BINARIO.size
+    # Os grupos do cabeçalho vão completados com espaços, como no protocolo
+    cabecalho = np.concatenate([registros[campo].view((np.uint8, 6)) for campo in CAMPOS_CABECALHO], axis=1)
+    cabecalho[cabecalho == 0] = ord(" ")
+    quadros["cabecalho"] = cabecalho.view("S24").ravel()
+    quadros["presentes"] = registros["presentes"]
+    quadros["zonas"] = registros["zonas"]
+    dados = memoryview(quadros.view(np.uint8))
+    quadros["crc"] = [zlib.crc32(dados[inicio:inicio + FORMATO_BINARIO.size - TAMANHO_CRC])
+                      for inicio in range(0, len(dados), FORMATO_BINARIO.size)]
+    return quadros
+
+
+# Função para calcular o instante de cada registro pelo YYGoGoGoG
+def inicios_validade_registros(registros):
+    """
+    Retorna o início da validade de cada registro (segundos desde 1970),
+    calculado pelo NumPy a partir dos bytes do YYGoGoGoG; registros sem o
+    grupo válido ficam com o recebido_em.
+    """
+    digitos = registros["YYGoGoGoG"].view((np.uint8, 6)).astype(np.int64) - ord("0")
+    dias = digitos[:, 0] * 10 + digitos[:, 1]
+    horas = digitos[:, 2] * 100 + digitos[:, 3] * 10 + digitos[:, 4]
+    validos = ((digitos >= 0) & (digitos <= 9)).all(axis=1) & (dias >= 1) & (dias <= 31) & (horas < 240)
+    recebidos = registros["recebido_em"]
+    inicios = inicios_validade(np.where(validos, dias, 0), np.where(validos, horas, 0), recebidos)
+    return np.where(np.isnan(inicios), recebidos, inicios)
+
+
+def _entradas(tempos, primeiro):
+    entradas = np.empty(len(tempos), dtype=DTYPE_INDICE)
+    entradas["recebido_em"] = tempos
+    entradas["registro"] = np.arange(primeiro, primeiro + len(tempos))
+    return entradas
+
+
+def _mapear(arquivo, inicio, dtype):
+    # Array sobre o arquivo inteiro (sem cópia); os bytes de um registro
+    # cortado no fim ficam de fora
+    tamanho = os.fstat(arquivo.fileno()).st_size
+    quantidade = max(tamanho - inicio, 0) // dtype.itemsize
+    if not quantidade:
+        return np.empty(0, dtype=dtype)
+    mapa = mmap.mmap(arquivo.fileno(), inicio + quantidade * dtype.itemsize, access=mmap.ACCESS_READ)
+    return np.frombuffer(mapa, dtype=dtype, count=quantidade, offset=inicio)
+
+
+def _cabecalho(magia):
+    return CABECALHO.pack(magia, VERSAO_ACERVO, DTYPE_REGISTRO.itemsize).ljust(TAMANHO_CABECALHO, b"\0")
+
+
+def _abrir(caminho, magia, modo):
+    """Abre (ou cria, nos modos de gravação) um arquivo com o cabeçalho do acervo."""
+    if modo == "w" or (modo == "a" and not os.path.exists(caminho)):
+        arquivo = open(caminho, "w+b")
+        arquivo.write(_cabecalho(magia))
+        arquivo.flush()
+        return arquivo
+    arquivo = open(caminho, "rb" if modo == "r" else "r+b")
+    cabecalho = arquivo.read(TAMANHO_CABECALHO)
+    if len(cabecalho) < CABECALHO.size or cabecalho[:CABECALHO.size] != _cabecalho(magia)[:CABECALHO.size]:
+        arquivo.close()
+        raise ValueError(f"{caminho} não é um acervo de boletins compatível (versão {VERSAO_ACERVO}).")
+    return arquivo
+
+
+class Acervo:
+    """
+    Acervo em `caminho`, aberto como um arquivo: modo "r" (só leitura), "a"
+    (acrescenta, criando se não existir) ou "w" (cria vazio). Os arrays
+    devolvidos continuam válidos depois de fechar() ou de novos acréscimos.
+    """
+
+    def __init__(self, caminho=CAMINHO_ACERVO, modo="r"):
+        if modo not in ("r", "a", "w"):
+            raise ValueError(f"Modo inválido: {modo!r}")
+        self.caminho = caminho
+        self.modo = modo
+        self._lock = threading.Lock()
+        self._arquivo = _abrir(caminho, MAGIA_ACERVO, modo)
+        self._registros = _mapear(self._arquivo, TAMANHO_CABECALHO, DTYPE_REGISTRO)
+        self._quantidade = len(self._registros)
+        if modo != "r":
+            # Descarta um registro cortado no fim, para os próximos ficarem alinhados
+            self._arquivo.truncate(TAMANHO_CABECALHO + self._quantidade * DTYPE_REGISTRO.itemsize)
+        self._indice = None         # array DTYPE_INDICE ordenado pelo tempo
+        self._ordenado = False      # o índice é a própria ordem dos registros
+        self._arquivo_indice = None
+        self._carregar_indice()
+
+    def __len__(self):
+        return self._quantidade
+
+    @property
+    def registros(self):
+        """Todos os registros (array DTYPE_REGISTRO só de leitura, sobre o mmap)."""
+        with self._lock:
+            if len(self._registros) != self._quantidade:
+                self._registros = _mapear(self._arquivo, TAMANHO_CABECALHO, DTYPE_REGISTRO)
+            return self._registros
+
+    def __getitem__(self, i):
+        return self.registros[i]
+
+    def boletim(self, i):
+        """Os 36 campos do registro i."""
+        return campos_do_registro(self.registros[i])
+
+    def boletins(self, indices):
+        registros = self.registros
+        return [campos_do_registro(registros[i]) for i in indices]
+
+    # Função para acrescentar boletins no fim do acervo
+    def acrescentar(self, boletins, recebido_em=None):
+        """Acrescenta boletins (listas de 36 campos); serve como assinante do receptor."""
+        return self.acrescentar_registros(registros_de_boletins(boletins, recebido_em))
+
+    def acrescentar_registros(self, registros):
+        """Acrescenta um array DTYPE_REGISTRO com uma única escrita. Retorna o número do primeiro."""
+        if self.modo == "r":
+            raise ValueError("Acervo aberto só para leitura.")
+        registros = np.asarray(registros, dtype=DTYPE_REGISTRO)
+        with self._lock:
+            primeiro = self._quantidade
+            if not len(registros):
+                return primeiro
+            self._arquivo.seek(0, os.SEEK_END)
+            self._arquivo.write(registros.tobytes())
+            self._arquivo.flush()
+            self._quantidade += len(registros)
+            # O índice só cresce se os novos vierem em ordem; senão é refeito quando for usado
+            tempos = registros["recebido_em"]
+            if self._indice is not None and len(self._indice) == primeiro and self._em_ordem(tempos):
+                self._gravar_indice(_entradas(tempos, primeiro), primeiro)
+                self._indice = _mapear(self._arquivo_indice, TAMANHO_CABECALHO, DTYPE_INDICE)
+            else:
+                self._indice = None
+            return primeiro
+
+    def _em_ordem(self, tempos):
+        return bool((np.diff(tempos) >= 0).all()
+                    and (not len(self._indice) or tempos[0] >= self._indice["recebido_em"][-1]))
+
+    def atualizar(self):
+        """Enxerga os registros acrescentados por outro processo. Retorna a quantidade."""
+        with self._lock:
+            tamanho = os.fstat(self._arquivo.fileno()).st_size
+            self._quantidade = max(tamanho - TAMANHO_CABECALHO, 0) // DTYPE_REGISTRO.itemsize
+        return self._quantidade
+
+    # Funções do índice de tempo
+
+    def _carregar_indice(self):
+        caminho = self.caminho + EXTENSAO_INDICE
+        if self.modo != "r":
+            try:
+                self._arquivo_indice = _abrir(caminho, MAGIA_INDICE, "w" if self.modo == "w" else "a")
+            except ValueError:
+                self._arquivo_indice = _abrir(caminho, MAGIA_INDICE, "w")
+            self._indice = _mapear(self._arquivo_indice, TAMANHO_CABECALHO, DTYPE_INDICE)
+        else:
+            try:
+                with _abrir(caminho, MAGIA_INDICE, "r") as arquivo:
+                    self._indice = _mapear(arquivo, TAMANHO_CABECALHO, DTYPE_INDICE)
+            except (OSError, ValueError):
+                self._indice = np.empty(0, dtype=DTYPE_INDICE)
+        self._ordenado = bool((self._indice["registro"] == np.arange(len(self._indice))).all())
+
+    def _indice_em_dia(self):
+        # Chamado com o lock; completa ou refaz o índice para cobrir todos os registros
+        if self._indice is None or len(self._indice) > self._quantidade:
+            return self._reconstruir()
+        cobertos = len(self._indice)
+        if cobertos == self._quantidade:
+            return self._indice
+        registros = self._registros
+        if len(registros) != self._quantidade:
+            registros = _mapear(self._arquivo, TAMANHO_CABECALHO, DTYPE_REGISTRO)[:self._quantidade]
+        tempos = registros["recebido_em"][cobertos:]
+        if not self._em_ordem(tempos):
+            return self._reconstruir(registros)
+        novos = _entradas(tempos, cobertos)
+        self._indice = np.concatenate([self._indice, novos])
+        self._gravar_indice(novos, cobertos)
+        return self._indice
+
+    def _reconstruir(self, registros=None):
+        if registros is None:
+            registros = _mapear(self._arquivo, TAMANHO_CABECALHO, DTYPE_REGISTRO)[:self._quantidade]
+        ordem = np.argsort(registros["recebido_em"], kind="stable")
+        indice = np.empty(len(registros), dtype=DTYPE_INDICE)
+        indice["recebido_em"] = registros["recebido_em"][ordem]
+        indice["registro"] = ordem
+        self._indice = indice
+        self._ordenado = bool((ordem == np.arange(len(ordem))).all())
+        self._gravar_indice(indice, 0)
+        return indice
+
+    def _gravar_indice(self, entradas, inicio):
+        # Só quem grava o acervo atualiza o arquivo do índice; leitores ficam com ele em memória
+        if self._arquivo_indice is None:
+            return
+        self._arquivo_indice.truncate(TAMANHO_CABECALHO + inicio * DTYPE_INDICE.itemsize)
+        self._arquivo_indice.seek(0, os.SEEK_END)
+        self._arquivo_indice.write(entradas.tobytes())
+        self._arquivo_indice.flush()
+
+    def _posicoes(self, desde, ate):
+        with self._lock:
+            indice = self._indice_em_dia()
+        tempos = indice["recebido_em"]
+        inicio = 0 if desde is None else int(np.searchsorted(tempos, desde, side="left"))
+        fim = len(tempos) if ate is None else int(np.searchsorted(tempos, ate, side="right"))
+        return indice, inicio, fim
+
+    # Função para buscar os registros de um intervalo de tempo
+    def intervalo(self, desde=None, ate=None):
+        """
+        Retorna os números dos registros recebidos entre `desde` e `ate`
+        (segundos desde 1970, inclusive), em ordem de recebimento.
+        """
+        indice, inicio, fim = self._posicoes(desde, ate)
+        return indice["registro"][inicio:fim].astype(np.int64)
+
+    def selecionar(self, desde=None, ate=None):
+        """
+        Os registros recebidos entre `desde` e `ate`, em ordem de
+        recebimento. Se o acervo foi gravado em ordem, é uma fatia do mmap,
+        sem cópia.
+        """
+        indice, inicio, fim = self._posicoes(desde, ate)
+        if self._ordenado:
+            return self.registros[inicio:fim]
+        return self.registros[indice["registro"][inicio:fim]]
+
+    def ultimo_ate(self, instante):
+        """Número do último registro recebido até `instante`, ou None."""
+        with self._lock:
+            indice = self._indice_em_dia()
+        posicao = np.searchsorted(indice["recebido_em"], instante, side="right")
+        return int(indice["registro"][posicao - 1]) if posicao else None
+
+    def fechar(self):
+        with self._lock:
+            if self.modo != "r":
+                self._indice_em_dia()
+            for arquivo in (self._arquivo, self._arquivo_indice):
+                if arquivo is not None:
+                    arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def _formatar_data(segundos):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(segundos))
+
+
+def _medir(quantidade, pasta):
+    from gerador import gerar_boletins
+
+    caminho = os.path.join(pasta, "medicao.acervo")
+    modelos = registros_de_boletins(gerar_boletins(1000, semente=4082))
+    inicio = time.perf_counter()
+    with Acervo(caminho, "w") as acervo:
+        for primeiro in range(0, quantidade, len(modelos)):
+            lote = modelos[:quantidade - primeiro].copy()
+            lote["recebido_em"] = 1.7e9 + np.arange(primeiro, primeiro + len(lote)) * 60.0
+            acervo.acrescentar_registros(lote)
+    print(f"gravação: {quantidade / (time.perf_counter() - inicio):,.0f} boletins/s "
+          f"({os.path.getsize(caminho) / quantidade:.0f} bytes por boletim)")
+
+    with Acervo(caminho) as acervo:
+        medidas = [
+            ("varredura (média da temperatura da zona 8)",
+             lambda: acervo.registros["zonas"]["temperatura"][:, 8].mean()),
+            ("varredura (boletins com a zona 8)",
+             lambda: (acervo.registros["presentes"] >> 8 & 1).sum()),
+            ("inícios de validade", lambda: inicios_validade_registros(acervo.registros)),
+        ]
+        for nome, funcao in medidas:
+            inicio = time.perf_counter()
+            funcao()
+            duracao = time.perf_counter() - inicio
+            print(f"{nome}: {duracao * 1000:.1f} ms ({quantidade / duracao:,.0f} boletins/s)")
+        sorteio = np.random.default_rng(4082).integers(0, quantidade, 10000)
+        inicio = time.perf_counter()
+        for i in sorteio.tolist():
+            acervo.boletim(i)
+        print(f"acesso aleatório (boletim completo): "
+              f"{(time.perf_counter() - inicio) / len(sorteio) * 1e6:.1f} µs por boletim")
+        inicio = time.perf_counter()
+        for i in sorteio.tolist():
+            acervo.selecionar(1.7e9 + i * 60.0, 1.7e9 + i * 60.0 + 3600)
+        print(f"intervalo de uma hora: {(time.perf_counter() - inicio) / len(sorteio) * 1e6:.1f} µs por busca")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Acervo binário de boletins STANAG 4082.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    info = comandos.add_parser("info", help="quantidade de boletins e período do acervo")
+    info.add_argument("caminho")
+    medicao = comandos.add_parser("medir", help="mede gravação, varredura e acesso aleatório")
+    medicao.add_argument("--boletins", type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    if args.comando == "medir":
+        with tempfile.TemporaryDirectory() as pasta:
+            _medir(args.boletins, pasta)
+        return 0
+
+    try:
+        acervo = Acervo(args.caminho)
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    with acervo:
+        print(f"{args.caminho}: {len(acervo)} boletins, {os.path.getsize(args.caminho):,} bytes")
+        if len(acervo):
+            numeros = acervo.intervalo()
+            print(f"de {_formatar_data(acervo[numeros[0]]['recebido_em'])} "
+                  f"a {_formatar_data(acervo[numeros[-1]]['recebido_em'])} (UTC), "
+                  f"{'em' if acervo._ordenado else 'fora de'} ordem de recebimento")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
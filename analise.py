@@ -0,0 +1,466 @@
+"""
+Análises de séries temporais sobre o histórico de zonas gravado no banco.
+
+HistoricoZonas carrega do banco só as zonas pedidas, em blocos e já como
+colunas NumPy: as zonas de cada boletim vêm concatenadas pelo SQLite em uma
+string de largura fixa e são decodificadas em lote por
+decodificador.decodificar_zonas. As colunas ficam em cache por zona; uma
+nova consulta só lê os boletins gravados depois da anterior.
+HistoricoAcervo faz o mesmo a partir de um acervo binário (acervo.py): as
+colunas saem direto do mmap, sem SQL e sem strings.
+
+O instante de cada leitura é o início da validade do boletim (YYGoGoGoG);
+boletins sem o grupo válido usam o horário em que foram salvos. Sobre as
+séries há reamostragem em intervalos fixos, janelas móveis, percentis,
+tendência linear e o resumo mínimo/máximo/média por zona. A direção do
+vento não tem média aritmética: para ela use as componentes "u" e "v" e
+converta com direcao_de_componentes.
+
+    python analise.py resumo --campo temperatura --desde 2026-10-01
+    python analise.py serie --zona 8 --campo velocidade_vento --intervalo 1h
+    python analise.py serie --altura 5000 --campo temperatura --intervalo 1d --janela 7d
+    python analise.py percentis --zona 8 --campo velocidade_vento --q 5 50 95
+    python analise.py tendencia --altura 5000 --campo temperatura
+    python analise.py --acervo boletins.acervo resumo --campo velocidade_vento
+"""
+import argparse
+import sys
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from acervo import Acervo, inicios_validade_registros
+from banco import CAMINHO_BANCO, BancoDados
+from decodificador import TAMANHO_ZONA, decodificar_zonas
+from perfil import MILS_POR_VOLTA
+from stanag import NUMERO_ZONAS, ZONA_INVALIDA, zona_para_altura
+from validade import inicios_validade
+
+TAMANHO_BLOCO = 50000
+
+CAMPOS_ANALISE = ("direcao_vento", "velocidade_vento", "temperatura", "pressao", "u", "v")
+ESTATISTICAS = ("media", "minimo", "maximo", "soma", "contagem", "desvio", "mediana")
+
+# As zonas pedidas de cada boletim, concatenadas. Cada zona sai como o número
+# 1ZZdddFFFTTTTPPPP (ZZ aqui é a posição da zona): montar o número é mais
+# barato para o SQLite que printf, e o 1 na frente preserva os zeros à esquerda
+SQL_ZONAS = """
+    SELECT boletim_id, group_concat(10000000000000000 + zona * 100000000000000
+                                    + direcao_vento / 10 * 100000000000 + velocidade_vento * 100000000
+                                    + temperatura * 10000 + pressao, '')
+    FROM zona_completa WHERE boletim_id BETWEEN ? AND ? AND zona IN ({zonas})
+    GROUP BY boletim_id
+"""
+
+SQL_BOLETINS = """
+    SELECT id, METCMQ, LaLaLaLoLoLo, COALESCE(dia, 0), COALESCE(hora, 0), salvo_em FROM boletim
+    WHERE id > ? ORDER BY id LIMIT ?
+"""
+
+DTYPE_LEITURA = np.dtype([
+    ("tempo", np.float64),        # segundos desde 1970
+    ("estacao", np.int32),        # índice em HistoricoZonas.estacoes
+    ("direcao_vento", np.float64),
+    ("velocidade_vento", np.float64),
+    ("temperatura", np.float64),
+    ("pressao", np.float64),
+])
+
+
+class HistoricoZonas:
+    """
+    Colunas por zona do histórico gravado em um BancoDados. `estacoes` é a
+    lista das estações (octante, LaLaLaLoLoLo) na ordem dos índices da
+    coluna "estacao".
+    """
+
+    def __init__(self, bd, tamanho_bloco=TAMANHO_BLOCO):
+        self.bd = bd
+        self.tamanho_bloco = tamanho_bloco
+        self.estacoes = []
+        self._indice_estacao = {}
+        self._zonas = {}        # zona -> array DTYPE_LEITURA ordenado por tempo
+        self._ultimo_id = {}    # zona -> último boletim lido
+        self._lock = threading.Lock()
+
+    def atualizar(self, zonas):
+        """
+        Garante que as zonas estejam em cache e em dia com o banco. As zonas
+        novas são lidas inteiras; as que já estavam, só a partir do último
+        boletim lido. Zonas com o mesmo ponto de partida são lidas juntas.
+        """
+        with self._lock:
+            pendentes = {}
+            for zona in set(zonas):
+                pendentes.setdefault(self._ultimo_id.get(zona, 0), []).append(zona)
+            for desde_id, grupo in pendentes.items():
+                novas, ultimo_id = self._ler(sorted(grupo), desde_id)
+                for zona in grupo:
+                    atuais = self._zonas.get(zona)
+                    leituras = novas[zona] if atuais is None else np.concatenate([atuais, novas[zona]])
+                    # Boletins importados fora de ordem: reordena pelo tempo
+                    if len(leituras) and (np.diff(leituras["tempo"]) < 0).any():
+                        leituras = leituras[np.argsort(leituras["tempo"], kind="stable")]
+                    self._zonas[zona] = leituras
+                    self._ultimo_id[zona] = max(ultimo_id, desde_id)
+
+    def _ler(self, zonas, desde_id):
+        blocos = {zona: [] for zona in zonas}
+        sql_zonas = SQL_ZONAS.format(zonas=", ".join(map(str, zonas)))
+        ultimo_id = desde_id
+        while True:
+            boletins = self.bd.consultar(SQL_BOLETINS, (ultimo_id, self.tamanho_bloco))
+            if not boletins:
+                break
+            ids, dias, horas, salvos = np.array([(linha[0], *linha[3:]) for linha in boletins], np.int64).T
+            tempos = inicios_validade(dias, horas, salvos)
+            tempos = np.where(np.isnan(tempos), salvos, tempos)
+            estacoes = np.fromiter((self._estacao(linha[1], linha[2]) for linha in boletins),
+                                   np.int32, len(boletins))
+            primeiro_id, ultimo_id = int(ids[0]), int(ids[-1])
+
+            linhas = self.bd.consultar(sql_zonas, (primeiro_id, ultimo_id))
+            if linhas:
+                texto = "".join(linha[1] for linha in linhas).encode("ascii")
+                zonas_texto = np.frombuffer(texto, np.uint8).reshape(-1, TAMANHO_ZONA + 1)[:, 1:]
+                registros = decodificar_zonas(zonas_texto.tobytes(), 1)[0].ravel()
+                quantidades = np.fromiter((len(linha[1]) // (TAMANHO_ZONA + 1) for linha in linhas),
+                                          np.int64, len(linhas))
+                posicoes = np.searchsorted(ids, np.repeat(
+                    np.fromiter((linha[0] for linha in linhas), np.int64, len(linhas)), quantidades))
+
+                leituras = np.empty(len(registros), dtype=DTYPE_LEITURA)
+                leituras["tempo"] = tempos[posicoes]
+                leituras["estacao"] = estacoes[posicoes]
+                for campo in ("direcao_vento", "velocidade_vento", "pressao"):
+                    leituras[campo] = registros[campo]
+                # O decodificador dá float32: arredondar já em float64, senão
+                # 269.3 K viraria 269.29998779 (o acervo divide os décimos por 10)
+                leituras["temperatura"] = np.round(registros["temperatura"].astype(np.float64), 1)
+                for zona in zonas:
+                    blocos[zona].append(leituras[registros["zona"] == zona])
+        return ({zona: np.concatenate(partes) if partes else np.empty(0, DTYPE_LEITURA)
+                 for zona, partes in blocos.items()}, ultimo_id)
+
+    def _estacao(self, metcmq, lalalalololo):
+        chave = (metcmq[5:], lalalalololo)
+        indice = self._indice_estacao.get(chave)
+        if indice is None:
+            indice = self._indice_estacao[chave] = len(self.estacoes)
+            self.estacoes.append(chave)
+        return indice
+
+    def leituras(self, zona, desde=None, ate=None, estacao=None):
+        """
+        Retorna as leituras (array DTYPE_LEITURA, ordenado pelo tempo) da
+        zona entre `desde` e `ate` (segundos desde 1970, inclusive), de
+        todas as estações ou só da estação (octante, LaLaLaLoLoLo) informada.
+        """
+        self.atualizar([zona])
+        leituras = self._zonas[zona]
+        tempos = leituras["tempo"]
+        inicio = 0 if desde is None else np.searchsorted(tempos, desde, side="left")
+        fim = len(tempos) if ate is None else np.searchsorted(tempos, ate, side="right")
+        leituras = leituras[inicio:fim]
+        if estacao is not None:
+            leituras = leituras[leituras["estacao"] == self._indice_estacao.get(estacao, -1)]
+        return leituras
+
+    def serie(self, zona, campo, desde=None, ate=None, estacao=None):
+        """Retorna (tempos, valores) de um campo de CAMPOS_ANALISE na zona."""
+        leituras = self.leituras(zona, desde, ate, estacao)
+        return leituras["tempo"], valores_do_campo(leituras, campo)
+
+    def resumo(self, campo, zonas=range(NUMERO_ZONAS), desde=None, ate=None, estacao=None):
+        """
+        Retorna um array estruturado com uma linha por zona: quantidade de
+        leituras, mínimo, máximo, média e desvio padrão do campo.
+        """
+        zonas = list(zonas)
+        self.atualizar(zonas)
+        resultado = np.zeros(len(zonas), dtype=[
+            ("zona", np.int16), ("leituras", np.int64), ("minimo", np.float64),
+            ("maximo", np.float64), ("media", np.float64), ("desvio", np.float64),
+        ])
+        resultado["zona"] = zonas
+        for i, zona in enumerate(zonas):
+            _, valores = self.serie(zona, campo, desde, ate, estacao)
+            resultado["leituras"][i] = len(valores)
+            estatisticas = ((valores.min(), valores.max(), valores.mean(), valores.std())
+                            if len(valores) else (np.nan,) * 4)
+            for nome, valor in zip(("minimo", "maximo", "media", "desvio"), estatisticas):
+                resultado[nome][i] = valor
+        return resultado
+
+
+class HistoricoAcervo(HistoricoZonas):
+    """
+    HistoricoZonas sobre um Acervo em vez do banco. Os boletins são
+    identificados pela posição no acervo; cada bloco é lido do mmap e
+    convertido pelo NumPy, criando objetos Python só para as estações novas.
+    """
+
+    def __init__(self, acervo, tamanho_bloco=TAMANHO_BLOCO):
+        super().__init__(None, tamanho_bloco)
+        self.acervo = acervo
+
+    def _ler(self, zonas, desde_id):
+        blocos = {zona: [] for zona in zonas}
+        total = self.acervo.atualizar()
+        registros = self.acervo.registros
+        for inicio in range(desde_id, total, self.tamanho_bloco):
+            bloco = registros[inicio:inicio + self.tamanho_bloco]
+            tempos = inicios_validade_registros(bloco)
+            estacoes = self._estacoes(bloco)
+            for zona in zonas:
+                presentes = (bloco["presentes"] >> zona & 1).astype(bool)
+                valores = bloco["zonas"][presentes, zona]
+                leituras = np.empty(len(valores), dtype=DTYPE_LEITURA)
+                leituras["tempo"] = tempos[presentes]
+                leituras["estacao"] = estacoes[presentes]
+                leituras["direcao_vento"] = valores["direcao_vento"] * 10
+                leituras["velocidade_vento"] = valores["velocidade_vento"]
+                leituras["temperatura"] = valores["temperatura"] / 10
+                leituras["pressao"] = valores["pressao"]
+                blocos[zona].append(leituras)
+        return ({zona: np.concatenate(partes) if partes else np.empty(0, DTYPE_LEITURA)
+                 for zona, partes in blocos.items()}, max(total, desde_id))
+
+    def _estacoes(self, bloco):
+        # Chave de 7 bytes (octante + LaLaLaLoLoLo); só as distintas passam por _estacao
+        chaves = np.empty((len(bloco), 7), dtype=np.uint8)
+        chaves[:, 0] = bloco["METCMQ"].view((np.uint8, 6))[:, 5]
+        chaves[:, 1:] = bloco["LaLaLaLoLoLo"].view((np.uint8, 6))
+        _, primeiros, inversos = np.unique(chaves.view("V7").ravel(), return_index=True, return_inverse=True)
+        indices = np.array([self._estacao(bloco["METCMQ"][i].decode("ascii"),
+                                          bloco["LaLaLaLoLoLo"][i].decode("ascii")) for i in primeiros],
+                           dtype=np.int32)
+        return indices[inversos.ravel()]
+
+
+# Função para extrair um campo (ou as componentes do vento) das leituras
+def valores_do_campo(leituras, campo):
+    if campo not in CAMPOS_ANALISE:
+        raise ValueError(f"Campo desconhecido: {campo}")
+    if campo in ("u", "v"):
+        angulo = leituras["direcao_vento"] * (2 * np.pi / MILS_POR_VOLTA)
+        funcao = np.sin if campo == "u" else np.cos
+        # Direção meteorológica: de onde o vento vem
+        return -leituras["velocidade_vento"] * funcao(angulo)
+    return leituras[campo]
+
+
+# Função para converter componentes u/v em direção (mils) e velocidade
+def direcao_de_componentes(u, v):
+    direcao = np.mod(np.arctan2(-u, -v), 2 * np.pi) * (MILS_POR_VOLTA / (2 * np.pi))
+    return direcao, np.hypot(u, v)
+
+
+# Função para agrupar uma série em intervalos fixos de tempo
+def reamostrar(tempos, valores, intervalo, estatistica="media", origem=0):
+    """
+    Agrupa a série (tempos em ordem crescente) em intervalos de `intervalo`
+    segundos contados a partir de `origem` e aplica a estatística (uma de
+    ESTATISTICAS ou "pNN" para o percentil NN) em cada um. Intervalos sem
+    leituras não aparecem. Retorna (inícios dos intervalos, valores,
+    quantidade de leituras).
+    """
+    baldes = np.floor((np.asarray(tempos) - origem) / intervalo).astype(np.int64)
+    valores = np.asarray(valores, dtype=np.float64)
+    if not len(valores):
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+    inicios = np.flatnonzero(np.r_[True, baldes[1:] != baldes[:-1]])
+    quantidades = np.diff(np.r_[inicios, len(valores)])
+
+    if estatistica in ("media", "soma", "desvio"):
+        soma = np.add.reduceat(valores, inicios)
+        media = soma / quantidades
+        if estatistica == "desvio":
+            resultado = np.sqrt(np.maximum(np.add.reduceat(valores ** 2, inicios) / quantidades - media ** 2, 0))
+        else:
+            resultado = soma if estatistica == "soma" else media
+    elif estatistica == "minimo":
+        resultado = np.minimum.reduceat(valores, inicios)
+    elif estatistica == "maximo":
+        resultado = np.maximum.reduceat(valores, inicios)
+    elif estatistica == "contagem":
+        resultado = quantidades.astype(np.float64)
+    else:
+        resultado = _percentil_por_grupo(valores, baldes, inicios, quantidades, _percentil(estatistica))
+    return baldes[inicios] * intervalo + origem, resultado, quantidades
+
+
+def _percentil(estatistica):
+    if estatistica == "mediana":
+        return 50.0
+    if estatistica.startswith("p"):
+        try:
+            return float(estatistica[1:])
+        except ValueError:
+            pass
+    raise ValueError(f"Estatística desconhecida: {estatistica}")
+
+
+def _percentil_por_grupo(valores, baldes, inicios, quantidades, q):
+    # Ordena por (grupo, valor) e interpola linearmente dentro de cada grupo,
+    # como np.percentile, sem um laço por grupo
+    ordenados = valores[np.lexsort((valores, baldes))]
+    posicao = inicios + q / 100 * (quantidades - 1)
+    abaixo = np.floor(posicao).astype(np.int64)
+    acima = np.minimum(abaixo + 1, inicios + quantidades - 1)
+    fracao = posicao - abaixo
+    return ordenados[abaixo] * (1 - fracao) + ordenados[acima] * fracao
+
+
+# Função para calcular uma estatística em uma janela móvel de tempo
+def janela_movel(tempos, valores, largura, estatistica="media"):
+    """
+    Para cada leitura, aplica a estatística ("media", "soma", "contagem" ou
+    "desvio") às leituras dos últimos `largura` segundos, incluindo ela.
+    Usa somas acumuladas, então o custo não depende da largura da janela.
+    """
+    tempos = np.asarray(tempos)
+    valores = np.asarray(valores, dtype=np.float64)
+    fins = np.arange(1, len(valores) + 1)
+    inicios = np.searchsorted(tempos, tempos - largura, side="right")
+    quantidades = fins - inicios
+    acumulado = np.r_[0.0, np.cumsum(valores)]
+    soma = acumulado[fins] - acumulado[inicios]
+    if estatistica == "soma":
+        return soma
+    if estatistica == "contagem":
+        return quantidades.astype(np.float64)
+    media = soma / quantidades
+    if estatistica == "media":
+        return media
+    if estatistica == "desvio":
+        quadrados = np.r_[0.0, np.cumsum(valores ** 2)]
+        return np.sqrt(np.maximum((quadrados[fins] - quadrados[inicios]) / quantidades - media ** 2, 0))
+    raise ValueError(f"Estatística não suportada em janela móvel: {estatistica}")
+
+
+# Função para calcular os percentis de uma série
+def percentis(valores, qs=(5, 25, 50, 75, 95)):
+    valores = np.asarray(valores, dtype=np.float64)
+    return np.percentile(valores, qs) if len(valores) else np.full(len(qs), np.nan)
+
+
+# Função para ajustar uma reta à série
+def tendencia(tempos, valores):
+    """Retorna (variação por dia, valor ajustado no último instante), ou (nan, nan)."""
+    tempos = np.asarray(tempos, dtype=np.float64)
+    if len(tempos) < 2 or tempos[0] == tempos[-1]:
+        return np.nan, np.nan
+    dias = (tempos - tempos[-1]) / 86400
+    inclinacao, valor_final = np.polyfit(dias, valores, 1)
+    return inclinacao, valor_final
+
+
+_UNIDADES = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+# Função para ler durações da linha de comando (também usada por carga.py)
+def duracao(texto):
+    """'90s', '15m', '1h', '7d' -> segundos."""
+    try:
+        return float(texto[:-1]) * _UNIDADES[texto[-1]]
+    except (KeyError, ValueError, IndexError):
+        raise argparse.ArgumentTypeError(f"duração inválida: {texto!r} (use por exemplo 30m, 1h, 7d)") from None
+
+
+def _data_utc(texto):
+    return datetime.fromisoformat(texto).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _formatar_data(segundos):
+    return datetime.fromtimestamp(segundos, timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+def _zona_dos_args(args):
+    if args.zona is not None:
+        return args.zona
+    zona = zona_para_altura(args.altura)
+    if zona == ZONA_INVALIDA:
+        raise SystemExit(f"Altura fora do intervalo das zonas: {args.altura} m")
+    return zona
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análises do histórico de zonas dos boletins STANAG 4082.")
+    parser.add_argument("--banco", default=CAMINHO_BANCO)
+    parser.add_argument("--acervo", help="lê o histórico deste acervo binário em vez do banco")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    def filtros(sub, por_zona=True):
+        sub.add_argument("--campo", choices=CAMPOS_ANALISE, default="temperatura")
+        sub.add_argument("--desde", type=_data_utc, help="data ISO (UTC), por exemplo 2026-10-01")
+        sub.add_argument("--ate", type=_data_utc)
+        sub.add_argument("--estacao", help="octante e LaLaLaLoLoLo, por exemplo 5:207456")
+        if por_zona:
+            grupo = sub.add_mutually_exclusive_group(required=True)
+            grupo.add_argument("--zona", type=int, choices=range(NUMERO_ZONAS), metavar="ZONA")
+            grupo.add_argument("--altura", type=float, help="altura em metros (escolhe a zona)")
+
+    filtros(comandos.add_parser("resumo", help="mínimo/máximo/média por zona"), por_zona=False)
+    serie = comandos.add_parser("serie", help="série reamostrada de uma zona")
+    filtros(serie)
+    serie.add_argument("--intervalo", type=duracao, default=3600.0)
+    serie.add_argument("--estatistica", default="media", help=f"{', '.join(ESTATISTICAS)} ou pNN")
+    serie.add_argument("--janela", type=duracao, help="média móvel sobre a série reamostrada")
+    pcts = comandos.add_parser("percentis", help="percentis de uma zona")
+    filtros(pcts)
+    pcts.add_argument("--q", type=float, nargs="+", default=[5, 25, 50, 75, 95])
+    filtros(comandos.add_parser("tendencia", help="tendência linear de uma zona"))
+    args = parser.parse_args(argv)
+
+    if args.acervo:
+        with Acervo(args.acervo) as acervo:
+            return _executar(args, HistoricoAcervo(acervo))
+    with BancoDados(args.banco) as bd:
+        bd.configurar()
+        return _executar(args, HistoricoZonas(bd))
+
+
+def _executar(args, historico):
+    estacao = tuple(args.estacao.split(":", 1)) if args.estacao else None
+    if args.comando == "resumo":
+        print(f"{'zona':>4}{'leituras':>10}{'mínimo':>10}{'máximo':>10}{'média':>10}{'desvio':>10}")
+        for linha in historico.resumo(args.campo, desde=args.desde, ate=args.ate, estacao=estacao):
+            print(f"{linha['zona']:>4}{linha['leituras']:>10}{linha['minimo']:>10.1f}"
+                  f"{linha['maximo']:>10.1f}{linha['media']:>10.1f}{linha['desvio']:>10.1f}")
+        return 0
+
+    zona = _zona_dos_args(args)
+    if args.comando == "serie" and args.campo == "direcao_vento":
+        # Média vetorial: reamostra (e suaviza) u e v e converte de volta
+        tempos, u = historico.serie(zona, "u", args.desde, args.ate, estacao)
+        _, v = historico.serie(zona, "v", args.desde, args.ate, estacao)
+        inicios, u, quantidades = reamostrar(tempos, u, args.intervalo)
+        _, v, _ = reamostrar(tempos, v, args.intervalo)
+        valores = direcao_de_componentes(u, v)[0]
+        moveis = (direcao_de_componentes(janela_movel(inicios, u, args.janela),
+                                         janela_movel(inicios, v, args.janela))[0]
+                  if args.janela else None)
+    else:
+        tempos, valores = historico.serie(zona, args.campo, args.desde, args.ate, estacao)
+        if args.comando == "serie":
+            inicios, valores, quantidades = reamostrar(tempos, valores, args.intervalo, args.estatistica)
+            moveis = janela_movel(inicios, valores, args.janela) if args.janela else None
+    print(f"zona {zona}, {args.campo}: {len(tempos)} leituras")
+
+    if args.comando == "serie":
+        for i, (inicio, valor, quantidade) in enumerate(zip(inicios, valores, quantidades)):
+            movel = f"{moveis[i]:>10.1f}" if moveis is not None else ""
+            print(f"{_formatar_data(inicio)}{valor:>10.1f}{quantidade:>8}{movel}")
+    elif args.comando == "percentis":
+        for q, valor in zip(args.q, percentis(valores, args.q)):
+            print(f"p{q:g}: {valor:.1f}")
+    else:
+        por_dia, final = tendencia(tempos, valores)
+        print(f"tendência: {por_dia:+.3f} por dia (valor ajustado no fim: {final:.1f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,16 @@
-from kivymd.app import MDApp
-from kivy.uix.gridlayout import GridLayout
-from kivy.uix.scrollview import ScrollView
-from kivymd.uix.textfield import MDTextField
-from kivymd.uix.button import MDRaisedButton
-from kivy.core.window import Window
+import time
+
+INICIO = time.perf_counter()
+
 import sqlite3
-from kivy.uix.popup import Popup
-from kivy.uix.label import Label
+import threading
+from kivymd.app import MDApp
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+# Os widgets, a janela e o banco (que carrega o numpy) são importados só
+# quando usados, para o app abrir mais rápido e o módulo poder ser importado
+# por ferramentas sem abrir a interface
 
 # Definição de cores do tema
 COLORS = {
@@ -16,31 +20,52 @@ COLORS = {
     'background': [1, 1, 1, 1],
 }
 
-# Configura a cor de fundo da janela
-Window.clearcolor = COLORS['background']
+# Campos de zona criados junto com a janela; os outros são criados alguns
+# por quadro logo depois, para o primeiro quadro não esperar os 32 campos
+NUMERO_ZONAS = 32
+ZONAS_NO_PRIMEIRO_QUADRO = 8
+ZONAS_POR_QUADRO = 4
+
+# Conexão com o banco, aberta uma vez e usada durante toda a execução do app
+banco_dados = None
+banco_pronto = threading.Event()
+
+# Envio dos boletins salvos para os destinos de STANAG_DESTINOS (despacho.py)
+despachante = None
 
-# Função para configurar o banco de dados
+# Função para configurar o banco de dados (cria as tabelas ou migra o esquema antigo)
 def configurar_banco():
-    with sqlite3.connect("dados_meteorologicos.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS boletim (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                METCMQ TEXT, LaLaLaLoLoLo TEXT, YYGoGoGoG TEXT, hhhPdPdPd TEXT,
-                zona0 TEXT, zona1 TEXT, zona2 TEXT, zona3 TEXT, zona4 TEXT,
-                zona5 TEXT, zona6 TEXT, zona7 TEXT, zona8 TEXT, zona9 TEXT,
-                zona10 TEXT, zona11 TEXT, zona12 TEXT, zona13 TEXT, zona14 TEXT,
-                zona15 TEXT, zona16 TEXT, zona17 TEXT, zona18 TEXT, zona19 TEXT,
-                zona20 TEXT, zona21 TEXT, zona22 TEXT, zona23 TEXT, zona24 TEXT,
-                zona25 TEXT, zona26 TEXT, zona27 TEXT, zona28 TEXT, zona29 TEXT,
-                zona30 TEXT, zona31 TEXT
-            )
-        """)
-        conn.commit()
+    import banco
+    import despacho
+    import validacao  # noqa: F401 (carregado aqui para a primeira tecla não esperar o numpy)
+
+    global banco_dados, despachante
+    try:
+        bd = banco.BancoDados()
+        bd.configurar()
+        banco_dados = bd
+        # O banco é a fila de saída: o que for salvo sem enlace é enviado quando ele voltar
+        try:
+            destinos = despacho.ler_destinos(despacho.DESTINOS_PADRAO)
+            if destinos:
+                despachante = despacho.Despachante(destinos, bd.caminho).iniciar()
+        except (ValueError, sqlite3.Error) as e:
+            Logger.warning(f"Despacho: envio desativado ({e})")
+    finally:
+        banco_pronto.set()
 
 # Classe principal do app
 class StanagApp(MDApp):
     def build(self):
+        from kivy.core.window import Window
+        from kivy.uix.gridlayout import GridLayout
+        from kivy.uix.scrollview import ScrollView
+        from kivymd.uix.textfield import MDTextField
+        from kivymd.uix.button import MDRaisedButton
+
+        # Configura a cor de fundo da janela
+        Window.clearcolor = COLORS['background']
+
         self.title = "Boletim STANAG 4082"
         self.theme_cls.primary_palette = "Blue"
         
@@ -57,7 +82,10 @@ class StanagApp(MDApp):
 
         # Layout de introdução (Cabeçalho)
         layout_intro = GridLayout(cols=2, spacing=10, size_hint_y=None, height=200)
-        self.intro_inputs = [MDTextField(hint_text=campo) for campo in ["METCMQ", "Latitude/Longitude", "Data e Duração", "Altura e Pressão MDP"]]
+        self.intro_inputs = [
+            MDTextField(hint_text=campo, helper_text_mode="on_error")
+            for campo in ["METCMQ", "Latitude/Longitude", "Data e Duração", "Altura e Pressão MDP"]
+        ]
         for input_field in self.intro_inputs:
             layout_intro.add_widget(input_field)
 
@@ -77,20 +105,16 @@ class StanagApp(MDApp):
         layout_zonas = GridLayout(cols=1, padding=10, spacing=10, size_hint_y=None)
         layout_zonas.bind(minimum_height=layout_zonas.setter('height'))
 
-        # Campos de entrada das zonas sem labels na lateral
-        self.zona_inputs = []
-        for zona in range(32):
-            input_zona = MDTextField(
-                hint_text=f"Zona {zona}",  # Nome da zona dentro do campo
-                input_filter='int',       # Limita apenas a números inteiros
-                input_type="number",      # Exibe teclado numérico
-                multiline=False,
-                size_hint_x=1             # O campo ocupa a largura total
-            )
-            self.zona_inputs.append(input_zona)
-            layout_zonas.add_widget(input_zona)
-
         scrollview.add_widget(layout_zonas)
+        self.layout_zonas = layout_zonas
+
+        # Cada campo é validado enquanto é digitado (ver campo_alterado)
+        self.validador = None
+        self.campos = list(self.intro_inputs)
+        for indice, campo in enumerate(self.campos):
+            self._ligar_validacao(campo, indice)
+        self.zona_inputs = []
+        self._criar_zonas(ZONAS_NO_PRIMEIRO_QUADRO)
         layout_principal.add_widget(scrollview)
 
         # Botão para salvar
@@ -105,57 +129,104 @@ class StanagApp(MDApp):
 
         return layout_principal
 
+    def on_start(self):
+        # O banco é configurado em segundo plano depois do primeiro quadro
+        Clock.schedule_once(self.primeiro_quadro)
+
+    def primeiro_quadro(self, dt):
+        Logger.info(f"Inicializacao: primeiro quadro em {(time.perf_counter() - INICIO) * 1000:.0f} ms")
+        threading.Thread(target=configurar_banco, daemon=True).start()
+        Clock.schedule_interval(self._criar_zonas_no_quadro, 0)
+
+    def _criar_zonas_no_quadro(self, dt):
+        # Retornar False encerra o agendamento
+        return self._criar_zonas(ZONAS_POR_QUADRO)
+
+    # Função para criar os próximos campos de zona (retorna se ainda faltam campos)
+    def _criar_zonas(self, quantidade):
+        from kivymd.uix.textfield import MDTextField
+
+        # Campos de entrada das zonas sem labels na lateral
+        for zona in range(len(self.zona_inputs), min(NUMERO_ZONAS, len(self.zona_inputs) + quantidade)):
+            input_zona = MDTextField(
+                hint_text=f"Zona {zona}",  # Nome da zona dentro do campo
+                input_filter='int',       # Limita apenas a números inteiros
+                input_type="number",      # Exibe teclado numérico
+                multiline=False,
+                size_hint_x=1,            # O campo ocupa a largura total
+                helper_text_mode="on_error"
+            )
+            self._ligar_validacao(input_zona, len(self.campos))
+            self.zona_inputs.append(input_zona)
+            self.campos.append(input_zona)
+            self.layout_zonas.add_widget(input_zona)
+        return len(self.zona_inputs) < NUMERO_ZONAS
+
+    def _ligar_validacao(self, campo, indice):
+        campo.bind(text=lambda instancia, texto: self.campo_alterado(indice, texto))
+
+    def _validador(self):
+        from validacao import ValidadorIncremental
+
+        if self.validador is None:
+            self.validador = ValidadorIncremental()
+        return self.validador
+
+    # Função para revalidar um campo a cada alteração do texto
+    def campo_alterado(self, indice, texto):
+        # Só o campo alterado é revalidado; pela regra de pressão, uma zona
+        # pode mudar os erros das zonas vizinhas
+        validador = self._validador()
+        for alterado in validador.atualizar(indice, texto):
+            self._mostrar_erros(alterado)
+
+    def _mostrar_erros(self, indice):
+        from validacao import ERRO
+
+        campo = self.campos[indice]
+        # Campos vazios só são cobrados ao salvar
+        erros = self.validador.erros_do_campo(indice) if campo.text.strip() else []
+        campo.helper_text = "\n".join(erro.mensagem for erro in erros)
+        campo.error = any(erro.gravidade == ERRO for erro in erros)
+        # Avisos aparecem como texto de ajuda, sem marcar o campo como errado
+        campo.helper_text_mode = "on_error" if campo.error or not erros else "persistent"
+
     def salvar_dados(self, instance):
-        # 1. Coleta e valida os dados dos campos de introdução (campos principais)
-        valores_intro = []
-        for i, campo in enumerate(self.intro_inputs):
-            texto = campo.text.strip()
-            # Verifica se o campo está vazio ou se não tem exatamente 6 caracteres
-            if not texto or len(texto) != 6:
-                popup = Popup(
-                    title="Erro",
-                    content=Label(text=f"O campo '{campo.hint_text}' deve conter exatamente 6 caracteres."),
-                    size_hint=(0.8, 0.2)
-                )
-                popup.open()
-                return
-            valores_intro.append(texto)
-
-        # 2. Coleta e valida os dados dos campos de zona
-        valores_zona = []
-        for i, input_zona in enumerate(self.zona_inputs):
-            texto_zona = input_zona.text.strip()
-            # Se o campo não estiver vazio, valida que ele tem exatamente 16 caracteres numéricos
-            if texto_zona:
-                if len(texto_zona) != 16 or not texto_zona.isdigit():
-                    popup = Popup(
-                        title="Erro",
-                        content=Label(text=f"O campo Zona {i} deve conter exatamente 16 caracteres numéricos."),
-                        size_hint=(0.8, 0.2)
-                    )
-                    popup.open()
-                    return
-            valores_zona.append(texto_zona)
+        from kivy.uix.popup import Popup
+        from kivy.uix.label import Label
+        from validacao import ERRO
+
+        # 1. Valida o boletim inteiro; os campos já digitados não são revalidados
+        self._criar_zonas(NUMERO_ZONAS)
+        validador = self._validador()
+        for indice, campo in enumerate(self.campos):
+            validador.atualizar(indice, campo.text)
+        erros = [erro for erro in validador.erros() if erro.gravidade == ERRO]
+
+        # 2. Mostra todos os erros em uma única janela (os avisos não impedem o salvamento)
+        if erros:
+            for indice in {erro.campo for erro in erros}:
+                self.campos[indice].error = True
+            popup = Popup(
+                title=f"Erros no boletim ({len(erros)})",
+                content=Label(text="\n".join(erro.mensagem for erro in erros[:12]) +
+                              (f"\n... e mais {len(erros) - 12}" if len(erros) > 12 else "")),
+                size_hint=(0.9, 0.6)
+            )
+            popup.open()
+            return
 
         # 3. Prepara os dados para inserção no banco
-        valores = valores_intro + valores_zona
+        valores = [campo.text.strip() for campo in self.campos]
 
         # 4. Insere os dados no banco de dados
         try:
-            with sqlite3.connect("dados_meteorologicos.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO boletim (
-                        METCMQ, LaLaLaLoLoLo, YYGoGoGoG, hhhPdPdPd,
-                        zona0, zona1, zona2, zona3, zona4, zona5,
-                        zona6, zona7, zona8, zona9, zona10, zona11,
-                        zona12, zona13, zona14, zona15, zona16, zona17,
-                        zona18, zona19, zona20, zona21, zona22, zona23,
-                        zona24, zona25, zona26, zona27, zona28, zona29,
-                        zona30, zona31
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, valores)
-                conn.commit()
+            banco_pronto.wait()
+            if banco_dados is None:
+                raise sqlite3.Error("o banco de dados não pôde ser aberto")
+            banco_dados.inserir_boletins([valores])
+            if despachante is not None:
+                despachante.avisar()
 
             # Feedback para o usuário
             popup = Popup(
@@ -174,6 +245,14 @@ class StanagApp(MDApp):
             )
             popup.open()
 
-# Inicializa o banco de dados e roda o app
-configurar_banco()
-StanagApp().run()
\ No newline at end of file
+    def on_stop(self):
+        if despachante is not None:
+            despachante.parar()
+        if banco_dados is not None:
+            banco_dados.fechar()
+
+def main():
+    StanagApp().run()
+
+if __name__ == "__main__":
+    main()
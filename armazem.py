@@ -0,0 +1,236 @@
+"""
+Armazenamento em memória dos boletins recebidos.
+
+Os boletins ficam em ordem de recebimento, com um índice de tempo para
+consultas do tipo "qual era o boletim vigente no instante T". A retenção é
+limitada por quantidade e, opcionalmente, por idade, então um receptor que
+fica ligado por dias não cresce sem limite. Todas as operações são
+protegidas por um lock, pois a thread do receptor grava enquanto a
+interface consulta.
+
+Para retenções longas há o modo compacto: as strings dos campos são
+internadas (boletins seguidos de uma estação repetem quase tudo) e um
+boletim que deixa de ser o último da sua estação passa a guardar só as
+zonas que diferem do quadro-chave da estação, um boletim completo
+escolhido a cada QUADROS_ENTRE_CHAVES boletins ou quando mais de
+MAX_ZONAS_DELTA zonas mudam. Como todo delta aponta direto para o seu
+quadro-chave, remontar qualquer boletim antigo é uma cópia de tupla.
+"""
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+from itertools import compress
+from operator import is_not
+from sys import intern
+
+from stanag import CAMPOS_CABECALHO, NUMERO_ZONAS
+
+MAX_BOLETINS = 1000
+QUADROS_ENTRE_CHAVES = 32
+MAX_ZONAS_DELTA = 12
+
+
+class RegistroBoletim:
+    """
+    Um boletim recebido: cabeçalho e zonas como tuplas de strings. No modo
+    compacto do armazém, `_delta` traz as zonas que diferem do quadro-chave
+    `_base` ((zona, texto, zona, texto, ...)) e `_zonas` pode ser descartada.
+    """
+
+    __slots__ = ("id", "recebido_em", "cabecalho", "_zonas", "_base", "_delta")
+
+    def __init__(self, id, recebido_em, cabecalho, zonas):
+        self.id = id
+        self.recebido_em = recebido_em
+        self.cabecalho = cabecalho
+        self._zonas = zonas
+        self._base = None
+        self._delta = None
+
+    @property
+    def zonas(self):
+        zonas = self._zonas
+        if zonas is not None:
+            return zonas
+        # _base e _delta são definidos antes de _zonas ser descartada
+        zonas = list(self._base._zonas)
+        delta = self._delta
+        for i in range(0, len(delta), 2):
+            zonas[delta[i]] = delta[i + 1]
+        return tuple(zonas)
+
+    @property
+    def compacto(self):
+        return self._zonas is None
+
+    def _compactar(self):
+        if self._delta is not None:
+            self._zonas = None
+
+    @property
+    def posicao(self):
+        return self.cabecalho[1]
+
+    @property
+    def estacao(self):
+        # Octante + LaLaLaLoLoLo: os mesmos dígitos em octantes diferentes são outro lugar
+        return self.cabecalho[0][5:], self.cabecalho[1]
+
+    @property
+    def horario_salvo(self):
+        return datetime.fromtimestamp(self.recebido_em).strftime("%Y-%m-%d %H:%M:%S")
+
+    def __getitem__(self, campo):
+        # Permite ler o registro como o antigo dicionário do boletim
+        if campo.startswith("zona"):
+            return self.zonas[int(campo[4:])]
+        if campo == "horario_salvo":
+            return self.horario_salvo
+        return self.cabecalho[CAMPOS_CABECALHO.index(campo)]
+
+    def __repr__(self):
+        return f"RegistroBoletim(id={self.id}, recebido_em={self.horario_salvo!r}, cabecalho={self.cabecalho})"
+
+
+# Função para listar as zonas que diferem de um quadro-chave
+def _diferencas(zonas, base):
+    # As strings são internadas, então zonas iguais são o mesmo objeto
+    delta = []
+    for i in compress(range(NUMERO_ZONAS), map(is_not, zonas, base)):
+        delta += (i, zonas[i])
+    return tuple(delta)
+
+
+class ArmazemBoletins:
+    """
+    Guarda no máximo `max_boletins` boletins e, se `idade_maxima` (em
+    segundos) for informada, descarta os recebidos há mais tempo que isso.
+    Com compacto=True, os boletins antigos de cada estação são guardados
+    como delta do quadro-chave (ver o início do módulo).
+    """
+
+    def __init__(self, max_boletins=MAX_BOLETINS, idade_maxima=None, relogio=time.time, compacto=False):
+        self.max_boletins = max_boletins
+        self.idade_maxima = idade_maxima
+        self.relogio = relogio
+        self.compacto = compacto
+        self._lock = threading.RLock()
+        # Lista ordenada por tempo; os itens antes de _inicio já expiraram
+        self._registros = []
+        self._tempos = []
+        self._inicio = 0
+        self._por_posicao = {}
+        self._quadros_chave = {}    # estação -> [quadro-chave, deltas apontando para ele]
+        self._ultimos = {}          # estação -> boletim mais recente (nunca compactado)
+        self._proximo_id = 1
+        self._assinantes = []
+
+    def assinar(self, assinante):
+        """Registra uma função chamada com cada novo registro, fora do lock."""
+        self._assinantes.append(assinante)
+
+    def adicionar(self, campos, recebido_em=None):
+        """Guarda os 36 campos de um boletim e retorna o registro criado."""
+        campos = list(campos) + [""] * (4 + NUMERO_ZONAS - len(campos))
+        if self.compacto:
+            campos = list(map(intern, campos[:4 + NUMERO_ZONAS]))
+        with self._lock:
+            registro = RegistroBoletim(
+                self._proximo_id,
+                self.relogio() if recebido_em is None else recebido_em,
+                tuple(campos[:4]),
+                tuple(campos[4:4 + NUMERO_ZONAS]),
+            )
+            self._proximo_id += 1
+            if self.compacto:
+                self._delta_ou_quadro_chave(registro)
+            if not self._tempos or registro.recebido_em >= self._tempos[-1]:
+                self._registros.append(registro)
+                self._tempos.append(registro.recebido_em)
+            else:
+                # Boletim fora de ordem (por exemplo, importado de um arquivo)
+                posicao = bisect_right(self._tempos, registro.recebido_em, self._inicio)
+                self._registros.insert(posicao, registro)
+                self._tempos.insert(posicao, registro.recebido_em)
+
+            atual = self._por_posicao.get(registro.posicao)
+            if atual is None or atual.recebido_em <= registro.recebido_em:
+                self._por_posicao[registro.posicao] = registro
+            self._expirar()
+        for assinante in self._assinantes:
+            assinante(registro)
+        return registro
+
+    def _delta_ou_quadro_chave(self, registro):
+        estacao = registro.estacao
+        quadro = self._quadros_chave.get(estacao)
+        delta = None
+        if quadro is not None and quadro[1] < QUADROS_ENTRE_CHAVES:
+            delta = _diferencas(registro._zonas, quadro[0]._zonas)
+        if delta is not None and len(delta) <= 2 * MAX_ZONAS_DELTA:
+            registro._base, registro._delta = quadro[0], delta
+            quadro[1] += 1
+        else:
+            self._quadros_chave[estacao] = [registro, 0]
+
+        # Só o último boletim da estação fica com as zonas completas
+        ultimo = self._ultimos.get(estacao)
+        if ultimo is None or ultimo.recebido_em <= registro.recebido_em:
+            self._ultimos[estacao] = registro
+            if ultimo is not None:
+                ultimo._compactar()
+        else:
+            registro._compactar()
+
+    def _expirar(self):
+        limite_idade = None if self.idade_maxima is None else self.relogio() - self.idade_maxima
+        while len(self) > self.max_boletins or (
+                len(self) and limite_idade is not None and self._tempos[self._inicio] < limite_idade):
+            registro = self._registros[self._inicio]
+            self._registros[self._inicio] = None
+            self._inicio += 1
+            if self._por_posicao.get(registro.posicao) is registro:
+                del self._por_posicao[registro.posicao]
+            if self.compacto:
+                # Os deltas que ainda apontam para o quadro-chave o mantêm vivo
+                estacao = registro.estacao
+                if self._quadros_chave.get(estacao, (None,))[0] is registro:
+                    del self._quadros_chave[estacao]
+                if self._ultimos.get(estacao) is registro:
+                    del self._ultimos[estacao]
+        # Compacta as listas quando metade delas já expirou
+        if self._inicio > len(self._registros) // 2:
+            del self._registros[:self._inicio]
+            del self._tempos[:self._inicio]
+            self._inicio = 0
+
+    def __len__(self):
+        return len(self._registros) - self._inicio
+
+    def ultimo(self):
+        """Retorna o boletim mais recente, ou None."""
+        with self._lock:
+            if self.idade_maxima is not None:
+                self._expirar()
+            return self._registros[-1] if len(self) else None
+
+    def em(self, instante):
+        """Retorna o boletim mais recente recebido até `instante`, ou None."""
+        with self._lock:
+            posicao = bisect_right(self._tempos, instante, self._inicio)
+            return self._registros[posicao - 1] if posicao > self._inicio else None
+
+    def ultimo_da_posicao(self, posicao):
+        """Retorna o boletim mais recente do grupo LaLaLaLoLoLo informado."""
+        with self._lock:
+            return self._por_posicao.get(posicao)
+
+    def ultimos_por_posicao(self):
+        """Retorna um dicionário posição -> boletim mais recente."""
+        with self._lock:
+            return dict(self._por_posicao)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(self._registros[self._inicio:])
@@ -0,0 +1,301 @@
+"""
+Importação e exportação em massa de boletins, sem passar pela interface.
+
+Importação: lê arquivos de texto METCM (ou .gz) linha a linha e monta os
+boletins em um pipeline de geradores, sem carregar o arquivo na memória.
+Cada boletim começa no grupo METCMQ e segue com os outros 3 grupos do
+cabeçalho e até 32 zonas, separados por espaços, em uma ou várias linhas.
+Os boletins são validados com as mesmas regras do formulário do app de
+entrada (validacao.py; os avisos não impedem a gravação) e gravados no banco em transações grandes; os rejeitados são
+informados com arquivo, linha e motivo.
+
+Exportação: percorre a tabela `boletim` em blocos pela chave primária e
+grava CSV (opcionalmente .gz), Parquet, Arrow ou o acervo binário de
+acervo.py (.acervo, com o salvo_em como horário de recebimento), com
+memória constante. Parquet e Arrow precisam do pacote pyarrow.
+
+    python arquivos.py importar arquivo1.txt arquivo2.txt.gz --banco dados.db
+    python arquivos.py exportar boletins.csv.gz
+    python arquivos.py exportar boletins.parquet --bloco 50000
+    python arquivos.py exportar boletins.acervo
+"""
+import argparse
+import csv
+import gzip
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+from banco import CAMINHO_BANCO, FORMATO_ZONA, BancoDados
+from stanag import CAMPOS_BOLETIM, CAMPOS_CABECALHO, CAMPOS_ZONAS, NUMERO_ZONAS
+from validacao import ERRO, validar_lote
+
+TAMANHO_LOTE_IMPORTACAO = 20000
+TAMANHO_BLOCO_EXPORTACAO = 10000
+
+# Colunas exportadas: a tabela `boletim` e as zonas como foram transmitidas
+COLUNAS_CABECALHO = ["id"] + CAMPOS_CABECALHO + [
+    "latitude", "longitude", "dia", "hora", "duracao", "altitude", "pressao_mdp", "salvo_em",
+]
+COLUNAS_EXPORTACAO = COLUNAS_CABECALHO + CAMPOS_ZONAS
+
+SQL_ZONAS_CONCATENADAS = f"""
+    SELECT boletim_id, group_concat(printf('%02d{FORMATO_ZONA}', zona, numero, direcao_vento / 10,
+                                           velocidade_vento, temperatura, pressao), '')
+    FROM zona_completa WHERE boletim_id BETWEEN ? AND ? GROUP BY boletim_id
+"""
+
+
+class Relatorio:
+    """Contadores de uma importação ou exportação."""
+
+    __slots__ = ("lidos", "gravados", "rejeitados", "inicio", "duracao")
+
+    def __init__(self):
+        self.lidos = 0
+        self.gravados = 0
+        self.rejeitados = 0
+        self.inicio = time.perf_counter()
+        self.duracao = 0.0
+
+    def terminar(self):
+        self.duracao = time.perf_counter() - self.inicio
+        return self
+
+    @property
+    def por_segundo(self):
+        return self.gravados / self.duracao if self.duracao else 0.0
+
+    def __repr__(self):
+        return (f"lidos={self.lidos} gravados={self.gravados} rejeitados={self.rejeitados} "
+                f"em {self.duracao:.2f} s ({self.por_segundo:,.0f} registros/s)")
+
+
+# Função para ler as linhas de vários arquivos, texto puro ou gzip
+def ler_linhas(caminhos):
+    """Gera (arquivo, número da linha, linha) sem ler os arquivos inteiros."""
+    for caminho in caminhos:
+        with open(caminho, "rb") as bruto:
+            gzipado = bruto.peek(2)[:2] == b"\x1f\x8b"
+        abrir = gzip.open if gzipado else open
+        with abrir(caminho, "rt", encoding="ascii", errors="replace") as arquivo:
+            for numero, linha in enumerate(arquivo, 1):
+                yield caminho, numero, linha
+
+
+# Função para agrupar os grupos das linhas em boletins
+def separar_boletins(linhas):
+    """
+    Gera (arquivo, linha inicial, grupos) para cada boletim. Um boletim vai
+    de um grupo METCMQ até o próximo; linhas vazias e comentários (#) são
+    ignorados, e grupos antes do primeiro METCMQ saem como um boletim
+    sem cabeçalho, para serem rejeitados.
+    """
+    origem, grupos = None, []
+    for caminho, numero, linha in linhas:
+        linha = linha.split("#", 1)[0]
+        for grupo in linha.split():
+            if grupo.startswith("METCM") or origem is None or origem[0] != caminho:
+                if grupos:
+                    yield (*origem, grupos)
+                origem, grupos = (caminho, numero), []
+            grupos.append(grupo)
+    if grupos:
+        yield (*origem, grupos)
+
+
+def _validos(boletins, relatorio, rejeitados, tamanho_lote):
+    # Os boletins são validados em lotes, com as zonas conferidas pelo NumPy
+    for lote in _em_lotes(boletins, tamanho_lote):
+        for (caminho, numero, grupos), erros in zip(lote, validar_lote([grupos for _, _, grupos in lote])):
+            relatorio.lidos += 1
+            motivos = [erro.mensagem for erro in erros if erro.gravidade == ERRO]
+            if not motivos:
+                yield grupos + [""] * (len(CAMPOS_BOLETIM) - len(grupos))
+                continue
+            relatorio.rejeitados += 1
+            if rejeitados is not None:
+                print(f"{caminho}:{numero}: {' '.join(motivos)}", file=rejeitados)
+
+
+def _em_lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while lote := list(islice(iterador, tamanho)):
+        yield lote
+
+
+# Função para importar arquivos de boletins para o banco
+def importar(caminhos, bd, tamanho_lote=TAMANHO_LOTE_IMPORTACAO, salvo_em=None, rejeitados=sys.stderr):
+    """
+    Importa os boletins dos arquivos para o banco (BancoDados), uma
+    transação por lote. `salvo_em` (segundos desde 1970) é gravado em todos
+    os boletins; em arquivos antigos ele deve ficar no mês em que foram
+    emitidos, pois é a referência para resolver o dia do YYGoGoGoG. Os
+    rejeitados são escritos em `rejeitados` (None para não escrever).
+    Retorna o Relatorio.
+    """
+    relatorio = Relatorio()
+    boletins = _validos(separar_boletins(ler_linhas(caminhos)), relatorio, rejeitados, tamanho_lote)
+    for lote in _em_lotes(boletins, tamanho_lote):
+        bd.inserir_boletins(lote, salvo_em)
+        relatorio.gravados += len(lote)
+    return relatorio.terminar()
+
+
+# Função para ler a tabela de boletins em blocos
+def ler_blocos(bd, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Gera blocos de até `tamanho_bloco` linhas (listas na ordem de
+    COLUNAS_EXPORTACAO). A paginação é pela chave primária, então cada
+    bloco é uma busca no índice, não importa o tamanho da tabela.
+    """
+    ultimo_id = 0
+    while True:
+        linhas = bd.consultar(
+            f"SELECT {', '.join(COLUNAS_CABECALHO)} FROM boletim WHERE id > ? ORDER BY id LIMIT ?",
+            (ultimo_id, tamanho_bloco),
+        )
+        if not linhas:
+            return
+        primeiro_id, ultimo_id = linhas[0][0], linhas[-1][0]
+        bloco = {linha[0]: list(linha) + [""] * NUMERO_ZONAS for linha in linhas}
+        # As zonas de cada boletim vêm concatenadas em uma só string (posição
+        # da zona + texto da zona), o que poupa uma linha de resultado por zona
+        for boletim_id, zonas in bd.consultar(SQL_ZONAS_CONCATENADAS, (primeiro_id, ultimo_id)):
+            linha = bloco[boletim_id]
+            for i in range(0, len(zonas), 18):
+                linha[len(COLUNAS_CABECALHO) + int(zonas[i:i + 2])] = zonas[i + 2:i + 18]
+        yield list(bloco.values())
+
+
+def _escrever_csv(blocos, destino):
+    if destino.endswith(".gz"):
+        # Nível 6, o mesmo do gzip da linha de comando: o 9 (padrão do módulo)
+        # custa o dobro do tempo para quase nada a menos de tamanho
+        arquivo = gzip.open(destino, "wt", compresslevel=6, newline="", encoding="ascii")
+    else:
+        arquivo = open(destino, "w", newline="", encoding="ascii")
+    with arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(COLUNAS_EXPORTACAO)
+        for bloco in blocos:
+            escritor.writerows(bloco)
+            yield len(bloco)
+
+
+def _escrever_arrow(blocos, destino, formato):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError(f"a exportação em {formato} precisa do pacote pyarrow") from None
+
+    inteiro, texto = pa.int64(), pa.string()
+    esquema = pa.schema(
+        [(coluna, inteiro) for coluna in COLUNAS_CABECALHO[:1]]
+        + [(coluna, texto) for coluna in CAMPOS_CABECALHO]
+        + [(coluna, inteiro) for coluna in COLUNAS_CABECALHO[1 + len(CAMPOS_CABECALHO):]]
+        + [(coluna, texto) for coluna in CAMPOS_ZONAS]
+    )
+    if formato == "parquet":
+        escritor = pq.ParquetWriter(destino, esquema)
+    else:
+        escritor = pa.ipc.new_file(destino, esquema)
+    with escritor:
+        for bloco in blocos:
+            colunas = list(zip(*bloco))
+            escritor.write_table(pa.table(
+                [pa.array(coluna, type=campo.type) for coluna, campo in zip(colunas, esquema)],
+                schema=esquema,
+            ))
+            yield len(bloco)
+
+
+def _escrever_acervo(blocos, destino):
+    from acervo import Acervo
+
+    inicio_zonas = len(COLUNAS_CABECALHO)
+    salvo_em = COLUNAS_CABECALHO.index("salvo_em")
+    with Acervo(destino, "w") as acervo:
+        for bloco in blocos:
+            acervo.acrescentar([linha[1:1 + len(CAMPOS_CABECALHO)] + linha[inicio_zonas:] for linha in bloco],
+                               [linha[salvo_em] for linha in bloco])
+            yield len(bloco)
+
+
+# Função para exportar a tabela de boletins
+def exportar(bd, destino, formato=None, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Exporta todos os boletins do banco para `destino`. O formato ("csv",
+    "parquet", "arrow" ou "acervo") vem da extensão se não for informado.
+    Retorna o Relatorio.
+    """
+    formato = formato or _formato_do_arquivo(destino)
+    relatorio = Relatorio()
+    blocos = ler_blocos(bd, tamanho_bloco)
+    if formato == "csv":
+        escritos = _escrever_csv(blocos, destino)
+    elif formato == "acervo":
+        escritos = _escrever_acervo(blocos, destino)
+    else:
+        escritos = _escrever_arrow(blocos, destino, formato)
+    for quantidade in escritos:
+        relatorio.lidos += quantidade
+        relatorio.gravados += quantidade
+    return relatorio.terminar()
+
+
+def _formato_do_arquivo(destino):
+    nome = destino.lower().removesuffix(".gz")
+    if nome.endswith(".parquet"):
+        return "parquet"
+    if nome.endswith((".arrow", ".feather")):
+        return "arrow"
+    if nome.endswith(".acervo"):
+        return "acervo"
+    return "csv"
+
+
+def _data_utc(texto):
+    return datetime.strptime(texto, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa e exporta boletins STANAG 4082 em massa.")
+    parser.add_argument("--banco", default=CAMINHO_BANCO)
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    importacao = comandos.add_parser("importar", help="importa arquivos de texto METCM (ou .gz)")
+    importacao.add_argument("arquivos", nargs="+")
+    importacao.add_argument("--lote", type=int, default=TAMANHO_LOTE_IMPORTACAO,
+                            help="boletins por transação")
+    importacao.add_argument("--salvo-em", type=_data_utc, default=None, metavar="AAAA-MM-DD",
+                            help="data gravada nos boletins (referência do mês do YYGoGoGoG)")
+    importacao.add_argument("--silencioso", action="store_true", help="não lista os boletins rejeitados")
+
+    exportacao = comandos.add_parser("exportar", help="exporta a tabela de boletins")
+    exportacao.add_argument("destino")
+    exportacao.add_argument("--formato", choices=["csv", "parquet", "arrow", "acervo"])
+    exportacao.add_argument("--bloco", type=int, default=TAMANHO_BLOCO_EXPORTACAO,
+                            help="boletins lidos do banco por vez")
+    args = parser.parse_args(argv)
+
+    with BancoDados(args.banco) as bd:
+        bd.configurar()
+        try:
+            if args.comando == "importar":
+                salvo_em = None if args.salvo_em is None else int(args.salvo_em)
+                relatorio = importar(args.arquivos, bd, args.lote, salvo_em,
+                                     None if args.silencioso else sys.stderr)
+            else:
+                relatorio = exportar(bd, args.destino, args.formato, args.bloco)
+        except (OSError, RuntimeError) as e:
+            print(f"Erro: {e}", file=sys.stderr)
+            return 1
+    print(relatorio)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
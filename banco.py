@@ -0,0 +1,416 @@
+"""
+Banco de dados SQLite dos boletins STANAG 4082.
+
+Esquema (versão guardada em PRAGMA user_version):
+    1 - tabela única `boletim` com 36 colunas TEXT (zona0..zona31)
+    2 - cabeçalho em `boletim` e uma linha por zona em `boletim_zona`,
+        com colunas inteiras e índices por tempo, posição e zona
+    3 - tabela `envio` com o estado de entrega de cada destino (despacho.py)
+    4 - colunas `base_id` e `removidas` em `boletim` e a visão `zona_completa`,
+        para o modo delta (abaixo)
+
+No modo delta (BancoDados(delta=True)), um boletim de uma estação que já
+tem quadro-chave gravado guarda em `boletim_zona` só as zonas que mudaram;
+`base_id` aponta para o quadro-chave e `removidas` marca as zonas dele que
+não vieram no boletim. A visão `zona_completa` remonta as zonas de todos os
+boletins, delta ou não; quem lê zonas deve usá-la em vez de `boletim_zona`.
+
+O caminho padrão do banco pode ser trocado pela variável de ambiente
+STANAG_BANCO. Uso pela linha de comando, para migrar um banco antigo de uma vez:
+    python banco.py dados_meteorologicos.db
+"""
+import argparse
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+import metricas
+from armazem import MAX_ZONAS_DELTA, QUADROS_ENTRE_CHAVES
+from decodificador import decodificar_zonas, empacotar_zonas
+from stanag import (CAMPOS_CABECALHO, CAMPOS_ZONAS, NUMERO_ZONAS,
+                    decodificar_mdp, decodificar_posicao, decodificar_validade)
+
+CAMINHO_BANCO = os.environ.get("STANAG_BANCO", "dados_meteorologicos.db")
+VERSAO_ESQUEMA = 4
+
+ESQUEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS boletim (
+        id INTEGER PRIMARY KEY,
+        METCMQ TEXT NOT NULL, LaLaLaLoLoLo TEXT NOT NULL,
+        YYGoGoGoG TEXT NOT NULL, hhhPdPdPd TEXT NOT NULL,
+        latitude INTEGER, longitude INTEGER,     -- décimos de grau, com sinal
+        dia INTEGER, hora INTEGER, duracao INTEGER,  -- hora em décimos de hora
+        altitude INTEGER, pressao_mdp INTEGER,   -- m, mb
+        salvo_em INTEGER NOT NULL,               -- segundos desde 1970 (UTC)
+        base_id INTEGER REFERENCES boletim(id),  -- quadro-chave deste delta (NULL: completo)
+        removidas INTEGER NOT NULL DEFAULT 0     -- zonas do quadro-chave ausentes (bit i = zona i)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS boletim_zona (
+        boletim_id INTEGER NOT NULL REFERENCES boletim(id) ON DELETE CASCADE,
+        zona INTEGER NOT NULL,              -- posição da zona no boletim
+        numero INTEGER NOT NULL,            -- ZZ, como foi transmitido
+        direcao_vento INTEGER NOT NULL,     -- mils
+        velocidade_vento INTEGER NOT NULL,  -- nós
+        temperatura INTEGER NOT NULL,       -- décimos de Kelvin
+        pressao INTEGER NOT NULL,           -- mb
+        PRIMARY KEY (boletim_id, zona)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS envio (
+        destino TEXT PRIMARY KEY,                -- host:porta
+        confirmado_ate INTEGER NOT NULL,         -- maior id de boletim entregue (e todos os menores)
+        atualizado_em INTEGER NOT NULL           -- segundos desde 1970 (UTC)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_boletim_salvo_em ON boletim (salvo_em)",
+    "CREATE INDEX IF NOT EXISTS idx_boletim_validade ON boletim (dia, hora)",
+    "CREATE INDEX IF NOT EXISTS idx_boletim_posicao ON boletim (latitude, longitude)",
+    "CREATE INDEX IF NOT EXISTS idx_zona ON boletim_zona (zona, boletim_id)",
+    # As zonas gravadas de cada boletim mais as que um delta herda do seu quadro-chave
+    """
+    CREATE VIEW IF NOT EXISTS zona_completa AS
+    SELECT boletim_id, zona, numero, direcao_vento, velocidade_vento, temperatura, pressao
+    FROM boletim_zona
+    UNION ALL
+    SELECT b.id, z.zona, z.numero, z.direcao_vento, z.velocidade_vento, z.temperatura, z.pressao
+    FROM boletim b JOIN boletim_zona z ON z.boletim_id = b.base_id
+    WHERE (b.removidas >> z.zona) & 1 = 0
+      AND NOT EXISTS (SELECT 1 FROM boletim_zona p WHERE p.boletim_id = b.id AND p.zona = z.zona)
+    """,
+]
+
+# Colunas acrescentadas a um banco que já tinha a tabela `boletim` (esquemas 2 e 3)
+COLUNAS_DELTA = [
+    "ALTER TABLE boletim ADD COLUMN base_id INTEGER REFERENCES boletim(id)",
+    "ALTER TABLE boletim ADD COLUMN removidas INTEGER NOT NULL DEFAULT 0",
+]
+
+SQL_INSERIR_CABECALHO = """
+    INSERT INTO boletim (
+        id, METCMQ, LaLaLaLoLoLo, YYGoGoGoG, hhhPdPdPd,
+        latitude, longitude, dia, hora, duracao, altitude, pressao_mdp, salvo_em, base_id, removidas
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_INSERIR_ZONA = """
+    INSERT INTO boletim_zona (
+        boletim_id, zona, numero, direcao_vento, velocidade_vento, temperatura, pressao
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Texto de uma zona (ZZdddFFFTTTTPPPP) a partir das colunas de boletim_zona
+FORMATO_ZONA = "%02d%03d%03d%04d%04d"
+
+
+# Pragmas padrão das conexões; cache_size negativo é em KiB
+PRAGMAS_PADRAO = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -8000,
+}
+
+
+# Função para abrir uma conexão com o banco
+def conectar(caminho=CAMINHO_BANCO, check_same_thread=True, **pragmas):
+    """
+    Abre o banco em modo autocommit (as transações são explícitas).
+    Os pragmas recebidos substituem os de PRAGMAS_PADRAO.
+    """
+    conn = sqlite3.connect(caminho, isolation_level=None,
+                           check_same_thread=check_same_thread, cached_statements=64)
+    for nome, valor in {**PRAGMAS_PADRAO, **pragmas}.items():
+        conn.execute(f"PRAGMA {nome}={valor}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+# Função para criar ou atualizar o esquema do banco
+def configurar_banco(conn):
+    """
+    Cria as tabelas e, se o banco ainda estiver no esquema 1, migra os
+    boletins existentes. Tudo acontece em uma única transação.
+    """
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    if versao == VERSAO_ESQUEMA:
+        return 0
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        antigos = []
+        if versao < 2 and _tem_tabela_v1(conn):
+            antigos = conn.execute(
+                f"SELECT {', '.join(CAMPOS_CABECALHO + CAMPOS_ZONAS)} FROM boletim ORDER BY id"
+            ).fetchall()
+            conn.execute("DROP TABLE boletim")
+        elif 2 <= versao < 4:
+            for comando in COLUNAS_DELTA:
+                conn.execute(comando)
+        for comando in ESQUEMA:
+            conn.execute(comando)
+        if antigos:
+            _inserir(conn, antigos, int(time.time()))
+        conn.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(antigos)
+
+
+def _tem_tabela_v1(conn):
+    colunas = [linha[1] for linha in conn.execute("PRAGMA table_info(boletim)")]
+    return "zona0" in colunas
+
+
+# Função para inserir vários boletins de uma vez
+def inserir_boletins(conn, boletins, salvo_em=None, quadros_chave=None):
+    """
+    Insere uma sequência de boletins (cada um com os 36 campos na ordem de
+    CAMPOS_BOLETIM) em uma única transação. Retorna os ids criados.
+
+    Com `quadros_chave` (um dicionário estação -> [id, zonas, deltas],
+    mantido por quem chama), os boletins são gravados no modo delta; o
+    dicionário só é atualizado depois do COMMIT.
+    """
+    boletins = list(boletins)
+    if not boletins:
+        return []
+    novos = None if quadros_chave is None else {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = _inserir(conn, boletins, int(time.time()) if salvo_em is None else salvo_em,
+                       quadros_chave, novos)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    if novos:
+        quadros_chave.update(novos)
+    return ids
+
+
+def _inserir(conn, boletins, salvo_em, quadros_chave=None, novos=None):
+    # Os ids são atribuídos aqui para que os cabeçalhos e as zonas possam ser
+    # inseridos com executemany (a transação já está aberta com IMMEDIATE)
+    primeiro_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM boletim").fetchone()[0]
+    ids = list(range(primeiro_id, primeiro_id + len(boletins)))
+
+    # Todas as zonas de todos os boletins são decodificadas em um só lote;
+    # zonas vazias ou inválidas não são gravadas
+    registros, validos = decodificar_zonas(
+        empacotar_zonas(zona for boletim in boletins for zona in boletim[4:4 + NUMERO_ZONAS])
+    )
+    if quadros_chave is None:
+        bases, removidas, gravar = [None] * len(ids), [0] * len(ids), validos
+    else:
+        bases, removidas, gravar = _deltas(ids, boletins, validos, quadros_chave, novos)
+
+    cabecalhos = []
+    for boletim_id, boletim, base_id, mascara in zip(ids, boletins, bases, removidas):
+        metcmq, lalalalololo, yygogogog, hhhpdpdpd = (campo or "" for campo in boletim[:4])
+        cabecalhos.append((
+            boletim_id, metcmq, lalalalololo, yygogogog, hhhpdpdpd,
+            *decodificar_posicao(metcmq, lalalalololo),
+            *decodificar_validade(yygogogog),
+            *decodificar_mdp(hhhpdpdpd),
+            salvo_em, base_id, mascara,
+        ))
+    conn.executemany(SQL_INSERIR_CABECALHO, cabecalhos)
+
+    linhas, zonas = gravar.nonzero()
+    validas = registros[linhas, zonas]
+    conn.executemany(SQL_INSERIR_ZONA, zip(
+        np.asarray(ids)[linhas].tolist(), zonas.tolist(), validas["zona"].tolist(),
+        validas["direcao_vento"].tolist(), validas["velocidade_vento"].tolist(),
+        np.rint(validas["temperatura"] * 10).astype(int).tolist(), validas["pressao"].tolist(),
+    ))
+    return ids
+
+
+# Função para escolher, boletim a boletim, entre quadro-chave e delta
+def _deltas(ids, boletins, validos, quadros_chave, novos):
+    """
+    Retorna (base_id, removidas, máscara das zonas a gravar) de cada
+    boletim. Os quadros-chave novos e as contagens de deltas vão para
+    `novos`; os boletins do mesmo lote já podem apontar para eles.
+    """
+    bases, removidas = [None] * len(ids), [0] * len(ids)
+    gravar = validos.copy()
+    for j, (boletim_id, boletim, presentes) in enumerate(zip(ids, boletins, validos.tolist())):
+        zonas = tuple(zona if presente else "" for zona, presente in zip(boletim[4:4 + NUMERO_ZONAS], presentes))
+        estacao = ((boletim[0] or "")[5:], boletim[1] or "")
+        quadro = novos.get(estacao) or quadros_chave.get(estacao)
+        if quadro is not None and quadro[2] < QUADROS_ENTRE_CHAVES:
+            base_id, base, deltas = quadro
+            alteradas = [i for i in range(NUMERO_ZONAS) if zonas[i] != base[i]]
+            if len(alteradas) <= MAX_ZONAS_DELTA:
+                bases[j] = base_id
+                removidas[j] = sum(1 << i for i in alteradas if not zonas[i])
+                gravar[j] = False
+                gravar[j, alteradas] = validos[j, alteradas]
+                novos[estacao] = [base_id, base, deltas + 1]
+                continue
+        novos[estacao] = [boletim_id, zonas, 0]
+    return bases, removidas, gravar
+
+
+# Função para reconstruir os boletins gravados
+def carregar_boletins(conn, ids):
+    """
+    Retorna {id: lista com os 36 campos} dos boletins pedidos; zonas que não
+    foram gravadas (vazias ou inválidas) voltam como "". Ids inexistentes
+    ficam de fora do resultado.
+    """
+    ids = list(ids)
+    if not ids:
+        return {}
+    marcadores = ", ".join("?" * len(ids))
+    boletins = {
+        linha[0]: list(linha[1:]) + [""] * NUMERO_ZONAS
+        for linha in conn.execute(
+            f"SELECT id, {', '.join(CAMPOS_CABECALHO)} FROM boletim WHERE id IN ({marcadores})", ids
+        )
+    }
+    for boletim_id, zona, *valores in conn.execute(
+        "SELECT boletim_id, zona, numero, direcao_vento / 10, velocidade_vento, temperatura, pressao"
+        f" FROM zona_completa WHERE boletim_id IN ({marcadores})", ids
+    ):
+        boletins[boletim_id][4 + zona] = FORMATO_ZONA % tuple(valores)
+    return boletins
+
+
+tempo_gravacao = metricas.histograma(
+    "stanag_banco_gravacao_segundos", "Tempo de uma transação de gravação de boletins",
+    metricas.LIMITES_SEGUNDOS[6:] + (5.0, 10.0))
+boletins_gravados = metricas.contador("stanag_banco_boletins_gravados_total", "Boletins gravados no banco")
+erros_gravacao = metricas.contador("stanag_banco_erros_total", "Transações de gravação que falharam")
+
+
+class BancoDados:
+    """
+    Conexão de longa duração com o banco, compartilhada entre threads.
+
+    Todos os acessos passam por um lock, então a mesma instância pode ser
+    usada pela interface e por uma thread de gravação. Como os comandos SQL
+    são sempre as mesmas strings, o cache de statements do sqlite3 reaproveita
+    os comandos já preparados. Com delta=True, os boletins são gravados no
+    modo delta; os quadros-chave ficam em memória, então o primeiro boletim
+    de cada estação depois de abrir o banco é sempre completo.
+    """
+
+    def __init__(self, caminho=CAMINHO_BANCO, delta=False, **pragmas):
+        self.caminho = caminho
+        self._conn = conectar(caminho, check_same_thread=False, **pragmas)
+        self._quadros_chave = {} if delta else None
+        self._lock = threading.Lock()
+        self._fila = queue.Queue()
+        self._escritor = None
+        metricas.coletar("stanag_banco_fila_gravacao", "Lotes esperando a thread de gravação", self._fila.qsize)
+
+    def configurar(self):
+        with self._lock:
+            return configurar_banco(self._conn)
+
+    def inserir_boletins(self, boletins, salvo_em=None):
+        boletins = list(boletins)
+        inicio = time.perf_counter()
+        try:
+            with self._lock:
+                ids = inserir_boletins(self._conn, boletins, salvo_em, self._quadros_chave)
+        except Exception:
+            erros_gravacao.incrementar()
+            raise
+        tempo_gravacao.observar(time.perf_counter() - inicio)
+        boletins_gravados.incrementar(len(ids))
+        return ids
+
+    def carregar_boletins(self, ids):
+        with self._lock:
+            return carregar_boletins(self._conn, ids)
+
+    def consultar(self, sql, parametros=()):
+        with self._lock:
+            return self._conn.execute(sql, parametros).fetchall()
+
+    def gravar_em_segundo_plano(self, boletins, ao_terminar=None):
+        """
+        Enfileira boletins para a thread de gravação. Tudo o que estiver na
+        fila quando ela acordar é gravado em uma única transação; depois
+        ao_terminar(ids, erro) é chamado na thread de gravação. Um erro na
+        gravação (de qualquer tipo) vai para ao_terminar; um erro dentro de
+        ao_terminar é só escrito no stderr. Nenhum dos dois para a thread.
+        """
+        if self._escritor is None:
+            self._escritor = threading.Thread(target=self._escrever, daemon=True)
+            self._escritor.start()
+        self._fila.put((list(boletins), ao_terminar))
+
+    def _escrever(self):
+        while True:
+            pedidos = [self._fila.get()]
+            while True:
+                try:
+                    pedidos.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            fechar = None in pedidos
+            pedidos = [pedido for pedido in pedidos if pedido is not None]
+
+            boletins = [boletim for lote, _ in pedidos for boletim in lote]
+            try:
+                ids, erro = self.inserir_boletins(boletins), None
+            except Exception as e:
+                ids, erro = [], e
+                if not any(ao_terminar for _, ao_terminar in pedidos):
+                    print(f"Erro ao gravar {len(boletins)} boletins em segundo plano: {e!r}", file=sys.stderr)
+            inicio = 0
+            for lote, ao_terminar in pedidos:
+                if ao_terminar is not None:
+                    try:
+                        ao_terminar(ids[inicio:inicio + len(lote)] if not erro else None, erro)
+                    except Exception as e:
+                        print(f"Erro em ao_terminar da gravação em segundo plano: {e!r}", file=sys.stderr)
+                inicio += len(lote)
+            if fechar:
+                return
+
+    def fechar(self):
+        if self._escritor is not None:
+            self._fila.put(None)
+            self._escritor.join()
+            self._escritor = None
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+# Função para migrar um arquivo de banco antigo
+def migrar(caminho=CAMINHO_BANCO):
+    """
+    Abre o banco, migra para o esquema atual e retorna o número de boletins
+    antigos convertidos.
+    """
+    with BancoDados(caminho) as bd:
+        return bd.configurar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra um banco de boletins para o esquema atual.")
+    parser.add_argument("caminho", nargs="?", default=CAMINHO_BANCO)
+    args = parser.parse_args()
+    convertidos = migrar(args.caminho)
+    print(f"{args.caminho}: esquema versão {VERSAO_ESQUEMA}, {convertidos} boletins convertidos.")
@@ -0,0 +1,217 @@
+"""
+Benchmarks dos caminhos críticos: recepção (processar_boletim e o protocolo),
+decodificação das zonas, busca por altura, gravação no banco e leitura do
+acervo binário.
+
+Os boletins vêm do gerador sintético com semente fixa, então as medições são
+reprodutíveis. Cada caso informa operações por segundo (melhor de várias
+repetições) e o pico de memória alocada (tracemalloc) em uma execução.
+
+A velocidade da máquina varia bastante de uma execução para outra, então a
+comparação com a baseline não usa as operações por segundo: cada caso é
+medido em pares alternados com uma carga de referência fixa, e o que se
+compara é a mediana da razão entre os dois (o "relativo"). Um caso que
+pareça mais lento é medido de novo antes de ser apontado como regressão.
+
+    python benchmarks.py                      # mede e compara com a baseline
+    python benchmarks.py --salvar-baseline    # grava a baseline atual
+    python benchmarks.py -k decod             # só os casos com "decod" no nome
+
+Sai com código 1 se o relativo de algum caso cair em relação à baseline além
+da tolerância (padrão 30%).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+import banco
+import nucleo
+from acervo import Acervo, campos_do_registro, registros_de_boletins
+from analise import janela_movel, reamostrar
+from armazem import ArmazemBoletins
+from decodificador import decodificar_zonas, empacotar_zonas
+from espacial import IndiceEspacial
+from gerador import gerar_boletins
+from perfil import PerfilVertical
+from protocolo import codificar_boletim, codificar_delta, decodificar_boletim, decodificar_delta
+from stanag import zones_for_heights
+from validacao import validar_lote
+from validade import codificar_validade
+
+CAMINHO_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks_baseline.json")
+TOLERANCIA_PADRAO = 0.30
+PARES = 25             # medições alternadas de caso e referência
+DURACAO_MEDICAO = 0.02  # segundos de cada medição de um par
+CONFIRMACOES = 2       # novas medições de um caso antes de apontar regressão
+TAMANHO_LOTE = 1000
+REGISTROS_ACERVO = 100 * TAMANHO_LOTE
+
+
+def _casos(pasta):
+    """Monta os casos: nome -> (função, operações por chamada)."""
+    boletins = gerar_boletins(TAMANHO_LOTE, semente=4082)
+    # Validade começando agora, para que as consultas encontrem um boletim vigente
+    for b in boletins:
+        b[2] = codificar_validade(time.time(), 6)
+    boletim = boletins[0]
+    quadro = codificar_boletim(boletim)
+    # Atualização da mesma estação com 4 zonas alteradas (difusão)
+    atualizado = boletim[:4] + [zona if i % 8 else outra for i, (zona, outra) in enumerate(zip(boletim[4:], boletins[1][4:]))]
+    bloco = empacotar_zonas(zona for b in boletins for zona in b[4:])
+    alturas = np.random.default_rng(4082).uniform(0, 30000, TAMANHO_LOTE * 10)
+    perfil = PerfilVertical(boletim[4:])
+    tempos = np.sort(np.random.default_rng(4082).uniform(0, 30 * 86400, TAMANHO_LOTE * 100))
+    serie = np.random.default_rng(4083).normal(280, 10, len(tempos))
+    indice = IndiceEspacial()
+    armazem = ArmazemBoletins(max_boletins=TAMANHO_LOTE)
+    armazem.assinar(indice.adicionar)
+    for b in boletins:
+        armazem.adicionar(b)
+    # Boletim antigo de uma estação no armazém compacto: remontado do quadro-chave
+    compacto = ArmazemBoletins(compacto=True)
+    antigo = compacto.adicionar(boletim)
+    antigo = compacto.adicionar(atualizado)
+    compacto.adicionar(boletim)
+
+    # Acervo com 100 mil registros, lido pelo mmap como nos apps
+    caminho_acervo = os.path.join(pasta, "benchmark.acervo")
+    with Acervo(caminho_acervo, "w") as acervo:
+        for _ in range(REGISTROS_ACERVO // TAMANHO_LOTE):
+            acervo.acrescentar(boletins)
+    with Acervo(caminho_acervo) as acervo:
+        registros = acervo.registros
+
+    nucleo.processar_boletim(boletim)
+    bd = banco.BancoDados(os.path.join(pasta, "benchmark.db"))
+    bd.configurar()
+
+    casos = {
+        "protocolo_decodificar": (lambda: decodificar_boletim(quadro), 1),
+        "protocolo_delta": (lambda: decodificar_delta(codificar_delta(atualizado, boletim)), 1),
+        "processar_boletim": (lambda: nucleo.processar_boletim(boletim), 1),
+        "decodificar_dados_zona": (lambda: nucleo.decodificar_dados_zona(boletim[12]), 1),
+        "decodificar_zonas_lote": (lambda: decodificar_zonas(bloco), TAMANHO_LOTE),
+        "buscar_dados_altura": (lambda: nucleo.buscar_dados_altura("3200"), 1),
+        "zones_for_heights_lote": (lambda: zones_for_heights(alturas), len(alturas)),
+        "perfil_consultar_lote": (lambda: perfil.consultar(alturas), len(alturas)),
+        "espacial_mais_proximo": (lambda: indice.mais_proximos(-20.5, -45.3, 4), 1),
+        "armazem_remontar_zonas": (lambda: antigo.zonas, 1),
+        "analise_reamostrar_p90": (lambda: reamostrar(tempos, serie, 3600, "p90"), len(tempos)),
+        "analise_janela_movel": (lambda: janela_movel(tempos, serie, 86400), len(tempos)),
+        "acervo_converter_lote": (lambda: registros_de_boletins(boletins), TAMANHO_LOTE),
+        "acervo_varrer_zona": (lambda: registros["zonas"]["temperatura"][:, 8].mean(), REGISTROS_ACERVO),
+        "acervo_boletim": (lambda: campos_do_registro(registros[54321]), 1),
+        "validacao_lote": (lambda: validar_lote(boletins), TAMANHO_LOTE),
+        "banco_inserir": (lambda: bd.inserir_boletins([boletim]), 1),
+        "banco_inserir_lote": (lambda: bd.inserir_boletins(boletins), TAMANHO_LOTE),
+    }
+    return casos, bd
+
+
+# Carga fixa que só depende do interpretador e da máquina
+def _referencia():
+    return sum(i * i for i in range(1000))
+
+
+def _chamadas(temporizador):
+    """Número de chamadas que leva pelo menos DURACAO_MEDICAO segundos."""
+    numero = 1
+    while temporizador.timeit(numero) < DURACAO_MEDICAO:
+        numero *= 2
+    return numero
+
+
+def medir(funcao, operacoes, pares=PARES):
+    """
+    Retorna (operações por segundo, relativo, pico de memória em KiB). O
+    relativo é a mediana, entre os pares, de quantas operações do caso cabem
+    no tempo de uma chamada da referência (a mais rápida das medidas logo
+    antes e logo depois); uma máquina mais lenta ou mais carregada naquele
+    momento afeta os dois lados igualmente.
+    """
+    temporizador, referencia = timeit.Timer(funcao), timeit.Timer(_referencia)
+    numero, numero_referencia = _chamadas(temporizador), _chamadas(referencia)
+    tempos, razoes = [], []
+    for _ in range(pares):
+        antes = referencia.timeit(numero_referencia)
+        tempo = temporizador.timeit(numero) / numero
+        depois = referencia.timeit(numero_referencia)
+        tempos.append(tempo)
+        razoes.append(operacoes / tempo * min(antes, depois) / numero_referencia)
+
+    tracemalloc.start()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return operacoes / min(tempos), statistics.median(razoes), pico / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks dos caminhos críticos dos apps STANAG 4082.")
+    parser.add_argument("-k", dest="filtro", default="", help="roda só os casos cujo nome contém o texto")
+    parser.add_argument("--baseline", default=CAMINHO_BASELINE)
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO,
+                        help="queda aceita no relativo antes de falhar")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as arquivo:
+            baseline = json.load(arquivo)
+
+    resultados = {}
+    regressoes = []
+    with tempfile.TemporaryDirectory() as pasta:
+        casos, bd = _casos(pasta)
+        try:
+            print(f"{'caso':<26}{'ops/s':>14}{'memória KiB':>14}{'relativo':>12}{'baseline':>12}{'variação':>10}")
+            for nome, (funcao, operacoes) in casos.items():
+                if args.filtro not in nome:
+                    continue
+                ops, relativo, memoria = medir(funcao, operacoes)
+                referencia = baseline.get(nome, {}).get("relativo")
+                variacao = ""
+                if referencia:
+                    relativa = relativo / referencia - 1
+                    for _ in range(CONFIRMACOES):
+                        if relativa >= -args.tolerancia:
+                            break
+                        # Pode ter sido uma oscilação da máquina: mede de novo e fica a melhor
+                        medicao = medir(funcao, operacoes)
+                        if medicao[1] > relativo:
+                            ops, relativo, memoria = medicao
+                        relativa = relativo / referencia - 1
+                    variacao = f"{relativa:+.0%}"
+                    if relativa < -args.tolerancia:
+                        regressoes.append(nome)
+                        variacao += " !"
+                resultados[nome] = {"ops_por_segundo": round(ops), "relativo": round(relativo, 4),
+                                    "memoria_kib": round(memoria, 1)}
+                referencia = f"{referencia:,.3f}" if referencia else "-"
+                print(f"{nome:<26}{ops:>14,.0f}{memoria:>14,.1f}{relativo:>12,.3f}{referencia:>12}{variacao:>10}")
+        finally:
+            bd.fechar()
+
+    if args.salvar_baseline:
+        baseline.update(resultados)
+        with open(args.baseline, "w") as arquivo:
+            json.dump(baseline, arquivo, indent=2, sort_keys=True)
+        print(f"Baseline gravada em {args.baseline}")
+        return 0
+    if regressoes:
+        print(f"Regressão de desempenho em: {', '.join(regressoes)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Cache das zonas decodificadas, com chave (id do boletim, zona).
+
+Um boletim não muda depois de recebido, então cada zona só precisa ser
+decodificada uma vez. Quando um boletim novo chega para a mesma posição
+(LaLaLaLoLoLo), as entradas do boletim anterior dessa posição são
+descartadas; além disso, as entradas menos usadas saem quando a capacidade
+é atingida (LRU).
+"""
+import threading
+from collections import OrderedDict
+
+from decodificador import decodificar_zona
+from stanag import NUMERO_ZONAS
+
+CAPACIDADE_PADRAO = 1024
+
+
+class CacheDecodificacao:
+    """
+    `decodificar` transforma a string de uma zona no valor guardado (por
+    padrão o registro de decodificador.decodificar_zona). No modo ansioso,
+    as 32 zonas de cada boletim novo são decodificadas assim que ele chega.
+    """
+
+    def __init__(self, capacidade=CAPACIDADE_PADRAO, decodificar=decodificar_zona, ansioso=False):
+        self.capacidade = capacidade
+        self.decodificar = decodificar
+        self.ansioso = ansioso
+        self.acertos = 0
+        self.falhas = 0
+        self._dados = OrderedDict()
+        self._vigente_por_posicao = {}
+        self._lock = threading.Lock()
+
+    def obter(self, boletim, zona):
+        """Retorna a zona decodificada do boletim (um RegistroBoletim)."""
+        chave = (boletim.id, zona)
+        with self._lock:
+            try:
+                valor = self._dados[chave]
+            except KeyError:
+                self.falhas += 1
+            else:
+                self.acertos += 1
+                self._dados.move_to_end(chave)
+                return valor
+
+        valor = self.decodificar(boletim.zonas[zona])
+        with self._lock:
+            self._guardar(chave, valor)
+        return valor
+
+    def _guardar(self, chave, valor):
+        self._dados[chave] = valor
+        self._dados.move_to_end(chave)
+        while len(self._dados) > self.capacidade:
+            self._dados.popitem(last=False)
+
+    def substituir(self, boletim):
+        """
+        Avisa o cache que `boletim` é o novo boletim vigente da sua posição.
+        Pode ser registrada diretamente com ArmazemBoletins.assinar.
+        """
+        valores = None
+        if self.ansioso:
+            valores = [self.decodificar(texto) for texto in boletim.zonas]
+        with self._lock:
+            anterior = self._vigente_por_posicao.get(boletim.posicao)
+            self._vigente_por_posicao[boletim.posicao] = boletim.id
+            if anterior is not None and anterior != boletim.id:
+                for zona in range(NUMERO_ZONAS):
+                    self._dados.pop((anterior, zona), None)
+            if valores is not None:
+                for zona, valor in enumerate(valores):
+                    self._guardar((boletim.id, zona), valor)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+            self._vigente_por_posicao.clear()
+            self.acertos = self.falhas = 0
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+                "entradas": len(self._dados),
+            }
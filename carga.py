@@ -0,0 +1,313 @@
+"""
+Teste de carga do receptor com tráfego sintético ou gravado.
+
+gravar: gera o tráfego de muitas estações simuladas (gerador.gerar_trafego,
+com perfis que evoluem aos poucos) e grava em um acervo binário (acervo.py)
+ou em texto METCM, um boletim por linha, que arquivos.py sabe importar.
+
+reproduzir: envia por UDP os boletins de um acervo (gravado aqui, pelo
+receptor com --acervo ou exportado do banco por arquivos.py) ou, sem
+acervo, do gerador. Os intervalos entre os horários de recebimento são
+divididos por --velocidade: 1 é tempo real, 60 é uma hora por minuto e 0
+envia o mais rápido possível. Com --perda, --duplicacao ou --reordenacao
+os datagramas passam por um enlace simulado (transporte.SimuladorEnlace);
+o emissor não passa de FOLGA_SIMULADOR datagramas à frente dele, e o que
+ainda assim o simulador descartar aparece à parte, fora da conta do receptor.
+
+Por padrão um Receptor local recebe os boletins e passa cada lote para
+nucleo.processar_boletim, como no app de consulta. O relatório mostra a
+vazão sustentada do receptor, a latência de ponta a ponta (do envio do
+datagrama até o fim do processamento do lote), perdas, duplicados e
+boletins fora de ordem; o emissor roda no mesmo processo e disputa o GIL
+com o receptor, então os números são um pouco pessimistas. Com --porta,
+os boletins vão para um receptor de fora (aplicativo2, receptor.py,
+difusao.py) e só o envio é medido; o lado de lá pode ser acompanhado pelas
+métricas dele (receptor.py --metricas).
+
+    python carga.py gravar trafego.acervo --estacoes 200 --duracao 2d --intervalo 1h
+    python carga.py reproduzir trafego.acervo --velocidade 3600
+    python carga.py reproduzir --estacoes 500 --duracao 1h --intervalo 1m --velocidade 0 --perda 0.01
+    python carga.py reproduzir trafego.acervo --velocidade 0 --porta 5005
+"""
+import argparse
+import gzip
+import socket
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from acervo import Acervo, campos_do_registro, quadros_binarios, registros_de_boletins
+from analise import duracao
+from gerador import gerar_trafego
+from protocolo import decodificar_boletim
+
+INTERVALO_PROGRESSO = 1.0
+ESPERA_FINAL = 1.0
+FOLGA_SIMULADOR = 256  # datagramas que o emissor pode ficar à frente do enlace simulado
+
+
+# Função para gerar o tráfego das estações simuladas como registros do acervo
+def registros_sinteticos(estacoes, duracao, intervalo, inicio=None, semente=0):
+    inicio = time.time() if inicio is None else inicio
+    trafego = list(gerar_trafego(estacoes, inicio, duracao, intervalo, semente))
+    if not trafego:
+        return registros_de_boletins([])
+    tempos, boletins = zip(*trafego)
+    return registros_de_boletins(boletins, tempos)
+
+
+class MedidorRecepcao:
+    """
+    Assinante do receptor que casa cada boletim recebido com o seu envio e
+    mede a latência. O boletim é reconhecido pelo conteúdo; boletins
+    idênticos no tráfego são casados na ordem de envio, e uma cópia que
+    chega depois de todas as esperadas conta como duplicada.
+    """
+
+    def __init__(self, quadros, processar=None):
+        self.processar = processar
+        self._esperados = {}
+        for numero, quadro in enumerate(quadros):
+            self._esperados.setdefault(tuple(decodificar_boletim(quadro.tobytes())), deque()).append(numero)
+        self.enviados_em = np.full(len(quadros), np.nan)
+        self.latencias = np.full(len(quadros), np.nan)
+        self.entregues = 0
+        self.duplicados = 0
+        self.fora_de_ordem = 0
+        self.primeiro = None
+        self.ultimo = None
+        self._maior = -1
+
+    def __call__(self, boletins):
+        # Chamado na thread do receptor com um lote
+        if self.processar is not None:
+            for campos in boletins:
+                self.processar(campos)
+        agora = time.perf_counter()
+        for campos in boletins:
+            numeros = self._esperados.get(tuple(campos))
+            if not numeros:
+                self.duplicados += 1
+                continue
+            numero = numeros.popleft()
+            self.latencias[numero] = agora - self.enviados_em[numero]
+            if numero < self._maior:
+                self.fora_de_ordem += 1
+            else:
+                self._maior = numero
+            self.entregues += 1
+        if self.primeiro is None:
+            self.primeiro = agora
+        self.ultimo = agora
+
+
+# Função para enviar os quadros respeitando os horários de recebimento
+def reproduzir(quadros, tempos, destino, velocidade=1.0, enviados_em=None, progresso=None, conter=None):
+    """
+    Envia os quadros (array DTYPE_QUADRO) para `destino` por UDP. O quadro
+    i sai (tempos[i] - tempos[0]) / velocidade segundos depois do primeiro;
+    com velocidade 0, sem pausas. O instante de cada envio (perf_counter)
+    vai para `enviados_em`, se informado, e progresso(enviados) é chamado
+    a cada INTERVALO_PROGRESSO segundos. conter(enviados), se informada, é
+    chamada antes de cada envio e pode esperar para segurar o ritmo.
+    Retorna (duração, maior atraso do emissor em relação ao horário
+    previsto, erros de envio).
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(destino)
+    tamanho = quadros.dtype.itemsize
+    dados = memoryview(quadros.view(np.uint8))
+    deslocamentos = ((np.asarray(tempos) - tempos[0]) / velocidade).tolist() if velocidade and len(tempos) else None
+    atraso_maximo = 0.0
+    erros = 0
+    inicio = time.perf_counter()
+    proximo_progresso = inicio + INTERVALO_PROGRESSO
+    try:
+        for numero in range(len(quadros)):
+            agora = time.perf_counter()
+            if deslocamentos is not None:
+                espera = inicio + deslocamentos[numero] - agora
+                if espera > 0:
+                    time.sleep(espera)
+                    agora = time.perf_counter()
+                else:
+                    atraso_maximo = max(atraso_maximo, -espera)
+            if conter is not None:
+                conter(numero)
+                agora = time.perf_counter()
+            if enviados_em is not None:
+                enviados_em[numero] = agora
+            try:
+                sock.send(dados[numero * tamanho:(numero + 1) * tamanho])
+            except OSError:
+                erros += 1
+            if progresso is not None and agora >= proximo_progresso:
+                progresso(numero + 1)
+                proximo_progresso += INTERVALO_PROGRESSO
+    finally:
+        sock.close()
+    return time.perf_counter() - inicio, atraso_maximo, erros
+
+
+def _registros_da_origem(args):
+    if args.acervo:
+        with Acervo(args.acervo) as acervo:
+            # Em ordem de recebimento (pelo índice de tempo)
+            return acervo.selecionar()
+    return registros_sinteticos(args.estacoes, args.duracao, args.intervalo, semente=args.semente)
+
+
+def _gravar(args):
+    registros = registros_sinteticos(args.estacoes, args.duracao, args.intervalo, args.inicio, args.semente)
+    if args.destino.endswith(".acervo"):
+        with Acervo(args.destino, "w") as acervo:
+            acervo.acrescentar_registros(registros)
+    else:
+        abrir = gzip.open if args.destino.endswith(".gz") else open
+        with abrir(args.destino, "wt", encoding="ascii") as arquivo:
+            for registro in registros:
+                arquivo.write(" ".join(campos_do_registro(registro)) + "\n")
+    print(f"{len(registros)} boletins de {args.estacoes} estações gravados em {args.destino}")
+    return 0
+
+
+def _percentis_ms(latencias):
+    if not len(latencias):
+        return "sem amostras"
+    p50, p95, p99 = np.percentile(latencias, [50, 95, 99]) * 1000
+    return f"p50 {p50:.2f} ms  p95 {p95:.2f} ms  p99 {p99:.2f} ms  máx {latencias.max() * 1000:.2f} ms"
+
+
+def _reproduzir(args):
+    from transporte import SimuladorEnlace
+
+    registros = _registros_da_origem(args)
+    if not len(registros):
+        print("Nenhum boletim para enviar.", file=sys.stderr)
+        return 1
+    quadros = quadros_binarios(registros)
+    tempos = registros["recebido_em"]
+    periodo = tempos[-1] - tempos[0]
+    print(f"{len(quadros)} boletins cobrindo {periodo / 3600:.1f} h; "
+          f"velocidade {'máxima' if not args.velocidade else f'{args.velocidade:g}x'}", flush=True)
+
+    receptor = medidor = None
+    if args.porta is None:
+        from receptor import Receptor
+
+        processar = None
+        if args.processar == "nucleo":
+            from nucleo import processar_boletim as processar
+        medidor = MedidorRecepcao(quadros, processar)
+        receptor = Receptor(0, "127.0.0.1")
+        receptor.assinar(medidor)
+        receptor.iniciar_em_thread()
+        destino = receptor.endereco[:2]
+    else:
+        destino = (args.host, args.porta)
+
+    simulador = conter = None
+    if args.perda or args.duplicacao or args.reordenacao:
+        simulador = SimuladorEnlace(destino, perda=args.perda, duplicacao=args.duplicacao,
+                                    reordenacao=args.reordenacao, atraso=args.atraso, semente=args.semente)
+        destino = simulador.endereco
+
+        # O simulador roda em Python e não lê tão rápido quanto o emissor
+        # envia: sem folga limitada, o buffer dele transborda
+        def conter(enviados):
+            while enviados - simulador.recebidos >= FOLGA_SIMULADOR:
+                time.sleep(0.0002)
+
+    inicio = time.perf_counter()
+
+    def progresso(enviados):
+        recebidos = f"  entregues {medidor.entregues:8d}" if medidor is not None else ""
+        print(f"{time.perf_counter() - inicio:6.1f} s  enviados {enviados:8d}{recebidos}", flush=True)
+
+    try:
+        duracao, atraso_maximo, erros = reproduzir(quadros, tempos, destino, args.velocidade,
+                                                   medidor.enviados_em if medidor is not None else None,
+                                                   progresso, conter)
+        if medidor is not None:
+            # Espera o receptor esvaziar a fila: termina quando tudo chegou
+            # ou quando nada chega por ESPERA_FINAL segundos
+            limite = time.perf_counter() + args.limite
+            while medidor.entregues < len(quadros) and time.perf_counter() < limite:
+                ultimo = medidor.ultimo
+                time.sleep(ESPERA_FINAL)
+                if medidor.ultimo == ultimo:
+                    break
+    finally:
+        if simulador is not None:
+            simulador.fechar()
+        if receptor is not None:
+            receptor.parar()
+
+    print(f"enviados {len(quadros)} em {duracao:.2f} s ({len(quadros) / duracao:,.0f} boletins/s), "
+          f"maior atraso do emissor {atraso_maximo * 1000:.1f} ms, erros de envio {erros}")
+    if simulador is not None:
+        # O que saiu do emissor e o simulador não leu transbordou o buffer dele
+        descartados = len(quadros) - erros - simulador.recebidos + simulador.falhas
+        print(f"enlace simulado: {simulador.perdidos} perdidos de propósito, "
+              f"{simulador.encaminhados} encaminhados")
+        print(f"descartados pelo simulador (buffer cheio ou falha ao encaminhar): {descartados}")
+    if medidor is None:
+        return 0
+
+    perdidos = len(quadros) - medidor.entregues
+    janela = (medidor.ultimo - medidor.primeiro) if medidor.entregues > 1 else 0.0
+    print(f"receptor: {receptor.estatisticas}")
+    no_enlace = f"; {simulador.perdidos + descartados} antes do receptor" if simulador is not None else ""
+    print(f"entregues {medidor.entregues} ({perdidos} perdidos, {perdidos / len(quadros):.2%}{no_enlace}), "
+          f"duplicados {medidor.duplicados}, fora de ordem {medidor.fora_de_ordem}")
+    if janela:
+        print(f"vazão sustentada: {medidor.entregues / janela:,.0f} boletins/s em {janela:.2f} s")
+    latencias = medidor.latencias[~np.isnan(medidor.latencias)]
+    print(f"latência de ponta a ponta: {_percentis_ms(latencias)}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tráfego sintético e teste de carga do receptor STANAG 4082.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    def trafego(sub):
+        grupo = sub.add_argument_group("tráfego sintético")
+        grupo.add_argument("--estacoes", type=int, default=100)
+        grupo.add_argument("--duracao", type=duracao, default=86400.0, help="período simulado (ex.: 6h, 2d)")
+        grupo.add_argument("--intervalo", type=duracao, default=3600.0, help="entre boletins de uma estação")
+        grupo.add_argument("--semente", type=int, default=0)
+
+    gravacao = comandos.add_parser("gravar", help="grava tráfego sintético em um acervo ou arquivo de texto")
+    gravacao.add_argument("destino", help="arquivo .acervo, ou texto METCM (.txt, .gz)")
+    trafego(gravacao)
+    gravacao.add_argument("--inicio", type=float, help="início do período (segundos desde 1970; padrão: agora)")
+
+    reproducao = comandos.add_parser("reproduzir", help="envia os boletins por UDP e mede a recepção")
+    reproducao.add_argument("acervo", nargs="?", help="acervo a reproduzir (sem ele, usa o tráfego sintético)")
+    trafego(reproducao)
+    reproducao.add_argument("--velocidade", type=float, default=1.0,
+                            help="1 = tempo real, N = N vezes mais rápido, 0 = sem pausas")
+    reproducao.add_argument("--perda", type=float, default=0.0, help="fração de datagramas perdidos")
+    reproducao.add_argument("--duplicacao", type=float, default=0.0, help="fração de datagramas duplicados")
+    reproducao.add_argument("--reordenacao", type=float, default=0.0, help="fração de datagramas atrasados")
+    reproducao.add_argument("--atraso", type=float, default=0.0, help="atraso do enlace simulado em segundos")
+    reproducao.add_argument("--porta", type=int, help="envia para um receptor externo nesta porta")
+    reproducao.add_argument("--host", default="127.0.0.1")
+    reproducao.add_argument("--processar", choices=["nucleo", "nenhum"], default="nucleo",
+                            help="o que o receptor local faz com os boletins")
+    reproducao.add_argument("--limite", type=float, default=60.0,
+                            help="segundos máximos esperando o receptor depois do envio")
+    args = parser.parse_args(argv)
+
+    try:
+        return _gravar(args) if args.comando == "gravar" else _reproduzir(args)
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Decodificador vetorizado das zonas do boletim STANAG 4082.
+
+Cada zona é uma string de 16 dígitos no formato ZZdddFFFTTTTPPPP:
+    ZZ   - número da zona
+    ddd  - direção do vento em dezenas de mils
+    FFF  - velocidade do vento em nós
+    TTTT - temperatura virtual em décimos de Kelvin
+    PPPP - pressão do ar em milibares
+"""
+import numpy as np
+
+from stanag import NUMERO_ZONAS
+
+TAMANHO_ZONA = 16
+
+# Registro decodificado de uma zona
+DTYPE_ZONA = np.dtype([
+    ("zona", np.int16),
+    ("direcao_vento", np.int32),     # mils
+    ("velocidade_vento", np.int16),  # nós
+    ("temperatura", np.float32),     # Kelvin
+    ("pressao", np.int16),           # mb
+])
+
+# Peso de cada um dos 16 dígitos em cada campo (zona, ddd, FFF, TTTT, PPPP):
+# multiplicar a matriz de dígitos por ela monta todos os campos de uma vez
+_POSICOES = ((0, 2), (2, 5), (5, 8), (8, 12), (12, 16))
+_PESOS = np.zeros((TAMANHO_ZONA, len(_POSICOES)), dtype=np.int32)
+for _coluna, (_inicio, _fim) in enumerate(_POSICOES):
+    _PESOS[_inicio:_fim, _coluna] = 10 ** np.arange(_fim - _inicio - 1, -1, -1)
+
+
+# Função para decodificar um bloco de zonas em lote
+def decodificar_zonas(dados, zonas_por_boletim=NUMERO_ZONAS):
+    """
+    Decodifica N boletins x 32 zonas de ASCII de largura fixa.
+
+    `dados` é qualquer objeto com interface de buffer (bytes, bytearray,
+    memoryview, mmap) com N * zonas_por_boletim * 16 bytes; ele é lido com
+    np.frombuffer, sem cópia. Retorna (registros, validos), ambos com forma
+    (N, zonas_por_boletim): um array estruturado DTYPE_ZONA e a máscara de
+    zonas decodificadas com sucesso. Zonas inválidas ficam zeradas.
+    """
+    brutos = np.frombuffer(dados, dtype=np.uint8)
+    if brutos.size % (TAMANHO_ZONA * zonas_por_boletim):
+        raise ValueError("O tamanho dos dados não corresponde a um número inteiro de boletins.")
+    digitos = brutos.reshape(-1, TAMANHO_ZONA) - np.uint8(ord("0"))
+
+    # Depois da subtração, qualquer byte fora de '0'..'9' vira um valor > 9
+    validos = (digitos <= 9).all(axis=1)
+    valores = digitos.astype(np.int32) @ _PESOS
+    valores[~validos] = 0
+
+    registros = np.empty(len(valores), dtype=DTYPE_ZONA)
+    registros["zona"] = valores[:, 0]
+    registros["direcao_vento"] = valores[:, 1] * 10
+    registros["velocidade_vento"] = valores[:, 2]
+    registros["temperatura"] = valores[:, 3] / 10.0
+    registros["pressao"] = valores[:, 4]
+    return (registros.reshape(-1, zonas_por_boletim),
+            validos.reshape(-1, zonas_por_boletim))
+
+
+# Função para montar o buffer de entrada a partir das strings das zonas
+def empacotar_zonas(zonas):
+    """
+    Junta uma sequência de strings de zona em um único bloco de bytes.
+
+    Só os últimos 16 caracteres de cada zona são usados; zonas vazias ou
+    curtas são completadas com espaços e saem como inválidas na decodificação.
+    """
+    return "".join(
+        (zona or "")[-TAMANHO_ZONA:].rjust(TAMANHO_ZONA) for zona in zonas
+    ).encode("ascii", "replace")
+
+
+# Função para decodificar uma única zona
+def decodificar_zona(zona_dados):
+    """
+    Decodifica uma string de zona usando o mesmo parser do lote.
+    Retorna o registro DTYPE_ZONA ou None se a zona for inválida.
+    """
+    registros, validos = decodificar_zonas(empacotar_zonas([zona_dados]), 1)
+    return registros[0, 0] if validos[0, 0] else None
@@ -0,0 +1,405 @@
+"""
+Envio dos boletins gravados pelo app de entrada (aplicativo1) para os
+receptores, no modelo store-and-forward.
+
+A tabela `boletim` do banco é a fila de saída. O Despachante lê, em uma
+thread própria, os boletins que cada destino ainda não confirmou e os envia
+em lotes pelo transporte confiável (transporte.EmissorConfiavel). O estado
+de cada destino fica na tabela `envio`: o maior id confirmado (os ids só
+crescem, então todos os menores também foram entregues). Se o enlace cair
+ou o app for fechado, nada se perde: o envio continua de onde parou. A
+entrega é "pelo menos uma vez"; boletins enviados mas não confirmados antes
+de uma queda são enviados de novo.
+
+Se um destino passa `tempo_limite` segundos sem confirmar nada com boletins
+em voo, o emissor é descartado (o receptor pode ter reiniciado e perdido a
+sessão) e uma nova tentativa é feita depois de uma espera que dobra a cada
+falha, até ESPERA_MAXIMA.
+
+Os destinos do app vêm da variável de ambiente STANAG_DESTINOS
+("host:porta,host:porta"). Medição local, com um receptor UDP que fica
+fora do ar por alguns segundos no meio do envio:
+    python despacho.py --boletins 5000 --taxa 500 --queda 3
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+
+import banco
+import metricas
+from protocolo import codificar_boletim
+from transporte import JANELA_PADRAO, EmissorConfiavel
+
+DESTINOS_PADRAO = os.environ.get("STANAG_DESTINOS", "")
+TAMANHO_LOTE = 64           # boletins lidos do banco por consulta
+MAX_EM_VOO = 512            # boletins enviados e ainda não confirmados, por destino
+INTERVALO_CONSULTA = 1.0    # segundos entre consultas ao banco quando não há avisos
+INTERVALO_CONFIRMACAO = 0.02  # segundos entre verificações enquanto há boletins em voo
+TEMPO_LIMITE = 3.0
+ESPERA_INICIAL = 0.5
+ESPERA_MAXIMA = 30.0
+
+enviados = metricas.contador("stanag_despacho_enviados_total", "Boletins enviados aos destinos (com reenvios)")
+confirmados = metricas.contador("stanag_despacho_confirmados_total", "Boletins com entrega confirmada")
+reconexoes = metricas.contador("stanag_despacho_reconexoes_total",
+                               "Emissores descartados por falta de confirmação")
+
+
+# Função para ler a lista de destinos no formato "host:porta,host:porta"
+def ler_destinos(texto):
+    destinos = []
+    for item in texto.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, porta = item.rpartition(":")
+        if not host or not porta.isdigit():
+            raise ValueError(f"Destino inválido: '{item}' (use host:porta).")
+        destinos.append((host, int(porta)))
+    return destinos
+
+
+class _Destino:
+    """Estado de entrega de um destino, usado só pela thread do despachante."""
+
+    def __init__(self, endereco):
+        self.endereco = endereco
+        self.chave = f"{endereco[0]}:{endereco[1]}"
+        self.confirmado_ate = 0
+        self.enviado_ate = 0
+        self.em_voo = deque()      # (id, enviado); os inválidos não vão para o emissor
+        self.emissor = None
+        self.confirmadas = 0       # mensagens_confirmadas do emissor já contadas
+        self.ultimo_progresso = 0.0
+        self.falhas = 0
+        self.proxima_tentativa = 0.0
+        self.pendentes = 0
+        self.invalidos = 0
+        self.ultimo_erro = None
+
+
+class Despachante:
+    """
+    Envia os boletins do banco `caminho` para cada destino (host, porta).
+    Um destino novo começa pelos boletins gravados depois do seu registro,
+    ou por todos, com desde_inicio=True. avisar() acorda a thread logo
+    depois de uma gravação; sem avisos, o banco é consultado a cada
+    `intervalo` segundos.
+    """
+
+    def __init__(self, destinos, caminho=banco.CAMINHO_BANCO, tamanho_lote=TAMANHO_LOTE,
+                 max_em_voo=MAX_EM_VOO, intervalo=INTERVALO_CONSULTA, tempo_limite=TEMPO_LIMITE,
+                 janela=JANELA_PADRAO, desde_inicio=False):
+        self.destinos = [_Destino(tuple(destino)) for destino in destinos]
+        self.caminho = caminho
+        self.tamanho_lote = tamanho_lote
+        self.max_em_voo = max_em_voo
+        self.intervalo = intervalo
+        self.tempo_limite = tempo_limite
+        self.janela = janela
+        self.desde_inicio = desde_inicio
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        metricas.coletar("stanag_despacho_pendentes", "Boletins ainda não confirmados (soma dos destinos)",
+                         lambda: self.pendentes)
+
+    @property
+    def pendentes(self):
+        return sum(destino.pendentes for destino in self.destinos)
+
+    def situacao(self):
+        """Um dicionário por destino com o andamento da entrega."""
+        return [
+            {
+                "destino": destino.chave,
+                "confirmado_ate": destino.confirmado_ate,
+                "pendentes": destino.pendentes,
+                "em_voo": len(destino.em_voo),
+                "conectado": destino.emissor is not None,
+                "falhas": destino.falhas,
+                "invalidos": destino.invalidos,
+                "ultimo_erro": destino.ultimo_erro,
+            }
+            for destino in self.destinos
+        ]
+
+    def iniciar(self):
+        """
+        Abre o banco e registra os destinos na thread do despachante. Só
+        retorna depois disso; se o banco não puder ser aberto, o erro é
+        levantado aqui.
+        """
+        pronto = threading.Event()
+        erros = []
+        self._thread = threading.Thread(target=self._executar, args=(pronto, erros), daemon=True)
+        self._thread.start()
+        pronto.wait()
+        if erros:
+            self._thread = None
+            raise erros[0]
+        return self
+
+    def avisar(self):
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # Thread do despachante
+
+    def _executar(self, pronto, erros):
+        try:
+            conn = banco.conectar(self.caminho)
+            banco.configurar_banco(conn)
+            ultimo_id = self._ultimo_id(conn)
+            for destino in self.destinos:
+                self._carregar_estado(conn, destino, ultimo_id)
+        except sqlite3.Error as e:
+            erros.append(e)
+            pronto.set()
+            return
+        pronto.set()
+
+        try:
+            while not self._parar.is_set():
+                self._acordar.clear()
+                agora = time.monotonic()
+                atrasados = False
+                try:
+                    ultimo_id = self._ultimo_id(conn)
+                    for destino in self.destinos:
+                        atrasados |= self._atender(conn, destino, ultimo_id, agora)
+                except sqlite3.Error as e:
+                    # Banco ocupado ou com problema: tenta de novo no próximo intervalo
+                    for destino in self.destinos:
+                        destino.ultimo_erro = f"banco: {e}"
+                if atrasados:
+                    # Recuperando um acúmulo: o próximo lote sai sem esperar
+                    continue
+                em_voo = any(destino.em_voo for destino in self.destinos)
+                self._acordar.wait(INTERVALO_CONFIRMACAO if em_voo else self.intervalo)
+        finally:
+            for destino in self.destinos:
+                if destino.emissor is not None:
+                    destino.emissor.fechar(aguardar=False)
+                    destino.emissor = None
+            conn.close()
+
+    def _ultimo_id(self, conn):
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM boletim").fetchone()[0]
+
+    def _carregar_estado(self, conn, destino, ultimo_id):
+        conn.execute(
+            "INSERT OR IGNORE INTO envio (destino, confirmado_ate, atualizado_em) VALUES (?, ?, ?)",
+            (destino.chave, 0 if self.desde_inicio else ultimo_id, int(time.time())),
+        )
+        destino.confirmado_ate = conn.execute(
+            "SELECT confirmado_ate FROM envio WHERE destino = ?", (destino.chave,)
+        ).fetchone()[0]
+        destino.enviado_ate = destino.confirmado_ate
+        destino.pendentes = ultimo_id - destino.confirmado_ate
+
+    def _atender(self, conn, destino, ultimo_id, agora):
+        # Retorna True se ainda há boletins para enviar e espaço para eles
+        if destino.emissor is None:
+            if agora < destino.proxima_tentativa or destino.confirmado_ate >= ultimo_id:
+                destino.pendentes = ultimo_id - destino.confirmado_ate
+                return False
+            try:
+                destino.emissor = EmissorConfiavel(destino.endereco, janela=self.janela)
+            except OSError as e:
+                self._falhou(destino, agora, str(e))
+                return False
+            # Sessão nova: tudo o que não foi confirmado é enviado de novo
+            destino.em_voo.clear()
+            destino.enviado_ate = destino.confirmado_ate
+            destino.confirmadas = 0
+            destino.ultimo_progresso = agora
+
+        self._confirmar(conn, destino, agora)
+        if destino.emissor is not None:
+            self._enviar(conn, destino, ultimo_id, agora)
+        destino.pendentes = ultimo_id - destino.confirmado_ate
+        return (destino.emissor is not None and destino.enviado_ate < ultimo_id
+                and len(destino.em_voo) < self.max_em_voo)
+
+    def _confirmar(self, conn, destino, agora):
+        novas = destino.emissor.mensagens_confirmadas - destino.confirmadas
+        destino.confirmadas += novas
+        confirmado_ate = destino.confirmado_ate
+        restantes = novas
+        while destino.em_voo and (restantes or not destino.em_voo[0][1]):
+            confirmado_ate, enviado = destino.em_voo.popleft()
+            restantes -= enviado
+
+        if novas:
+            confirmados.incrementar(novas)
+            destino.ultimo_progresso = agora
+            destino.falhas = 0
+            destino.ultimo_erro = None
+        elif destino.em_voo and agora - destino.ultimo_progresso > self.tempo_limite:
+            self._falhou(destino, agora, f"sem confirmação há {self.tempo_limite:g} s")
+            return
+        if confirmado_ate != destino.confirmado_ate:
+            conn.execute("UPDATE envio SET confirmado_ate = ?, atualizado_em = ? WHERE destino = ?",
+                         (confirmado_ate, int(time.time()), destino.chave))
+            destino.confirmado_ate = confirmado_ate
+
+    def _enviar(self, conn, destino, ultimo_id, agora):
+        vagas = min(self.max_em_voo - len(destino.em_voo), self.tamanho_lote)
+        if vagas <= 0 or destino.enviado_ate >= ultimo_id:
+            return
+        ids = [linha[0] for linha in conn.execute(
+            "SELECT id FROM boletim WHERE id > ? ORDER BY id LIMIT ?", (destino.enviado_ate, vagas)
+        )]
+        if not ids:
+            return
+        if not destino.em_voo:
+            destino.ultimo_progresso = agora
+
+        boletins = banco.carregar_boletins(conn, ids)
+        quantidade = 0
+        for boletim_id in ids:
+            try:
+                quadro = codificar_boletim(boletins[boletim_id])
+            except ValueError as e:
+                # Um boletim que não pode ser codificado não deve travar a fila
+                destino.invalidos += 1
+                destino.ultimo_erro = f"boletim {boletim_id}: {e}"
+                destino.em_voo.append((boletim_id, False))
+                continue
+            destino.emissor.enviar(quadro)
+            destino.em_voo.append((boletim_id, True))
+            quantidade += 1
+        destino.enviado_ate = ids[-1]
+        enviados.incrementar(quantidade)
+
+    def _falhou(self, destino, agora, motivo):
+        if destino.emissor is not None:
+            destino.emissor.fechar(aguardar=False)
+            destino.emissor = None
+            reconexoes.incrementar()
+        destino.em_voo.clear()
+        destino.enviado_ate = destino.confirmado_ate
+        destino.falhas += 1
+        destino.ultimo_erro = motivo
+        destino.proxima_tentativa = agora + min(ESPERA_MAXIMA, ESPERA_INICIAL * 2 ** (destino.falhas - 1))
+
+
+def medir(args):
+    """
+    Grava boletins em um banco temporário a `taxa` por segundo, um por
+    transação como no app, enquanto o despachante os envia para um receptor
+    local. Com --queda, o receptor fica fora do ar por alguns segundos
+    depois de um terço dos boletins. Informa o acúmulo e a vazão.
+    """
+    from gerador import gerar_boletins
+    from protocolo import decodificar_boletim
+    from receptor import Receptor
+    from transporte import SimuladorEnlace
+
+    boletins = gerar_boletins(args.boletins, semente=22)
+    esperados = {tuple(decodificar_boletim(codificar_boletim(boletim))) for boletim in boletins}
+    recebidos = set()
+
+    def receber(lote):
+        recebidos.update(map(tuple, lote))
+
+    def novo_receptor(porta):
+        receptor = Receptor(porta, "127.0.0.1")
+        receptor.assinar(receber)
+        receptor.iniciar_em_thread()
+        return receptor
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "saida.db")
+        bd = banco.BancoDados(caminho)
+        bd.configurar()
+        receptor = novo_receptor(0)
+        porta = receptor.endereco[1]
+        simulador = None
+        destino = ("127.0.0.1", porta)
+        if args.perda:
+            simulador = SimuladorEnlace(destino, perda=args.perda, semente=1)
+            destino = simulador.endereco
+        despachante = Despachante([destino], caminho, tempo_limite=args.tempo_limite).iniciar()
+
+        intervalo = 1 / args.taxa if args.taxa else 0.0
+        inicio = time.perf_counter()
+        proximo_relatorio = inicio
+        caiu_em = voltou_em = zerou_em = None
+        confirmados_na_volta = acumulo_maximo = 0
+        n = 0
+        while True:
+            agora = time.perf_counter()
+            if n < len(boletins) and (not intervalo or agora >= inicio + n * intervalo):
+                bd.inserir_boletins([boletins[n]])
+                despachante.avisar()
+                n += 1
+                if args.queda and n == len(boletins) // 3:
+                    receptor.parar()
+                    caiu_em = agora
+            if caiu_em is not None and voltou_em is None and agora - caiu_em >= args.queda:
+                receptor = novo_receptor(porta)
+                voltou_em, confirmados_na_volta = agora, confirmados.valor
+            pendentes = despachante.pendentes
+            acumulo_maximo = max(acumulo_maximo, pendentes)
+            if voltou_em is not None and zerou_em is None and pendentes <= args.taxa * 0.05 + TAMANHO_LOTE:
+                zerou_em = agora
+            if agora >= proximo_relatorio:
+                situacao = despachante.situacao()[0]
+                print(f"{agora - inicio:6.1f} s  gravados {n:6d}  pendentes {pendentes:6d}  "
+                      f"confirmado até {situacao['confirmado_ate']:6d}  falhas {situacao['falhas']}", flush=True)
+                proximo_relatorio += 0.5
+            if n == len(boletins) and (despachante.pendentes == 0 or agora - inicio > args.limite):
+                break
+            if intervalo and n < len(boletins):
+                time.sleep(max(0, min(inicio + n * intervalo - time.perf_counter(), 0.05)))
+            else:
+                time.sleep(0.001 if n < len(boletins) else 0.01)
+        duracao = time.perf_counter() - inicio
+
+        despachante.parar()
+        time.sleep(0.05)
+        receptor.parar()
+        if simulador is not None:
+            simulador.fechar()
+        bd.fechar()
+
+    faltando = len(esperados - recebidos)
+    print(f"{len(boletins)} boletins gravados; {len(esperados) - faltando}/{len(esperados)} distintos entregues "
+          f"em {duracao:.2f} s ({len(boletins) / duracao:,.0f} boletins/s)")
+    print(f"enviados {enviados.valor} (com reenvios), reconexões {reconexoes.valor}, "
+          f"maior acúmulo {acumulo_maximo} boletins")
+    if voltou_em is not None and zerou_em is not None:
+        recuperacao = zerou_em - voltou_em
+        print(f"recuperação: acúmulo zerado {recuperacao:.2f} s depois da volta do receptor "
+              f"({(confirmados.valor - confirmados_na_volta) / max(recuperacao, 1e-9):,.0f} boletins/s "
+              f"nesse intervalo)")
+    return 0 if not faltando else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o envio store-and-forward para um receptor local.")
+    parser.add_argument("--boletins", type=int, default=5000)
+    parser.add_argument("--taxa", type=float, default=500, help="boletins gravados por segundo (0: sem pausa)")
+    parser.add_argument("--queda", type=float, default=0, help="segundos com o receptor fora do ar")
+    parser.add_argument("--perda", type=float, default=0, help="fração de datagramas perdidos no enlace")
+    parser.add_argument("--tempo-limite", type=float, default=TEMPO_LIMITE,
+                        help="segundos sem confirmação antes de reconectar")
+    parser.add_argument("--limite", type=float, default=120, help="tempo máximo da medição")
+    args = parser.parse_args(argv)
+    return medir(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,654 @@
+"""
+Distribuição dos boletins recebidos para muitos assinantes na mesma máquina.
+
+Só um processo pode escutar a porta UDP dos boletins. O Distribuidor fica
+com ela (pelo ReceptorMultiplo), guarda o último boletim de cada estação e
+repassa cada boletim novo como um quadro delta (protocolo.VERSAO_DELTA,
+só com as zonas que mudaram) para:
+    - os assinantes conectados por TCP, que recebem o estado completo ao
+      conectar e depois só as atualizações;
+    - um grupo multicast, que qualquer número de processos pode escutar
+      (ReceptorMulticast). Como o UDP pode perder quadros, o estado
+      completo de todas as estações é repetido a cada `intervalo_completo`
+      segundos.
+
+Os quadros do estado completo levam a sequência atual do distribuidor, e
+não a da última atualização da estação: assim o assinante sabe que o
+quadro já inclui tudo o que foi publicado até ali.
+
+Cada assinante TCP tem uma fila limitada. Um assinante lento nunca atrasa a
+recepção: quando a fila dele enche, as atualizações pendentes são
+descartadas e, assim que ele voltar a ler, recebe o estado completo atual
+no lugar delas (as atualizações intermediárias de uma estação se perdem,
+mas o último boletim de cada uma chega sempre).
+
+    python difusao.py servir --porta 5005 --multicast 239.255.40.82:5006
+    python difusao.py medir --assinantes 100 --atualizacoes 20000
+
+O aplicativo de consulta, ao encontrar a porta UDP ocupada, conecta-se ao
+distribuidor pela porta TCP de mesmo número.
+"""
+import argparse
+import asyncio
+import random
+import socket
+import threading
+import time
+from collections import deque
+from functools import partial
+
+import numpy as np
+
+import metricas
+from protocolo import PREFIXO, codificar_delta, decodificar_delta, renumerar_delta
+from receptor import TAMANHO_BUFFER_SOCKET, Receptor, ReceptorMultiplo, ServicoEmThread
+from stanag import CAMPOS_BOLETIM, NUMERO_ZONAS
+
+TAMANHO_FILA_ASSINANTE = 1024
+INTERVALO_COMPLETO = 5.0
+TAMANHO_LEITURA = 64 * 1024
+MAX_LATENCIAS = 100000
+GRUPO_MULTICAST = "239.255.40.82"
+
+
+# Função para identificar a estação de um boletim (octante + LaLaLaLoLoLo)
+def chave_estacao(campos):
+    return campos[0][5:], campos[1]
+
+
+class EstatisticasDifusao:
+    """Contadores do distribuidor."""
+
+    __slots__ = ("publicados", "repetidos", "invalidos", "quadros", "bytes",
+                 "ressincronizacoes", "multicast_descartados", "assinantes_atendidos")
+
+    def __init__(self):
+        self.publicados = 0
+        self.repetidos = 0
+        self.invalidos = 0
+        self.quadros = 0
+        self.bytes = 0
+        self.ressincronizacoes = 0
+        self.multicast_descartados = 0
+        self.assinantes_atendidos = 0
+
+    def __repr__(self):
+        return " ".join(f"{nome}={getattr(self, nome)}" for nome in self.__slots__)
+
+
+class _Assinante:
+    __slots__ = ("escritor", "fila", "ressincronizar")
+
+    def __init__(self, escritor, tamanho_fila):
+        self.escritor = escritor
+        self.fila = asyncio.Queue(tamanho_fila)
+        self.ressincronizar = False
+
+
+class _Ultimo:
+    # Último boletim de uma estação; o quadro completo só é montado quando
+    # alguém precisa dele (assinante novo, ressincronização, multicast) e é
+    # renumerado com a sequência pedida
+    __slots__ = ("campos", "sequencia", "carimbo", "completo", "sequencia_completo")
+
+    def __init__(self, campos, sequencia, carimbo, completo=None):
+        self.campos = campos
+        self.sequencia = sequencia
+        self.carimbo = carimbo
+        self.completo = completo
+        self.sequencia_completo = sequencia
+
+    def quadro_completo(self, sequencia):
+        if self.completo is None:
+            self.completo = codificar_delta(self.campos, None, sequencia, self.carimbo)
+        elif self.sequencia_completo != sequencia:
+            self.completo = renumerar_delta(self.completo, sequencia)
+        self.sequencia_completo = sequencia
+        return self.completo
+
+
+class Distribuidor(ServicoEmThread):
+    """
+    Guarda o último boletim de cada estação e repassa as atualizações aos
+    assinantes. publicar() tem a mesma assinatura dos assinantes do
+    Receptor e pode ser chamada de qualquer thread; o estado e as filas só
+    são alterados na thread do distribuidor.
+    """
+
+    def __init__(self, host="127.0.0.1", porta=None, multicast=None,
+                 tamanho_fila_assinante=TAMANHO_FILA_ASSINANTE, intervalo_completo=INTERVALO_COMPLETO):
+        self.host = host
+        self.porta = porta                # None: sem servidor TCP (0: porta livre qualquer)
+        self.multicast = multicast        # None ou (grupo, porta)
+        self.tamanho_fila_assinante = tamanho_fila_assinante
+        self.intervalo_completo = intervalo_completo
+        self.estatisticas = EstatisticasDifusao()
+        self.endereco = None
+        self._ultimos = {}                # estação -> _Ultimo
+        self._assinantes = set()
+        self._atendimentos = set()
+        self._sequencia = 0
+        self._socket_multicast = None
+        self._loop = None
+        self._thread_loop = None
+        self._parar = None
+        self._thread = None
+
+    @property
+    def assinantes(self):
+        return len(self._assinantes)
+
+    @property
+    def sequencia(self):
+        return self._sequencia
+
+    def estacoes(self):
+        """Retorna um dicionário estação -> campos do último boletim (cópia)."""
+        return {chave: list(ultimo.campos) for chave, ultimo in list(self._ultimos.items())}
+
+    def publicar(self, boletins):
+        """Recebe um lote de boletins (listas de campos) para distribuir."""
+        carimbo = time.time()
+        if self._loop is None or threading.get_ident() == self._thread_loop:
+            self._publicar_no_loop(boletins, carimbo)
+        else:
+            self._loop.call_soon_threadsafe(self._publicar_no_loop, boletins, carimbo)
+
+    def _publicar_no_loop(self, boletins, carimbo):
+        for campos in boletins:
+            chave = chave_estacao(campos)
+            ultimo = self._ultimos.get(chave)
+            anteriores = None if ultimo is None else ultimo.campos
+            if anteriores == campos:
+                self.estatisticas.repetidos += 1
+                continue
+            try:
+                quadro = codificar_delta(campos, anteriores, self._sequencia + 1, carimbo)
+            except (ValueError, UnicodeEncodeError):
+                self.estatisticas.invalidos += 1
+                continue
+            self._sequencia += 1
+            self._ultimos[chave] = _Ultimo(list(campos), self._sequencia, carimbo,
+                                           quadro if anteriores is None else None)
+            self.estatisticas.publicados += 1
+            for assinante in self._assinantes:
+                self._enfileirar(assinante, quadro)
+            self._enviar_multicast(quadro)
+
+    def _enfileirar(self, assinante, quadro):
+        if assinante.ressincronizar:
+            return
+        try:
+            assinante.fila.put_nowait(quadro)
+        except asyncio.QueueFull:
+            # Assinante lento: o que estava pendente é trocado pelo estado
+            # completo, montado quando ele voltar a ler
+            self.estatisticas.ressincronizacoes += 1
+            self._ressincronizar(assinante)
+
+    def _ressincronizar(self, assinante):
+        while not assinante.fila.empty():
+            assinante.fila.get_nowait()
+        assinante.ressincronizar = True
+        assinante.fila.put_nowait(None)
+
+    def _quadros_completos(self):
+        return [ultimo.quadro_completo(self._sequencia) for ultimo in self._ultimos.values()]
+
+    def _enviar_multicast(self, quadro):
+        if self._socket_multicast is None:
+            return
+        try:
+            self._socket_multicast.sendto(quadro, self.multicast)
+        except (BlockingIOError, InterruptedError):
+            self.estatisticas.multicast_descartados += 1
+
+    def _abrir_multicast(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TAMANHO_BUFFER_SOCKET)
+        sock.setblocking(False)
+        return sock
+
+    async def _repetir_completos(self):
+        # Quem entrou no grupo depois, ou perdeu quadros, se atualiza aqui
+        while True:
+            await asyncio.sleep(self.intervalo_completo)
+            for quadro in self._quadros_completos():
+                self._enviar_multicast(quadro)
+
+    async def executar(self, ao_iniciar=None):
+        self._loop = asyncio.get_running_loop()
+        self._thread_loop = threading.get_ident()
+        self._parar = asyncio.Event()
+        servidor = None
+        tarefas = []
+        if self.porta is not None:
+            servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+            self.endereco = servidor.sockets[0].getsockname()
+        if self.multicast is not None:
+            self._socket_multicast = self._abrir_multicast()
+            tarefas.append(asyncio.ensure_future(self._repetir_completos()))
+        if ao_iniciar is not None:
+            ao_iniciar()
+        try:
+            await self._parar.wait()
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+            if servidor is not None:
+                servidor.close()
+                # Fechar as conexões faz cada atendimento terminar normalmente
+                for assinante in list(self._assinantes):
+                    assinante.escritor.close()
+                await asyncio.gather(*self._atendimentos, return_exceptions=True)
+            if self._socket_multicast is not None:
+                self._socket_multicast.close()
+                self._socket_multicast = None
+
+    async def _atender(self, leitor, escritor):
+        escritor.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        assinante = _Assinante(escritor, self.tamanho_fila_assinante)
+        # A primeira coisa que o assinante recebe é o estado completo
+        self._ressincronizar(assinante)
+        self._assinantes.add(assinante)
+        self._atendimentos.add(asyncio.current_task())
+        self.estatisticas.assinantes_atendidos += 1
+        escrita = asyncio.ensure_future(self._escrever(assinante))
+        # Os assinantes não mandam nada; a leitura só percebe a desconexão
+        leitura = asyncio.ensure_future(leitor.read())
+        try:
+            await asyncio.wait([escrita, leitura], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._assinantes.discard(assinante)
+            self._atendimentos.discard(asyncio.current_task())
+            for tarefa in (escrita, leitura):
+                tarefa.cancel()
+            await asyncio.gather(escrita, leitura, return_exceptions=True)
+            escritor.close()
+
+    async def _escrever(self, assinante):
+        while True:
+            quadros = [await assinante.fila.get()]
+            while not assinante.fila.empty():
+                quadros.append(assinante.fila.get_nowait())
+            if quadros[-1] is None:
+                assinante.ressincronizar = False
+                quadros = self._quadros_completos()
+            dados = b"".join(quadros)
+            assinante.escritor.write(dados)
+            self.estatisticas.quadros += len(quadros)
+            self.estatisticas.bytes += len(dados)
+            # Enquanto o socket não esvazia, as novidades se acumulam na fila
+            await assinante.escritor.drain()
+
+
+class EstadoDifusao:
+    """
+    Reconstrói os boletins completos a partir dos quadros delta. A primeira
+    atualização de cada estação tem que ser um quadro completo; as seguintes
+    são aplicadas sobre o boletim guardado.
+
+    Um quadro com sequência até a do último aplicado à estação é repetido
+    ou chegou atrasado e é ignorado. Depois de uma lacuna na sequência, o
+    quadro delta de uma estação cuja atualização anterior pode ter sido a
+    perdida deixa a estação dessincronizada: os quadros delta dela são
+    ignorados até chegar um quadro completo (MASCARA_COMPLETA) com
+    sequência posterior à de todos eles.
+
+    `lacunas` conta as atualizações que não chegaram (pela sequência), seja
+    por perda no multicast ou porque o distribuidor as trocou pelo estado
+    completo de um assinante lento; `ignorados`, os quadros descartados.
+    """
+
+    def __init__(self):
+        self._estacoes = {}       # estação -> [campos, sequência, sincronizada, último delta ignorado]
+        self.ultima_sequencia = 0
+        self.ultima_lacuna = 0    # maior sequência que não chegou
+        self.lacunas = 0
+        self.ignorados = 0
+
+    def __len__(self):
+        return len(self._estacoes)
+
+    def aplicar(self, quadro):
+        """
+        Aplica um quadro e retorna os 36 campos atualizados da estação, ou
+        None se ele foi ignorado.
+        """
+        campos, _, _, _ = self._aplicar(quadro, 0)
+        return campos
+
+    def aplicar_bloco(self, dados):
+        """
+        Aplica todos os quadros inteiros de `dados` (um trecho do fluxo TCP)
+        e retorna (lista de (campos, carimbo, novo), posição do fim do último
+        quadro inteiro). Os quadros ignorados ficam de fora; `novo` é falso
+        para repetições do estado completo que não mudaram a estação.
+        """
+        dados = memoryview(dados)
+        atualizacoes = []
+        inicio = 0
+        while len(dados) - inicio >= PREFIXO.size:
+            _, _, comprimento = PREFIXO.unpack_from(dados, inicio)
+            if len(dados) - inicio < comprimento:
+                break
+            campos, carimbo, novo, inicio = self._aplicar(dados, inicio)
+            if campos is not None:
+                atualizacoes.append((campos, carimbo, novo))
+        return atualizacoes, inicio
+
+    def _aplicar(self, dados, inicio):
+        sequencia, carimbo, cabecalho, zonas, fim = decodificar_delta(dados, inicio)
+        if sequencia > self.ultima_sequencia:
+            if self.ultima_sequencia and sequencia > self.ultima_sequencia + 1:
+                self.lacunas += sequencia - self.ultima_sequencia - 1
+                self.ultima_lacuna = sequencia - 1
+            self.ultima_sequencia = sequencia
+
+        chave = chave_estacao(cabecalho)
+        completo = len(zonas) == NUMERO_ZONAS
+        estacao = self._estacoes.get(chave)
+        if estacao is None:
+            if not completo:
+                raise ValueError("Atualização de uma estação sem o boletim completo anterior.")
+            estacao = self._estacoes[chave] = [[""] * len(CAMPOS_BOLETIM), 0, False, 0]
+        campos, anterior, sincronizada, ignorado = estacao
+        if sequencia <= anterior or (completo and sequencia < ignorado):
+            # Repetido, atrasado ou (completo) sem um delta já ignorado
+            self.ignorados += 1
+            return None, carimbo, False, fim
+        if not completo and (not sincronizada or self.ultima_lacuna > anterior):
+            # Alguma sequência depois da última aplicada à estação não chegou
+            # e pode ser dela: o delta não vale sobre o boletim guardado
+            estacao[2] = False
+            estacao[3] = max(ignorado, sequencia)
+            self.ignorados += 1
+            return None, carimbo, False, fim
+
+        novo = not completo or campos[:4] != cabecalho or any(
+            campos[4 + zona] != texto for zona, texto in zonas.items())
+        campos[:4] = cabecalho
+        for zona, texto in zonas.items():
+            campos[4 + zona] = texto
+        estacao[1] = sequencia
+        estacao[2] = True
+        return list(campos), carimbo, novo, fim
+
+
+class ClienteDifusao(ServicoEmThread):
+    """
+    Assinante TCP do distribuidor, com a mesma interface do Receptor: os
+    assinantes recebem listas de boletins completos (listas de campos), na
+    thread do cliente. Guarda a latência (do publicar() no distribuidor até
+    a chegada aqui) das últimas MAX_LATENCIAS atualizações.
+    """
+
+    def __init__(self, host, porta):
+        self.host = host
+        self.porta = porta
+        self.estado = EstadoDifusao()
+        self.latencias = deque(maxlen=MAX_LATENCIAS)
+        self.recebidos = 0
+        self._assinantes = []
+        self._loop = None
+        self._parar = None
+        self._thread = None
+
+    def assinar(self, assinante):
+        self._assinantes.append(assinante)
+
+    def cancelar_assinatura(self, assinante):
+        self._assinantes.remove(assinante)
+
+    async def executar(self, ao_iniciar=None):
+        self._loop = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+        leitor, escritor = await asyncio.open_connection(self.host, self.porta)
+        if ao_iniciar is not None:
+            ao_iniciar()
+        leitura = asyncio.ensure_future(self._ler(leitor))
+        parar = asyncio.ensure_future(self._parar.wait())
+        try:
+            await asyncio.wait([leitura, parar], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for tarefa in (leitura, parar):
+                tarefa.cancel()
+            escritor.close()
+        if leitura.done() and not leitura.cancelled() and leitura.exception() is not None:
+            raise leitura.exception()
+
+    async def _ler(self, leitor):
+        pendente = b""
+        while dados := await leitor.read(TAMANHO_LEITURA):
+            dados = pendente + dados if pendente else dados
+            atualizacoes, fim = self.estado.aplicar_bloco(dados)
+            pendente = dados[fim:]
+            if not atualizacoes:
+                continue
+            agora = time.time()
+            self.latencias.extend(agora - carimbo for _, carimbo, novo in atualizacoes if novo)
+            self.recebidos += len(atualizacoes)
+            boletins = [campos for campos, _, _ in atualizacoes]
+            for assinante in list(self._assinantes):
+                assinante(boletins)
+
+
+class ReceptorMulticast(Receptor):
+    """
+    Receptor dos quadros delta repetidos pelo distribuidor em um grupo
+    multicast. Vários processos da mesma máquina podem escutar o mesmo grupo
+    e porta. Até chegar o estado completo de uma estação, as atualizações
+    dela contam como inválidas, assim como os quadros ignorados pelo
+    EstadoDifusao (repetidos, atrasados ou de estações dessincronizadas).
+    """
+
+    def __init__(self, grupo, porta, interface="0.0.0.0", **opcoes):
+        self.estado = EstadoDifusao()
+        super().__init__(porta, decodificar=self.estado.aplicar, **opcoes)
+        self.grupo = grupo
+        self.interface = interface
+
+    def _criar_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TAMANHO_BUFFER_SOCKET)
+        sock.bind(("", self.porta))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        socket.inet_aton(self.grupo) + socket.inet_aton(self.interface))
+        self.endereco = sock.getsockname()
+        return sock
+
+
+# Função para ler "grupo:porta"
+def _endereco_multicast(texto):
+    grupo, _, porta = texto.rpartition(":")
+    return (grupo or GRUPO_MULTICAST), int(porta)
+
+
+async def _relatar(receptor, distribuidor, intervalo):
+    estatisticas = distribuidor.estatisticas
+    anteriores, instante = (0, 0), time.perf_counter()
+    while True:
+        await asyncio.sleep(intervalo)
+        agora = time.perf_counter()
+        atuais = (estatisticas.publicados, estatisticas.quadros)
+        publicados, quadros = ((a - b) / (agora - instante) for a, b in zip(atuais, anteriores))
+        anteriores, instante = atuais, agora
+        print(f"{publicados:.0f} atualizações/s  {quadros:.0f} quadros/s para {distribuidor.assinantes} "
+              f"assinantes  {len(distribuidor.estacoes())} estações  {estatisticas}  "
+              f"[receptor: {receptor.estatisticas}]", flush=True)
+
+
+def servir(args):
+    receptor = ReceptorMultiplo(args.porta, args.host, trabalhadores=args.trabalhadores)
+    distribuidor = Distribuidor(args.host_tcp, args.tcp if args.tcp is not None else args.porta[0],
+                                _endereco_multicast(args.multicast) if args.multicast else None,
+                                args.fila, args.intervalo_completo)
+    receptor.assinar(distribuidor.publicar)
+    receptor.perfil, encerrar_metricas = metricas.iniciar_pela_linha_de_comando(args)
+    metricas.coletar("stanag_difusao_assinantes", "Assinantes TCP conectados", lambda: distribuidor.assinantes)
+    for nome in ("publicados", "quadros", "bytes", "ressincronizacoes", "multicast_descartados"):
+        metricas.coletar(f"stanag_difusao_{nome}_total", f"Distribuidor: {nome}",
+                         partial(getattr, distribuidor.estatisticas, nome), "counter")
+
+    async def principal():
+        await asyncio.gather(receptor.executar(), distribuidor.executar(),
+                             _relatar(receptor, distribuidor, args.intervalo))
+
+    bd = None
+    if args.banco:
+        import banco
+
+        bd = banco.BancoDados(args.banco)
+        bd.configurar()
+        receptor.assinar(bd.gravar_em_segundo_plano)
+    print(f"Recebendo nas portas UDP {', '.join(map(str, args.porta))}; assinantes na porta TCP "
+          f"{distribuidor.porta}" + (f" e no grupo {args.multicast}" if args.multicast else "") + "...",
+          flush=True)
+    try:
+        asyncio.run(principal())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if bd is not None:
+            bd.fechar()
+        encerrar_metricas()
+    print(distribuidor.estatisticas)
+
+
+def _perfis(estacoes, rng):
+    from gerador import gerar_boletim
+
+    return [gerar_boletim(rng, latitude=i // 900, longitude=i % 900) for i in range(estacoes)]
+
+
+def medir(args):
+    """
+    Mede o distribuidor pelo loopback: os assinantes TCP rodam em outra
+    thread (um event loop para todos), e cada atualização muda algumas
+    zonas de uma estação. Primeiro publica o mais rápido possível para
+    medir a vazão (a entrega atrasa e as atualizações se acumulam nas
+    filas); depois publica a --taxa (padrão: metade da vazão medida) para
+    medir a latência de distribuição sem essa fila.
+    """
+    from gerador import gerar_zonas
+
+    rng = random.Random(4082)
+    boletins = _perfis(args.estacoes, rng)
+    distribuidor = Distribuidor("127.0.0.1", 0, tamanho_fila_assinante=args.fila)
+    variantes = [gerar_zonas(rng) for _ in range(64)]
+
+    async def assinantes(clientes):
+        await asyncio.gather(*(cliente.executar() for cliente in clientes))
+
+    async def entregues(clientes, limite):
+        # Espera todos os assinantes chegarem à última sequência
+        while (any(cliente.estado.ultima_sequencia < distribuidor.sequencia for cliente in clientes)
+               and time.perf_counter() < limite):
+            await asyncio.sleep(0.01)
+
+    async def publicar(clientes, taxa):
+        for cliente in clientes:
+            cliente.latencias.clear()
+        intervalo = 1 / taxa if taxa else 0.0
+        inicio = time.perf_counter()
+        for n in range(args.atualizacoes):
+            estacao = rng.randrange(len(boletins))
+            campos = boletins[estacao] = list(boletins[estacao])
+            novas = variantes[n % len(variantes)]
+            for zona in rng.sample(range(NUMERO_ZONAS), args.zonas):
+                campos[4 + zona] = novas[zona]
+            distribuidor.publicar([campos])
+            if intervalo:
+                espera = inicio + (n + 1) * intervalo - time.perf_counter()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+            elif n % 64 == 63:
+                await asyncio.sleep(0)
+        publicacao = time.perf_counter() - inicio
+        await entregues(clientes, time.perf_counter() + 30)
+        return publicacao, time.perf_counter() - inicio
+
+    async def principal():
+        iniciado = asyncio.Event()
+        servico = asyncio.ensure_future(distribuidor.executar(ao_iniciar=iniciado.set))
+        await iniciado.wait()
+        distribuidor.publicar(boletins)
+
+        porta = distribuidor.endereco[1]
+        clientes = [ClienteDifusao("127.0.0.1", porta) for _ in range(args.assinantes)]
+        thread = threading.Thread(target=asyncio.run, args=(assinantes(clientes),), daemon=True)
+        thread.start()
+        # As medidas só contam a partir do estado inicial entregue a todos
+        while distribuidor.assinantes < len(clientes):
+            await asyncio.sleep(0.01)
+        await entregues(clientes, time.perf_counter() + 30)
+
+        quadros = distribuidor.estatisticas.quadros
+        vazao = await publicar(clientes, 0)
+        quadros = distribuidor.estatisticas.quadros - quadros
+        taxa = args.taxa or max(1.0, args.atualizacoes / vazao[1] / 2)
+        latencia = await publicar(clientes, taxa)
+        for cliente in clientes:
+            cliente.parar()
+        distribuidor.parar()
+        await servico
+        return clientes, vazao, quadros, taxa, latencia
+
+    clientes, (publicacao, duracao), quadros, taxa, (publicacao_taxa, _) = asyncio.run(principal())
+    latencias = np.concatenate([np.fromiter(cliente.latencias, float) for cliente in clientes]) * 1000
+    estatisticas = distribuidor.estatisticas
+    lacunas = sum(cliente.estado.lacunas for cliente in clientes)
+    print(f"{args.assinantes} assinantes, {args.estacoes} estações, {args.atualizacoes} atualizações "
+          f"de {args.zonas} zonas")
+    print(f"vazão: publicação a {args.atualizacoes / publicacao:,.0f} atualizações/s; entrega a todos em "
+          f"{duracao:.2f} s ({args.atualizacoes / duracao:,.0f} atualizações/s, {quadros / duracao:,.0f} quadros/s), "
+          f"{duracao - publicacao:.2f} s delas esvaziando as filas")
+    print(f"latência a {args.atualizacoes / publicacao_taxa:,.0f} atualizações/s (pedido: {taxa:,.0f}):", end=" ")
+    if len(latencias):
+        p50, p99 = np.percentile(latencias, [50, 99])
+        print(f"p50 {p50:.2f} ms  p99 {p99:.2f} ms  máx {latencias.max():.2f} ms")
+    else:
+        print("sem amostras")
+    print(f"bytes por quadro: {estatisticas.bytes / max(1, estatisticas.quadros):.0f} "
+          f"(boletim completo: {len(codificar_delta(boletins[0])):d})")
+    print(f"ressincronizações: {estatisticas.ressincronizacoes}  atualizações não vistas: {lacunas}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distribui os boletins recebidos para vários assinantes.")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    p_servir = subparsers.add_parser("servir", help="recebe por UDP e distribui por TCP e multicast")
+    p_servir.add_argument("--porta", type=int, nargs="+", required=True, help="portas UDP dos boletins")
+    p_servir.add_argument("--host", default="")
+    p_servir.add_argument("--trabalhadores", type=int, default=1)
+    p_servir.add_argument("--tcp", type=int, help="porta TCP dos assinantes (padrão: a primeira porta UDP)")
+    p_servir.add_argument("--host-tcp", default="127.0.0.1")
+    p_servir.add_argument("--multicast", help=f"grupo:porta para repetir as atualizações (ex.: {GRUPO_MULTICAST}:5006)")
+    p_servir.add_argument("--intervalo-completo", type=float, default=INTERVALO_COMPLETO,
+                          help="segundos entre repetições do estado completo no multicast")
+    p_servir.add_argument("--fila", type=int, default=TAMANHO_FILA_ASSINANTE, help="quadros pendentes por assinante")
+    p_servir.add_argument("--banco", help="também grava os boletins neste banco")
+    p_servir.add_argument("--intervalo", type=float, default=5.0, help="segundos entre relatórios")
+    metricas.adicionar_argumentos(p_servir)
+    p_servir.set_defaults(funcao=servir)
+
+    p_medir = subparsers.add_parser("medir", help="mede latência e vazão com assinantes no loopback")
+    p_medir.add_argument("--assinantes", type=int, default=50)
+    p_medir.add_argument("--estacoes", type=int, default=100)
+    p_medir.add_argument("--atualizacoes", type=int, default=20000)
+    p_medir.add_argument("--zonas", type=int, default=4, help="zonas alteradas por atualização")
+    p_medir.add_argument("--taxa", type=float, default=0,
+                         help="atualizações por segundo na medida da latência (0: metade da vazão medida)")
+    p_medir.add_argument("--fila", type=int, default=TAMANHO_FILA_ASSINANTE)
+    p_medir.set_defaults(funcao=medir)
+
+    args = parser.parse_args(argv)
+    args.funcao(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Índice espacial dos boletins pela posição do cabeçalho (METCMQ + LaLaLaLoLoLo).
+
+As estações ficam em uma grade de células de 1 grau; a busca do vizinho
+mais próximo olha anéis de células em volta do ponto consultado até que
+nenhum anel mais distante possa ter uma estação mais perto, ou até o anel
+ter mais células que as ocupadas, quando varre só estas. Cada posição
+guarda seus boletins pelo início da validade, e a consulta usa, de cada
+estação, o de início mais recente que vale no instante pedido (o mesmo
+critério de mais_proximos_no_banco). Os que venceram há mais de `retencao`
+segundos são descartados, menos o último de cada estação, então o tamanho
+do índice acompanha o número de estações e não quantos boletins já
+passaram pelo armazém.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+
+from perfil import combinar, perfil_do_boletim
+from stanag import decodificar_posicao
+from validade import DURACAO_MAXIMA, MARGEM_REFERENCIA, boletim_valido, intervalo_validade
+
+RAIO_TERRA_KM = 6371.0
+KM_POR_GRAU = math.pi * RAIO_TERRA_KM / 180
+
+
+# Função para calcular a distância entre dois pontos (em graus)
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distância do grande círculo (fórmula de haversine)."""
+    fi1, fi2 = math.radians(lat1), math.radians(lat2)
+    dfi = fi2 - fi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dfi / 2) ** 2 + math.cos(fi1) * math.cos(fi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class IndiceEspacial:
+    def __init__(self, tamanho_celula=1.0, valido=boletim_valido, retencao=0, relogio=time.time):
+        self.tamanho_celula = tamanho_celula
+        self.valido = valido
+        self.retencao = retencao
+        self.relogio = relogio
+        self._celulas = defaultdict(dict)   # (linha, coluna) -> {chave: entrada}
+        self._entradas = {}                 # chave -> (lat, lon, versões)
+        self._lock = threading.Lock()
+
+    def _celula(self, lat, lon):
+        return (math.floor(lat / self.tamanho_celula),
+                math.floor((lon % 360) / self.tamanho_celula))
+
+    def adicionar(self, registro):
+        """
+        Indexa o boletim pela sua posição e pelo início da validade; um
+        boletim com o mesmo início substitui o recebido antes. Boletins sem
+        posição válida são ignorados. Pode ser registrada diretamente com
+        ArmazemBoletins.assinar.
+        """
+        metcmq, lalalalololo = registro.cabecalho[0], registro.cabecalho[1]
+        latitude, longitude = decodificar_posicao(metcmq, lalalalololo)
+        if latitude is None:
+            return
+        lat, lon = latitude / 10, longitude / 10
+        # Sem YYGoGoGoG válido, o boletim fica ordenado pelo recebimento
+        intervalo = intervalo_validade(registro.cabecalho[2], registro.recebido_em)
+        inicio, fim = intervalo if intervalo is not None else (registro.recebido_em, registro.recebido_em)
+        chave = registro.estacao
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                entrada = self._entradas[chave] = (lat, lon, [])
+                self._celulas[self._celula(lat, lon)][chave] = entrada
+            versoes = entrada[2]  # (início, fim, registro), por início
+            posicao = bisect_left(versoes, (inicio,))
+            if posicao < len(versoes) and versoes[posicao][0] == inicio:
+                if versoes[posicao][2].recebido_em > registro.recebido_em:
+                    return
+                versoes[posicao] = (inicio, fim, registro)
+            else:
+                versoes.insert(posicao, (inicio, fim, registro))
+            limite = self.relogio() - self.retencao
+            if versoes[0][1] < limite:
+                versoes[:-1] = [versao for versao in versoes[:-1] if versao[1] >= limite]
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def _vigente(self, versoes, instante):
+        # O de início mais recente entre os que valem no instante
+        for inicio, _, registro in reversed(versoes):
+            if inicio <= instante and self.valido(registro, instante):
+                return registro
+        return None
+
+    def mais_proximos(self, latitude, longitude, k=1, instante=None):
+        """
+        Retorna até k pares (distância em km, registro) dos boletins válidos
+        em `instante` (padrão: agora) mais próximos de latitude/longitude
+        (em graus), do mais perto para o mais longe.
+        """
+        instante = time.time() if instante is None else instante
+        linha0, coluna0 = self._celula(latitude, longitude)
+        colunas = round(360 / self.tamanho_celula)
+        # Linhas de célula que existem: de -90 a 90 graus de latitude
+        linhas = (math.floor(-90 / self.tamanho_celula), math.floor(90 / self.tamanho_celula))
+        encontrados = []
+        with self._lock:
+            for anel in range(colunas // 2 + 1):
+                # Anel com mais células que as ocupadas (ou que já dá a volta
+                # nas longitudes): sai mais barato varrer só as ocupadas
+                varredura = 8 * anel > len(self._celulas) or 2 * anel >= colunas
+                if varredura:
+                    encontrados = []
+                    celulas = self._celulas.values()
+                else:
+                    celulas = (self._celulas.get((linha, coluna % colunas), {})
+                               for linha, coluna in self._anel(linha0, coluna0, anel, *linhas))
+                for celula in celulas:
+                    for lat, lon, versoes in celula.values():
+                        registro = self._vigente(versoes, instante)
+                        if registro is not None:
+                            encontrados.append((distancia_km(latitude, longitude, lat, lon), registro))
+                if varredura:
+                    break
+                if len(encontrados) >= k:
+                    encontrados.sort(key=lambda par: par[0])
+                    del encontrados[k:]
+                    # Nenhuma célula do próximo anel fica mais perto que isto
+                    latitude_pior = min(89.9, abs(latitude) + (anel + 1) * self.tamanho_celula)
+                    alcance = anel * self.tamanho_celula * KM_POR_GRAU * math.cos(math.radians(latitude_pior))
+                    if encontrados[-1][0] <= alcance:
+                        break
+        encontrados.sort(key=lambda par: par[0])
+        return encontrados[:k]
+
+    @staticmethod
+    def _anel(linha0, coluna0, anel, linha_min, linha_max):
+        # Células do anel, sem as linhas além dos polos
+        if anel == 0:
+            yield linha0, coluna0
+            return
+        for linha in (linha0 - anel, linha0 + anel):
+            if linha_min <= linha <= linha_max:
+                for deslocamento in range(-anel, anel + 1):
+                    yield linha, coluna0 + deslocamento
+        for linha in range(max(linha0 - anel + 1, linha_min), min(linha0 + anel, linha_max + 1)):
+            yield linha, coluna0 - anel
+            yield linha, coluna0 + anel
+
+    def mais_proximo(self, latitude, longitude, altura=None, instante=None):
+        """
+        Retorna (registro, distância em km, valores na altura) do boletim
+        válido mais próximo, ou None. Os valores vêm do perfil vertical
+        interpolado (perfil.DTYPE_PERFIL) e só são calculados se `altura`
+        for informada.
+        """
+        vizinhos = self.mais_proximos(latitude, longitude, 1, instante)
+        if not vizinhos:
+            return None
+        distancia, registro = vizinhos[0]
+        valores = perfil_do_boletim(registro).em(altura) if altura is not None else None
+        return registro, distancia, valores
+
+    def interpolar(self, latitude, longitude, altura, k=4, potencia=2, instante=None):
+        """
+        Combina os k boletins válidos mais próximos pelo inverso da distância
+        elevado a `potencia`, na altura informada. O vento é combinado pelas
+        componentes u/v. Retorna um registro perfil.DTYPE_PERFIL ou None.
+        """
+        vizinhos = self.mais_proximos(latitude, longitude, k, instante)
+        if not vizinhos:
+            return None
+        if vizinhos[0][0] < 1e-6:
+            return perfil_do_boletim(vizinhos[0][1]).em(altura)
+
+        valores = np.concatenate([perfil_do_boletim(registro).consultar(altura) for _, registro in vizinhos])
+        return combinar(valores, [distancia ** -potencia for distancia, _ in vizinhos])
+
+
+# Consulta equivalente direto no banco (BancoDados), usando idx_boletim_posicao;
+# a validade é conferida depois, pelo YYGoGoGoG de cada candidato
+SQL_PROXIMOS = """
+    SELECT id, METCMQ, LaLaLaLoLoLo, YYGoGoGoG, salvo_em, latitude, longitude FROM boletim
+    WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+      AND salvo_em BETWEEN ? AND ?
+"""
+
+
+def mais_proximos_no_banco(bd, latitude, longitude, k=1, instante=None, raio_inicial=1.0):
+    """
+    Retorna até k pares (distância em km, id) dos boletins gravados mais
+    próximos de latitude/longitude (em graus) e válidos em `instante`, pelo
+    mesmo critério de validade.boletim_valido (com salvo_em no lugar do
+    recebimento); de cada estação vale o boletim de início mais recente. A
+    caixa de busca começa com `raio_inicial` graus e dobra até achar k
+    estações que nenhuma caixa maior poderia superar. Os campos dos
+    boletins podem ser lidos com bd.carregar_boletins(ids).
+    """
+    instante = time.time() if instante is None else instante
+    # Só boletins salvos perto do instante podem ter a validade cobrindo-o
+    recebidos = (math.floor(instante - DURACAO_MAXIMA - MARGEM_REFERENCIA), math.ceil(instante + MARGEM_REFERENCIA))
+    raio = raio_inicial
+    while True:
+        # Perto dos polos ou do antimeridiano a caixa cobre todas as longitudes
+        cos_lat = math.cos(math.radians(min(89.9, abs(latitude) + raio)))
+        raio_lon = raio / cos_lat
+        if raio_lon >= 180 or abs(longitude) + raio_lon > 180:
+            lon_min, lon_max = -1800, 1800
+        else:
+            lon_min, lon_max = math.floor((longitude - raio_lon) * 10), math.ceil((longitude + raio_lon) * 10)
+        linhas = bd.consultar(SQL_PROXIMOS, (
+            math.floor((latitude - raio) * 10), math.ceil((latitude + raio) * 10),
+            lon_min, lon_max, *recebidos,
+        ))
+        por_estacao = {}
+        for boletim_id, metcmq, lalalalololo, yygogogog, salvo_em, lat, lon in linhas:
+            intervalo = intervalo_validade(yygogogog, salvo_em)
+            if intervalo is None or not intervalo[0] <= instante <= intervalo[1]:
+                continue
+            estacao = (metcmq[5:], lalalalololo)
+            if estacao not in por_estacao or por_estacao[estacao][0] < (intervalo[0], boletim_id):
+                por_estacao[estacao] = ((intervalo[0], boletim_id), lat, lon)
+        encontrados = sorted(
+            (distancia_km(latitude, longitude, lat / 10, lon / 10), chave[1])
+            for chave, lat, lon in por_estacao.values()
+        )[:k]
+        # Tudo a menos de `raio` graus de latitude já está dentro da caixa
+        if raio >= 180 or (len(encontrados) == k and encontrados[-1][0] <= raio * KM_POR_GRAU):
+            return encontrados
+        raio *= 2
@@ -0,0 +1,142 @@
+"""
+Gerador de boletins STANAG 4082 sintéticos, com perfis plausíveis, para
+testes e benchmarks.
+
+gerar_boletim e gerar_boletins sorteiam cada boletim de forma
+independente. Para tráfego realista, EstacaoSimulada mantém o estado da
+atmosfera de uma estação, que evolui aos poucos entre um boletim e outro,
+e gerar_trafego intercala os boletins de muitas estações em ordem de tempo
+(carga.py usa esse tráfego para testar o receptor).
+"""
+import heapq
+import math
+import random
+
+from stanag import INTERVALOS_ZONAS, NUMERO_ZONAS
+from validade import codificar_validade
+
+
+# Função para gerar as 32 zonas de um perfil atmosférico plausível
+def gerar_zonas(rng=random):
+    """
+    Temperatura caindo ~6,5 K/km até a tropopausa (11 km), pressão caindo
+    exponencialmente e vento aumentando com a altura.
+    """
+    temperatura_superficie = rng.uniform(270.0, 310.0)
+    pressao_superficie = rng.uniform(990.0, 1030.0)
+    direcao_base = rng.randrange(6400)
+    velocidade_base = rng.uniform(2.0, 20.0)
+    return _zonas_do_perfil(rng, temperatura_superficie, pressao_superficie, direcao_base, velocidade_base)
+
+
+def _zonas_do_perfil(rng, temperatura_superficie, pressao_superficie, direcao_base, velocidade_base):
+    zonas = []
+    for zona in range(NUMERO_ZONAS):
+        minimo, maximo = INTERVALOS_ZONAS[zona]
+        altura = (minimo + maximo) / 2
+        temperatura = temperatura_superficie - 0.0065 * min(altura, 11000)
+        pressao = pressao_superficie * 2.718281828 ** (-altura / 8000)
+        direcao = (direcao_base + int(altura / 50) + rng.randrange(-50, 51)) % 6400
+        velocidade = velocidade_base * (1 + altura / 6000) + rng.uniform(-2.0, 2.0)
+        zonas.append(f"{zona:02d}{direcao // 10:03d}{min(999, max(0, round(velocidade))):03d}"
+                     f"{round(temperatura * 10):04d}{min(9999, round(pressao)):04d}")
+    return zonas
+
+
+# Função para gerar o cabeçalho de um boletim
+def gerar_cabecalho(rng=random, latitude=None, longitude=None):
+    """
+    Gera os 4 grupos do cabeçalho para uma posição no octante 5 (sul, oeste
+    até 90°, como o Brasil); latitude e longitude em décimos de grau.
+    """
+    latitude = rng.randrange(0, 900) if latitude is None else latitude
+    longitude = rng.randrange(0, 900) if longitude is None else longitude
+    dia = rng.randrange(1, 29)
+    hora = rng.randrange(0, 240)
+    return [
+        "METCM5",
+        f"{latitude:03d}{longitude:03d}",
+        f"{dia:02d}{hora:03d}{rng.randrange(1, 10)}",
+        f"{rng.randrange(0, 100):03d}{rng.randrange(0, 30):03d}",
+    ]
+
+
+# Função para gerar um boletim completo (36 campos)
+def gerar_boletim(rng=random, latitude=None, longitude=None):
+    return gerar_cabecalho(rng, latitude, longitude) + gerar_zonas(rng)
+
+
+# Função para gerar vários boletins reprodutíveis a partir de uma semente
+def gerar_boletins(quantidade, semente=0):
+    rng = random.Random(semente)
+    return [gerar_boletim(rng) for _ in range(quantidade)]
+
+
+class EstacaoSimulada:
+    """
+    Estação em uma posição fixa cujo perfil evolui com o tempo: a
+    temperatura da superfície oscila com o ciclo diário e faz um passeio
+    aleatório em volta da média da estação, a pressão passeia devagar e o
+    vento gira e muda de intensidade aos poucos. Boletins seguidos da mesma
+    estação ficam parecidos, como os de uma estação real.
+    """
+
+    def __init__(self, rng, latitude, longitude, duracao_validade=6):
+        self.rng = rng
+        self.latitude = latitude
+        self.longitude = longitude
+        self.duracao_validade = duracao_validade
+        self.altitude = rng.randrange(0, 1000)
+        self.temperatura_media = rng.uniform(275.0, 305.0)
+        self.fase = rng.uniform(0, 2 * math.pi)
+        self.anomalia = 0.0
+        self.pressao = rng.uniform(995.0, 1025.0)
+        self.direcao = rng.uniform(0, 6400)
+        self.velocidade = rng.uniform(2.0, 20.0)
+        self.instante = None
+
+    def evoluir(self, instante):
+        """Avança o estado até `instante` (segundos desde 1970)."""
+        horas = 0.0 if self.instante is None else max(instante - self.instante, 0) / 3600
+        self.instante = instante
+        passo = math.sqrt(horas)
+        rng = self.rng
+        # Passeios aleatórios com retorno à média (a anomalia e a pressão não fogem)
+        self.anomalia += -0.1 * horas * self.anomalia + rng.gauss(0, 0.5) * passo
+        self.pressao += 0.02 * horas * (1013.0 - self.pressao) + rng.gauss(0, 0.8) * passo
+        self.direcao = (self.direcao + rng.gauss(0, 150) * passo) % 6400
+        self.velocidade = min(max(self.velocidade + rng.gauss(0, 1.5) * passo, 0.5), 40.0)
+
+    def boletim(self, instante):
+        """Evolui até `instante` e devolve o boletim (36 campos) emitido nele."""
+        self.evoluir(instante)
+        ciclo = 5.0 * math.sin(2 * math.pi * instante / 86400 + self.fase)
+        temperatura = self.temperatura_media + ciclo + self.anomalia
+        cabecalho = [
+            "METCM5",
+            f"{self.latitude:03d}{self.longitude:03d}",
+            codificar_validade(instante, self.duracao_validade),
+            f"{self.altitude // 10:03d}{round(self.pressao) % 1000:03d}",
+        ]
+        return cabecalho + _zonas_do_perfil(self.rng, temperatura, self.pressao,
+                                            int(self.direcao), self.velocidade)
+
+
+# Função para gerar o tráfego de várias estações em ordem de tempo
+def gerar_trafego(estacoes, inicio, duracao, intervalo, semente=0):
+    """
+    Gera (instante, boletim) de `estacoes` estações simuladas, cada uma
+    emitindo a cada `intervalo` segundos entre `inicio` e `inicio + duracao`,
+    com os horários das estações espalhados dentro do intervalo.
+    """
+    rng = random.Random(semente)
+    posicoes = rng.sample(range(900 * 900), estacoes)
+    fila = []
+    for posicao in posicoes:
+        estacao = EstacaoSimulada(random.Random(rng.random()), *divmod(posicao, 900))
+        fila.append((inicio + rng.uniform(0, intervalo), len(fila), estacao))
+    heapq.heapify(fila)
+    while fila and fila[0][0] < inicio + duracao:
+        instante, ordem, estacao = fila[0]
+        yield instante, estacao.boletim(instante)
+        heapq.heapreplace(fila, (instante + intervalo, ordem, estacao))
@@ -0,0 +1,328 @@
+"""
+Métricas dos caminhos críticos: recepção, decodificação, gravação e consulta.
+
+Os módulos registram contadores e histogramas de latência no REGISTRO
+global, sem dependências externas. Incrementar um contador ou observar uma
+latência custa um lock e, no histograma, uma busca binária nos limites dos
+baldes, então a instrumentação pode ficar ligada em produção. Nos caminhos
+em que até isso pesa (uma consulta por altura leva poucos microssegundos),
+o tempo só é medido com `ativas` verdadeiro, o que acontece quando alguém
+passa a ler as métricas (ServidorMetricas ou despejar_periodicamente). Valores que
+já existem em outro lugar (as estatísticas do receptor, o tamanho das
+filas) são lidos só quando as métricas são coletadas.
+
+As métricas podem ser lidas:
+    - no formato de texto do Prometheus, por HTTP (ServidorMetricas, em
+      http://127.0.0.1:PORTA/metrics);
+    - em um resumo legível escrito periodicamente (despejar_periodicamente).
+
+PerfilAmostrado liga o cProfile em uma fração das execuções de uma função
+(os lotes do receptor, por exemplo) e acumula as estatísticas.
+"""
+import cProfile
+import io
+import pstats
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ligado por ativar(); os caminhos mais quentes só medem o tempo com ele
+ativas = False
+
+# Limites dos baldes dos histogramas de latência, em segundos
+LIMITES_SEGUNDOS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+class Contador:
+    """Valor que só cresce (eventos, boletins, bytes)."""
+
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self.ajuda = ajuda
+        self._valor = 0
+        self._lock = threading.Lock()
+
+    def incrementar(self, quantidade=1):
+        with self._lock:
+            self._valor += quantidade
+
+    @property
+    def valor(self):
+        return self._valor
+
+    def amostras(self):
+        yield self.nome, "", self._valor
+
+
+class Histograma:
+    """Distribuição de valores (latências) em baldes cumulativos, como no Prometheus."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, limites=LIMITES_SEGUNDOS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.limites = tuple(limites)
+        self._contagens = [0] * (len(self.limites) + 1)
+        self._soma = 0.0
+        self._lock = threading.Lock()
+
+    def observar(self, valor):
+        i = bisect_left(self.limites, valor)
+        with self._lock:
+            self._contagens[i] += 1
+            self._soma += valor
+
+    @property
+    def total(self):
+        return sum(self._contagens)
+
+    def percentil(self, p):
+        """Estimativa do percentil p (0 a 100): o limite do balde em que ele cai."""
+        with self._lock:
+            contagens = list(self._contagens)
+        total = sum(contagens)
+        if not total:
+            return None
+        alvo = p / 100 * total
+        acumulado = 0
+        for limite, contagem in zip(self.limites + (float("inf"),), contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return limite
+        return float("inf")
+
+    def amostras(self):
+        with self._lock:
+            contagens, soma = list(self._contagens), self._soma
+        acumulado = 0
+        for limite, contagem in zip(self.limites, contagens):
+            acumulado += contagem
+            yield self.nome + "_bucket", f'le="{limite:g}"', acumulado
+        acumulado += contagens[-1]
+        yield self.nome + "_bucket", 'le="+Inf"', acumulado
+        yield self.nome + "_sum", "", soma
+        yield self.nome + "_count", "", acumulado
+
+
+class Coletado:
+    """Métrica lida de uma função na hora da coleta (tamanho de fila, contadores existentes)."""
+
+    def __init__(self, nome, ajuda, funcao, tipo="gauge"):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self.tipo = tipo
+
+    @property
+    def valor(self):
+        return self.funcao()
+
+    def amostras(self):
+        yield self.nome, "", self.funcao()
+
+
+class RegistroMetricas:
+    """Conjunto de métricas pelo nome. Pedir de novo uma métrica existente devolve a mesma."""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _obter(self, classe, nome, *argumentos):
+        with self._lock:
+            metrica = self._metricas.get(nome)
+            if metrica is None:
+                metrica = self._metricas[nome] = classe(nome, *argumentos)
+            return metrica
+
+    def contador(self, nome, ajuda):
+        return self._obter(Contador, nome, ajuda)
+
+    def histograma(self, nome, ajuda, limites=LIMITES_SEGUNDOS):
+        return self._obter(Histograma, nome, ajuda, limites)
+
+    def coletar(self, nome, ajuda, funcao, tipo="gauge"):
+        """Registra (ou substitui, se o nome já existir) uma métrica lida de `funcao`."""
+        with self._lock:
+            self._metricas[nome] = Coletado(nome, ajuda, funcao, tipo)
+
+    def __getitem__(self, nome):
+        return self._metricas[nome]
+
+    def metricas(self):
+        with self._lock:
+            return sorted(self._metricas.values(), key=lambda metrica: metrica.nome)
+
+    def texto(self):
+        """Todas as métricas no formato de texto do Prometheus."""
+        linhas = []
+        for metrica in self.metricas():
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            for nome, rotulos, valor in metrica.amostras():
+                linhas.append(f"{nome}{{{rotulos}}} {valor:g}" if rotulos else f"{nome} {valor:g}")
+        return "\n".join(linhas) + "\n"
+
+    def resumo(self):
+        """Uma linha por métrica; os histogramas com contagem, média, p50 e p99."""
+        linhas = []
+        for metrica in self.metricas():
+            if isinstance(metrica, Histograma):
+                total = metrica.total
+                if not total:
+                    continue
+                media = metrica._soma / total
+                linhas.append(f"{metrica.nome}: n={total} média={media * 1e6:.1f} µs "
+                              f"p50<={metrica.percentil(50) * 1e6:g} µs p99<={metrica.percentil(99) * 1e6:g} µs")
+            else:
+                linhas.append(f"{metrica.nome}: {metrica.valor:g}")
+        return "\n".join(linhas)
+
+
+REGISTRO = RegistroMetricas()
+contador = REGISTRO.contador
+histograma = REGISTRO.histograma
+coletar = REGISTRO.coletar
+
+
+# Função para ligar a medição de tempo nos caminhos mais quentes
+def ativar():
+    global ativas
+    ativas = True
+
+
+class _TratadorMetricas(BaseHTTPRequestHandler):
+    registro = REGISTRO
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        corpo = self.registro.texto().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *argumentos):
+        pass
+
+
+class ServidorMetricas:
+    """Servidor HTTP local com as métricas em /metrics, em uma thread própria."""
+
+    def __init__(self, porta, host="127.0.0.1", registro=REGISTRO):
+        tratador = type("Tratador", (_TratadorMetricas,), {"registro": registro})
+        self._servidor = ThreadingHTTPServer((host, porta), tratador)
+        self._servidor.daemon_threads = True
+        self.endereco = self._servidor.server_address
+        self._thread = None
+
+    def iniciar(self):
+        ativar()
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# Função para escrever o resumo das métricas a cada `intervalo` segundos
+def despejar_periodicamente(intervalo, arquivo=sys.stderr, registro=REGISTRO):
+    """Roda em uma thread própria; retorna um threading.Event que a encerra."""
+    ativar()
+    parar = threading.Event()
+
+    def despejar():
+        while not parar.wait(intervalo):
+            print(f"--- métricas {time.strftime('%H:%M:%S')}\n{registro.resumo()}", file=arquivo, flush=True)
+
+    threading.Thread(target=despejar, daemon=True).start()
+    return parar
+
+
+class PerfilAmostrado:
+    """
+    Roda uma fração `taxa` das chamadas de executar() sob o cProfile. As
+    estatísticas se acumulam entre as amostras; salvar() grava o arquivo
+    .prof (para o pstats ou o snakeviz) e relatorio() devolve as funções
+    mais caras em texto. Só mede a thread que chama executar().
+    """
+
+    def __init__(self, taxa, arquivo=None):
+        self.taxa = taxa
+        self.arquivo = arquivo
+        self.amostras = 0
+        self._perfil = cProfile.Profile()
+        self._sorteio = random.Random()
+
+    def executar(self, funcao, *argumentos):
+        if self._sorteio.random() >= self.taxa:
+            return funcao(*argumentos)
+        self.amostras += 1
+        self._perfil.enable()
+        try:
+            return funcao(*argumentos)
+        finally:
+            self._perfil.disable()
+
+    def salvar(self, arquivo=None):
+        arquivo = arquivo or self.arquivo
+        if arquivo is not None and self.amostras:
+            self._perfil.dump_stats(arquivo)
+        return arquivo
+
+    def relatorio(self, linhas=20, ordem="cumulative"):
+        if not self.amostras:
+            return "Nenhuma amostra de perfil."
+        saida = io.StringIO()
+        pstats.Stats(self._perfil, stream=saida).sort_stats(ordem).print_stats(linhas)
+        return f"{self.amostras} amostras\n{saida.getvalue()}"
+
+
+# Função para acrescentar as opções de métricas a uma linha de comando
+def adicionar_argumentos(parser):
+    grupo = parser.add_argument_group("métricas")
+    grupo.add_argument("--metricas", type=int, metavar="PORTA",
+                       help="serve as métricas (formato Prometheus) em http://127.0.0.1:PORTA/metrics")
+    grupo.add_argument("--despejo", type=float, metavar="SEGUNDOS",
+                       help="escreve o resumo das métricas no stderr a cada SEGUNDOS")
+    grupo.add_argument("--perfil", type=float, metavar="TAXA",
+                       help="roda esta fração dos lotes sob o cProfile (ex.: 0.01)")
+    grupo.add_argument("--perfil-arquivo", help="grava o perfil neste arquivo .prof ao sair")
+
+
+# Função para ligar o que as opções de adicionar_argumentos pediram
+def iniciar_pela_linha_de_comando(args):
+    """Retorna (PerfilAmostrado ou None, função que encerra tudo e mostra o perfil)."""
+    servidor = ServidorMetricas(args.metricas).iniciar() if args.metricas is not None else None
+    despejo = despejar_periodicamente(args.despejo) if args.despejo else None
+    perfil = PerfilAmostrado(args.perfil, args.perfil_arquivo) if args.perfil else None
+
+    def encerrar():
+        if servidor is not None:
+            servidor.parar()
+        if despejo is not None:
+            despejo.set()
+        if perfil is not None:
+            arquivo = perfil.salvar()
+            print(perfil.relatorio(), file=sys.stderr)
+            if arquivo is not None and perfil.amostras:
+                print(f"Perfil gravado em {arquivo}", file=sys.stderr)
+
+    return perfil, encerrar
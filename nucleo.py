@@ -0,0 +1,134 @@
+"""
+Lógica do app de consulta (aplicativo2) sem nenhuma dependência do Kivy:
+armazenamento dos boletins recebidos, decodificação das zonas e busca por
+altura. Pode ser importado por ferramentas, benchmarks e serviços sem
+interface gráfica.
+"""
+import time
+
+import metricas
+from stanag import zona_para_altura, ZONA_INVALIDA
+from decodificador import decodificar_zona
+from armazem import ArmazemBoletins, MAX_BOLETINS
+from cache_zonas import CacheDecodificacao
+from espacial import IndiceEspacial
+from validade import IndiceValidade, intervalo_validade
+
+# Boletins recebidos, guardados na memória com retenção limitada; os antigos
+# de cada estação ficam só com as zonas que mudaram (modo compacto)
+boletins_salvos = ArmazemBoletins(max_boletins=MAX_BOLETINS, compacto=True)
+
+# Métricas dos caminhos críticos (ver metricas.py)
+boletins_processados = metricas.contador("stanag_boletins_processados_total", "Boletins guardados no armazém")
+tempo_armazenamento = metricas.histograma(
+    "stanag_armazenamento_segundos", "Tempo para guardar um boletim e atualizar os índices")
+tempo_decodificacao = metricas.histograma(
+    "stanag_decodificacao_zona_segundos", "Tempo para decodificar e formatar uma zona (falhas do cache)")
+# (o _count do histograma de consultas já é o número de consultas)
+tempo_consulta = metricas.histograma("stanag_consulta_segundos", "Tempo de uma consulta por altura")
+metricas.coletar("stanag_armazem_boletins", "Boletins guardados no armazém", lambda: len(boletins_salvos))
+
+# Função para processar e salvar o boletim na memória
+def processar_boletim(dados_boletim):
+    """
+    Processa a mensagem recebida, guardando o cabeçalho e as zonas no armazém de boletins.
+    """
+    inicio = time.perf_counter()
+    boletins_salvos.adicionar(dados_boletim)
+    tempo_armazenamento.observar(time.perf_counter() - inicio)
+    boletins_processados.incrementar()
+
+# Função para decodificar a string da zona
+def decodificar_dados_zona(zona_dados):
+    inicio = time.perf_counter()
+    try:
+        return _decodificar_dados_zona(zona_dados)
+    finally:
+        tempo_decodificacao.observar(time.perf_counter() - inicio)
+
+def _decodificar_dados_zona(zona_dados):
+    #zona_dados = boletins_salvos.ultimo().zonas[zona]
+    registro = decodificar_zona(zona_dados)
+    if registro is None:
+        return [(f"Erro na decodificação dos dados: zona inválida '{zona_dados}'", "alert")]
+
+    return [
+        (f"Zona: {registro['zona']:02d}", "map-marker"),
+        (f"Direção do Vento: {registro['direcao_vento']} mils", "compass"),
+        (f"Velocidade do Vento: {registro['velocidade_vento']} nós", "weather-windy"),
+        (f"Temperatura Virtual: {registro['temperatura']:.1f} K", "thermometer"),
+        (f"Pressão do Ar: {registro['pressao']} mb", "gauge")
+    ]
+
+# Zonas já decodificadas (e formatadas para exibição) de cada boletim;
+# o cache descarta as do boletim anterior quando chega um novo da mesma posição
+cache_zonas = CacheDecodificacao(decodificar=decodificar_dados_zona)
+boletins_salvos.assinar(cache_zonas.substituir)
+metricas.coletar("stanag_cache_zonas_acertos_total", "Zonas servidas pelo cache",
+                 lambda: cache_zonas.acertos, "counter")
+metricas.coletar("stanag_cache_zonas_falhas_total", "Zonas que precisaram ser decodificadas",
+                 lambda: cache_zonas.falhas, "counter")
+
+# Boletins de cada estação pela posição do cabeçalho e pela validade; como no
+# índice de validade, os vencidos há mais de um dia são descartados
+indice_espacial = IndiceEspacial(retencao=24 * 3600)
+boletins_salvos.assinar(indice_espacial.adicionar)
+
+# Intervalos de validade (YYGoGoGoG) dos boletins recebidos; os vencidos há
+# mais de um dia são descartados
+indice_validade = IndiceValidade(retencao=24 * 3600)
+boletins_salvos.assinar(indice_validade.adicionar)
+
+# Função para escolher o boletim que vale no instante pedido (padrão: agora)
+def boletim_vigente(instante=None):
+    boletim = indice_validade.vigente(instante)
+    if boletim is not None:
+        return boletim
+    # Remetentes antigos não preenchem YYGoGoGoG; nesse caso vale o último recebido
+    boletim = boletins_salvos.ultimo()
+    if boletim is not None and intervalo_validade(boletim.cabecalho[2], boletim.recebido_em) is None:
+        return boletim
+    return None
+
+# Função para buscar dados de uma zona com base na altura
+def buscar_dados_altura(altura_str, instante=None):
+    # A consulta é curta demais para medir sempre: só com as métricas sendo lidas
+    if not metricas.ativas:
+        return _buscar_dados_altura(altura_str, instante)
+    inicio = time.perf_counter()
+    try:
+        return _buscar_dados_altura(altura_str, instante)
+    finally:
+        tempo_consulta.observar(time.perf_counter() - inicio)
+
+def _buscar_dados_altura(altura_str, instante=None):
+    boletim = boletim_vigente(instante)
+    if boletim is None:
+        if len(boletins_salvos):
+            return [("Nenhum boletim válido para o horário consultado.", "alert")]
+        return [("Nenhum boletim foi recebido ainda.", "alert")]
+
+    try:
+        altura = int(altura_str) #parametro recebido em buscar_dados_altura -> garanto que é inteiro
+        zona = zona_para_altura(altura)
+
+        if zona != ZONA_INVALIDA and boletim.zonas[zona]:
+            return cache_zonas.obter(boletim, zona)
+        else:
+            return [("Altura fora do intervalo suportado ou dados não disponíveis.", "alert")]
+    except ValueError:
+        return [("Por favor, insira uma altura válida em metros.", "alert")]
+
+# Função para listar todas as zonas preenchidas do boletim vigente
+def buscar_perfil_completo(instante=None):
+    boletim = boletim_vigente(instante)
+    if boletim is None:
+        if len(boletins_salvos):
+            return [("Nenhum boletim válido para o horário consultado.", "alert")]
+        return [("Nenhum boletim foi recebido ainda.", "alert")]
+
+    resultado = []
+    for zona, texto in enumerate(boletim.zonas):
+        if texto:
+            resultado.extend(cache_zonas.obter(boletim, zona))
+    return resultado or [("O boletim vigente não tem zonas preenchidas.", "alert")]
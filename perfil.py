@@ -0,0 +1,125 @@
+"""
+Perfil vertical contínuo montado a partir das 32 zonas de um boletim.
+
+Os valores de cada zona são médias da camada, então cada um é posicionado
+na altura média da sua zona (a zona 0, de superfície, fica em 0 m). Entre
+esses pontos:
+    - temperatura e pressão são interpoladas linearmente na altura; com
+      log_pressao=True a pressão é interpolada em ln(P), o que acompanha
+      melhor a queda exponencial da pressão com a altura;
+    - o vento é interpolado nas componentes u/v e depois convertido de volta
+      para direção (mils) e velocidade (nós), evitando o erro de interpolar
+      direções perto de 0/6400 mils.
+Fora das alturas médias (de 0 m até a primeira zona válida e até o topo da
+última), o valor da zona da ponta é mantido constante. Os arrays são
+calculados uma única vez por boletim; cada consulta é uma busca binária
+(np.interp), em lote para muitas alturas de uma vez.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from decodificador import decodificar_zonas, empacotar_zonas
+from stanag import INTERVALOS_ZONAS, LIMITES_ZONAS
+
+MILS_POR_VOLTA = 6400
+
+# Altura representativa de cada zona
+ALTURAS_ZONAS = np.array([(minimo + maximo) / 2 for minimo, maximo in INTERVALOS_ZONAS])
+
+DTYPE_PERFIL = np.dtype([
+    ("altura", np.float64),            # m
+    ("direcao_vento", np.float64),     # mils
+    ("velocidade_vento", np.float64),  # nós
+    ("temperatura", np.float64),       # K
+    ("pressao", np.float64),           # mb
+])
+
+
+class PerfilVertical:
+    def __init__(self, zonas, log_pressao=False):
+        """
+        `zonas` são as 32 strings de zona do boletim; zonas vazias ou
+        inválidas são ignoradas e o perfil interpola por cima delas.
+        """
+        registros, validos = decodificar_zonas(empacotar_zonas(zonas))
+        registros, validos = registros[0], validos[0]
+        if not validos.any():
+            raise ValueError("O boletim não tem nenhuma zona válida.")
+
+        self.log_pressao = log_pressao
+        self.alturas = ALTURAS_ZONAS[validos]
+        self.altura_maxima = LIMITES_ZONAS[np.flatnonzero(validos)[-1]]
+        validas = registros[validos]
+        angulo = validas["direcao_vento"] * (2 * np.pi / MILS_POR_VOLTA)
+        velocidade = validas["velocidade_vento"].astype(np.float64)
+        # Direção meteorológica: de onde o vento vem
+        self.u = -velocidade * np.sin(angulo)
+        self.v = -velocidade * np.cos(angulo)
+        self.temperatura = validas["temperatura"].astype(np.float64)
+        pressao = validas["pressao"].astype(np.float64)
+        self.pressao = np.log(pressao) if log_pressao else pressao
+
+    @classmethod
+    def de_boletim(cls, boletim, log_pressao=False):
+        return cls(boletim.zonas, log_pressao)
+
+    def consultar(self, alturas):
+        """
+        Interpola o perfil em uma lista ou array de alturas (m) e retorna um
+        array DTYPE_PERFIL. Alturas abaixo de 0 m ou acima do topo da zona
+        válida mais alta saem com NaN.
+        """
+        alturas = np.atleast_1d(np.asarray(alturas, dtype=np.float64))
+        resultado = np.empty(alturas.shape, dtype=DTYPE_PERFIL)
+        resultado["altura"] = alturas
+        fora = (alturas < 0) | (alturas > self.altura_maxima)
+
+        def interpolar(valores):
+            return np.where(fora, np.nan, np.interp(alturas, self.alturas, valores))
+
+        u, v = interpolar(self.u), interpolar(self.v)
+        resultado["velocidade_vento"] = np.hypot(u, v)
+        resultado["direcao_vento"] = np.mod(np.arctan2(-u, -v), 2 * np.pi) * (MILS_POR_VOLTA / (2 * np.pi))
+        resultado["temperatura"] = interpolar(self.temperatura)
+        pressao = interpolar(self.pressao)
+        resultado["pressao"] = np.exp(pressao) if self.log_pressao else pressao
+        return resultado
+
+    def em(self, altura):
+        """Interpola o perfil em uma única altura e retorna o registro."""
+        return self.consultar(altura)[0]
+
+
+# Perfis dos boletins consultados recentemente, montados uma vez por boletim
+@lru_cache(maxsize=64)
+def perfil_do_boletim(boletim, log_pressao=False):
+    return PerfilVertical.de_boletim(boletim, log_pressao)
+
+
+# Função para combinar valores de vários perfis na mesma altura
+def combinar(valores, pesos):
+    """
+    Média ponderada de registros DTYPE_PERFIL (por exemplo, de boletins de
+    estações ou horários diferentes). Os pesos são normalizados e registros
+    com NaN (fora do perfil) ficam de fora; o vento é combinado pelas
+    componentes u/v. Retorna um registro DTYPE_PERFIL, ou None se nenhum
+    registro tiver valores.
+    """
+    valores = np.asarray(valores, dtype=DTYPE_PERFIL)
+    pesos = np.asarray(pesos, dtype=np.float64)
+    validos = ~np.isnan(valores["temperatura"])
+    if not validos.any() or not pesos[validos].sum():
+        return None
+    valores, pesos = valores[validos], pesos[validos] / pesos[validos].sum()
+
+    angulo = valores["direcao_vento"] * (2 * np.pi / MILS_POR_VOLTA)
+    u = np.dot(pesos, -valores["velocidade_vento"] * np.sin(angulo))
+    v = np.dot(pesos, -valores["velocidade_vento"] * np.cos(angulo))
+    resultado = np.zeros((), dtype=DTYPE_PERFIL)
+    resultado["altura"] = np.dot(pesos, valores["altura"])
+    resultado["velocidade_vento"] = np.hypot(u, v)
+    resultado["direcao_vento"] = np.mod(np.arctan2(-u, -v), 2 * np.pi) * (MILS_POR_VOLTA / (2 * np.pi))
+    resultado["temperatura"] = np.dot(pesos, valores["temperatura"])
+    resultado["pressao"] = np.dot(pesos, valores["pressao"])
+    return resultado[()]
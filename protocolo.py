@@ -0,0 +1,250 @@
+"""
+Formato de transmissão dos boletins STANAG 4082 por UDP.
+
+Todo quadro começa com o byte MAGIA, a versão e o comprimento total do
+quadro, e termina com o CRC-32 de todos os bytes anteriores:
+
+    versão 0 (VERSAO_TEXTO)   - os campos em texto, um por linha
+    versão 1 (VERSAO_BINARIA) - layout fixo de 324 bytes:
+        B   magia          B   versão        H  comprimento
+        24s cabeçalho (METCMQ, LaLaLaLoLoLo, YYGoGoGoG, hhhPdPdPd, 6 bytes cada)
+        I   máscara das zonas presentes (bit i = zona i)
+        32 x (B zona, H direção em dezenas de mils, H velocidade em nós,
+              H temperatura em décimos de K, H pressão em mb)
+        I   CRC-32
+    versão 2 (VERSAO_DELTA)   - atualização de uma estação (difusao.py):
+        B   magia          B   versão        H  comprimento
+        I   sequência      d   carimbo (segundos desde 1970, na publicação)
+        24s cabeçalho      I   máscara das zonas alteradas
+        I   máscara das zonas presentes
+        k x (B zona, H, H, H, H) só das zonas alteradas e presentes
+        I   CRC-32
+      Zonas alteradas e ausentes ficaram vazias. Um quadro com todas as
+      zonas alteradas (MASCARA_COMPLETA) é um boletim completo.
+
+Datagramas que não começam com MAGIA são tratados como o texto dos
+remetentes antigos ("Boletim STANAG 4082 - ..." seguido de linhas
+"rótulo: valor"), então eles continuam funcionando sem alteração.
+"""
+import struct
+import zlib
+
+from stanag import CAMPOS_BOLETIM, NUMERO_ZONAS
+
+MAGIA = 0xA7
+VERSAO_TEXTO = 0
+VERSAO_BINARIA = 1
+VERSAO_DELTA = 2
+
+PREFIXO = struct.Struct("!BBH")
+FORMATO_BINARIO = struct.Struct("!BBH24sI" + "BHHHH" * NUMERO_ZONAS + "I")
+CABECALHO_DELTA = struct.Struct("!BBHId24sII")
+ZONA_BINARIA = struct.Struct("!BHHHH")
+MASCARA_COMPLETA = (1 << NUMERO_ZONAS) - 1
+TAMANHO_CRC = 4
+TAMANHO_GRUPO = 6
+
+TITULO_TEXTO = "Boletim STANAG 4082"
+_FORMATO_ZONA = "%02d%03d%03d%04d%04d"
+
+
+# Função para codificar um boletim no formato binário
+def codificar_boletim(campos):
+    """
+    Codifica os 36 campos do boletim (na ordem de CAMPOS_BOLETIM) em um
+    quadro binário. Os grupos do cabeçalho devem ter até 6 caracteres ASCII
+    e as zonas devem ter 16 dígitos ou estar vazias.
+    """
+    if len(campos) != len(CAMPOS_BOLETIM):
+        raise ValueError(f"O boletim deve ter {len(CAMPOS_BOLETIM)} campos.")
+
+    cabecalho = _cabecalho_binario(campos)
+    mascara = 0
+    valores_zonas = []
+    for i, zona in enumerate(campos[4:]):
+        valores = _valores_zona(i, zona)
+        if valores is None:
+            valores_zonas.extend((0, 0, 0, 0, 0))
+            continue
+        mascara |= 1 << i
+        valores_zonas.extend(valores)
+
+    quadro = bytearray(FORMATO_BINARIO.size)
+    FORMATO_BINARIO.pack_into(quadro, 0, MAGIA, VERSAO_BINARIA, FORMATO_BINARIO.size,
+                              cabecalho, mascara, *valores_zonas, 0)
+    struct.pack_into("!I", quadro, len(quadro) - TAMANHO_CRC, zlib.crc32(quadro[:-TAMANHO_CRC]))
+    return bytes(quadro)
+
+
+def _cabecalho_binario(campos):
+    return b"".join(
+        campo.strip().encode("ascii").ljust(TAMANHO_GRUPO)[:TAMANHO_GRUPO] for campo in campos[:4]
+    )
+
+
+def _valores_zona(i, zona):
+    # Retorna (zona, direção, velocidade, temperatura, pressão) ou None se a zona estiver vazia
+    zona = zona.strip()
+    if not zona:
+        return None
+    if len(zona) != 16 or not zona.isdigit():
+        raise ValueError(f"A zona {i} deve conter exatamente 16 caracteres numéricos.")
+    return int(zona[:2]), int(zona[2:5]), int(zona[5:8]), int(zona[8:12]), int(zona[12:])
+
+
+# Função para codificar a atualização de uma estação (só as zonas alteradas)
+def codificar_delta(campos, anteriores=None, sequencia=0, carimbo=0.0):
+    """
+    Codifica um quadro da versão delta com as zonas de `campos` que mudaram
+    em relação a `anteriores` (os campos do boletim anterior da mesma
+    estação). Sem `anteriores`, o quadro leva o boletim completo. O
+    cabeçalho vai sempre inteiro, pois identifica a estação.
+    """
+    if len(campos) != len(CAMPOS_BOLETIM):
+        raise ValueError(f"O boletim deve ter {len(CAMPOS_BOLETIM)} campos.")
+
+    alteradas = presentes = 0
+    valores_zonas = []
+    for i in range(NUMERO_ZONAS):
+        zona = campos[4 + i]
+        if anteriores is not None and zona == anteriores[4 + i]:
+            continue
+        alteradas |= 1 << i
+        valores = _valores_zona(i, zona)
+        if valores is not None:
+            presentes |= 1 << i
+            valores_zonas.append(valores)
+
+    comprimento = CABECALHO_DELTA.size + ZONA_BINARIA.size * len(valores_zonas) + TAMANHO_CRC
+    quadro = bytearray(comprimento)
+    CABECALHO_DELTA.pack_into(quadro, 0, MAGIA, VERSAO_DELTA, comprimento, sequencia, carimbo,
+                              _cabecalho_binario(campos), alteradas, presentes)
+    posicao = CABECALHO_DELTA.size
+    for valores in valores_zonas:
+        ZONA_BINARIA.pack_into(quadro, posicao, *valores)
+        posicao += ZONA_BINARIA.size
+    struct.pack_into("!I", quadro, posicao, zlib.crc32(memoryview(quadro)[:posicao]))
+    return bytes(quadro)
+
+
+# Função para trocar a sequência de um quadro da versão delta
+def renumerar_delta(quadro, sequencia):
+    """Retorna uma cópia de `quadro` com outra sequência (e o CRC refeito)."""
+    quadro = bytearray(quadro)
+    struct.pack_into("!I", quadro, PREFIXO.size, sequencia)
+    fim = len(quadro) - TAMANHO_CRC
+    struct.pack_into("!I", quadro, fim, zlib.crc32(memoryview(quadro)[:fim]))
+    return bytes(quadro)
+
+
+# Função para decodificar um quadro da versão delta
+def decodificar_delta(dados, inicio=0):
+    """
+    Retorna (sequência, carimbo, cabeçalho, zonas, fim), em que `cabeçalho`
+    tem os 4 grupos, `zonas` é um dicionário índice -> texto só das zonas
+    alteradas ("" para as que ficaram vazias) e `fim` é a posição do fim do
+    quadro em `dados`. Levanta ValueError se o quadro estiver corrompido.
+    """
+    dados = memoryview(dados)
+    if len(dados) - inicio < CABECALHO_DELTA.size or dados[inicio] != MAGIA:
+        raise ValueError("Quadro truncado.")
+    _, versao, comprimento, sequencia, carimbo, cabecalho, alteradas, presentes = \
+        CABECALHO_DELTA.unpack_from(dados, inicio)
+    if versao != VERSAO_DELTA:
+        raise ValueError(f"Versão {versao} não é um quadro delta.")
+    fim = inicio + comprimento
+    quantidade = bin(alteradas & presentes).count("1")
+    if comprimento != CABECALHO_DELTA.size + ZONA_BINARIA.size * quantidade + TAMANHO_CRC or fim > len(dados):
+        raise ValueError("Comprimento inválido para a versão delta.")
+    (crc,) = struct.unpack_from("!I", dados, fim - TAMANHO_CRC)
+    if zlib.crc32(dados[inicio:fim - TAMANHO_CRC]) != crc:
+        raise ValueError("CRC inválido.")
+
+    cabecalho = cabecalho.decode("ascii")
+    zonas = {}
+    posicao = inicio + CABECALHO_DELTA.size
+    for i in range(NUMERO_ZONAS):
+        if not alteradas >> i & 1:
+            continue
+        if presentes >> i & 1:
+            zonas[i] = _FORMATO_ZONA % ZONA_BINARIA.unpack_from(dados, posicao)
+            posicao += ZONA_BINARIA.size
+        else:
+            zonas[i] = ""
+    grupos = [cabecalho[i:i + TAMANHO_GRUPO].rstrip() for i in range(0, 4 * TAMANHO_GRUPO, TAMANHO_GRUPO)]
+    return sequencia, carimbo, grupos, zonas, fim
+
+
+# Função para codificar um boletim no modo de compatibilidade (texto)
+def codificar_texto(campos):
+    texto = "\n".join(campos).encode()
+    comprimento = PREFIXO.size + len(texto) + TAMANHO_CRC
+    quadro = PREFIXO.pack(MAGIA, VERSAO_TEXTO, comprimento) + texto
+    return quadro + struct.pack("!I", zlib.crc32(quadro))
+
+
+# Função para decodificar qualquer datagrama recebido
+def decodificar_boletim(dados):
+    """
+    Decodifica um datagrama (quadro binário, quadro de texto ou texto dos
+    remetentes antigos) e retorna a lista com os 36 campos do boletim.
+    Levanta ValueError se o quadro estiver corrompido.
+    """
+    campos, _ = decodificar_quadro(memoryview(dados), 0)
+    return campos
+
+
+def decodificar_quadro(dados, inicio):
+    """
+    Decodifica o quadro que começa em dados[inicio:] (um memoryview) e
+    retorna (campos, posição do fim do quadro).
+    """
+    if len(dados) - inicio < PREFIXO.size or dados[inicio] != MAGIA:
+        return decodificar_texto(bytes(dados[inicio:]).decode()), len(dados)
+
+    _, versao, comprimento = PREFIXO.unpack_from(dados, inicio)
+    fim = inicio + comprimento
+    if comprimento < PREFIXO.size + TAMANHO_CRC or fim > len(dados):
+        raise ValueError("Quadro truncado.")
+    (crc,) = struct.unpack_from("!I", dados, fim - TAMANHO_CRC)
+    if zlib.crc32(dados[inicio:fim - TAMANHO_CRC]) != crc:
+        raise ValueError("CRC inválido.")
+
+    if versao == VERSAO_TEXTO:
+        texto = bytes(dados[inicio + PREFIXO.size:fim - TAMANHO_CRC]).decode()
+        return _completar(texto.split("\n")), fim
+    if versao == VERSAO_BINARIA:
+        if comprimento != FORMATO_BINARIO.size:
+            raise ValueError("Comprimento inválido para a versão binária.")
+        return _campos_binarios(FORMATO_BINARIO.unpack_from(dados, inicio)), fim
+    if versao == VERSAO_DELTA:
+        raise ValueError("Quadro delta: precisa do estado da estação (difusao.EstadoDifusao).")
+    raise ValueError(f"Versão de protocolo desconhecida: {versao}")
+
+
+def _campos_binarios(valores):
+    cabecalho, mascara = valores[3].decode("ascii"), valores[4]
+    campos = [cabecalho[i:i + TAMANHO_GRUPO].rstrip() for i in range(0, 4 * TAMANHO_GRUPO, TAMANHO_GRUPO)]
+    campos.extend(
+        _FORMATO_ZONA % valores[5 + 5 * i:10 + 5 * i] if mascara >> i & 1 else ""
+        for i in range(NUMERO_ZONAS)
+    )
+    return campos
+
+
+# Função para ler o texto dos remetentes antigos
+def decodificar_texto(texto):
+    """
+    Lê o boletim em texto, descartando a linha de título e os rótulos
+    ("METCMQ: ...", "Zona 12: ...") quando existirem.
+    """
+    linhas = texto.split("\n")
+    if linhas and linhas[0].startswith(TITULO_TEXTO):
+        linhas = linhas[1:]
+    return _completar([linha.partition(":")[2].strip() if ":" in linha else linha.strip()
+                       for linha in linhas])
+
+
+def _completar(campos):
+    campos = campos[:len(CAMPOS_BOLETIM)]
+    return campos + [""] * (len(CAMPOS_BOLETIM) - len(campos))
@@ -0,0 +1,466 @@
+"""
+Receptor UDP de boletins STANAG 4082, sem interface gráfica.
+
+O socket é lido por um asyncio.DatagramProtocol que só coloca os datagramas
+em uma fila limitada; um consumidor separado retira os datagramas em lotes,
+decodifica e entrega cada lote aos assinantes. Se a fila encher, os
+datagramas novos são descartados e contados, sem travar o socket.
+
+As estatísticas, o tamanho da fila e o tempo de cada lote também vão para
+as métricas (metricas.py), que a linha de comando pode servir por HTTP ou
+escrever periodicamente; --perfil liga o cProfile em uma fração dos lotes.
+
+Uso pela linha de comando (grava os boletins recebidos no banco e,
+com --acervo, também no acervo binário de acervo.py):
+    python receptor.py --porta 5005
+    python receptor.py --porta 5005 --acervo boletins.acervo
+    python receptor.py --porta 5005 5006 5007 --trabalhadores 4 --processos
+    python receptor.py --porta 5005 --metricas 9105 --perfil 0.01 --perfil-arquivo receptor.prof
+"""
+import argparse
+import asyncio
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import metricas
+from protocolo import decodificar_boletim
+from transporte import MAGIA_TRANSPORTE, RemontagemConfiavel
+
+TAMANHO_FILA = 10000
+TAMANHO_LOTE = 256
+TAMANHO_BUFFER_SOCKET = 4 * 1024 * 1024
+MAXIMO_REMONTAGENS = 4096  # emissores do transporte confiável acompanhados por socket
+
+tempo_decodificacao_lote = metricas.histograma(
+    "stanag_receptor_decodificacao_segundos", "Tempo para decodificar um lote de datagramas")
+tempo_entrega_lote = metricas.histograma(
+    "stanag_receptor_entrega_segundos", "Tempo dos assinantes para processar um lote de boletins")
+
+
+# Função para decodificar um lote de datagramas (pode rodar em outro processo)
+def decodificar_lote(decodificar, datagramas):
+    """Retorna a lista de campos de cada datagrama, ou None se for inválido."""
+    boletins = []
+    for dados in datagramas:
+        try:
+            boletins.append(decodificar(dados))
+        except (UnicodeDecodeError, ValueError):
+            boletins.append(None)
+    return boletins
+
+
+class Estatisticas:
+    """Contadores do receptor, lidos por quem quiser acompanhar a recepção."""
+
+    __slots__ = ("recebidos", "processados", "descartados", "invalidos", "lotes", "acks_descartados",
+                 "erros_assinantes")
+
+    def __init__(self):
+        self.recebidos = 0
+        self.processados = 0
+        self.descartados = 0
+        self.invalidos = 0
+        self.lotes = 0
+        self.acks_descartados = 0
+        self.erros_assinantes = 0
+
+    def __repr__(self):
+        return (f"recebidos={self.recebidos} processados={self.processados} "
+                f"descartados={self.descartados} invalidos={self.invalidos} lotes={self.lotes} "
+                f"acks_descartados={self.acks_descartados} erros_assinantes={self.erros_assinantes}")
+
+
+class ProtocoloBoletim(asyncio.DatagramProtocol):
+    """
+    Coloca os datagramas na fila. Segmentos do transporte confiável são
+    confirmados aqui mesmo e só as mensagens completas, em ordem, vão para
+    a fila. O estado de remontagem fica só para os `maximo_remontagens`
+    emissores usados mais recentemente; um emissor esquecido que volte a
+    enviar precisa abrir uma sessão nova.
+    """
+
+    def __init__(self, fila, estatisticas, maximo_remontagens=MAXIMO_REMONTAGENS):
+        self.fila = fila
+        self.estatisticas = estatisticas
+        self.maximo_remontagens = maximo_remontagens
+        self.transporte = None
+        self.remontagens = OrderedDict()
+
+    def connection_made(self, transporte):
+        self.transporte = transporte
+
+    def datagram_received(self, dados, endereco):
+        self.estatisticas.recebidos += 1
+        if dados[:1] == bytes((MAGIA_TRANSPORTE,)):
+            remontagem = self.remontagens.get(endereco)
+            if remontagem is None:
+                remontagem = self.remontagens[endereco] = RemontagemConfiavel()
+                if len(self.remontagens) > self.maximo_remontagens:
+                    self.remontagens.popitem(last=False)
+            else:
+                self.remontagens.move_to_end(endereco)
+            try:
+                ack, mensagens = remontagem.processar(dados)
+            except (ValueError, struct.error):
+                self.estatisticas.invalidos += 1
+                return
+            try:
+                self.transporte.sendto(ack, endereco)
+            except BlockingIOError:
+                # Socket cru do ReceptorMultiplo com o buffer cheio: o emissor
+                # retransmite e o segmento repetido é confirmado de novo
+                self.estatisticas.acks_descartados += 1
+            for mensagem in mensagens:
+                self._enfileirar(mensagem, endereco)
+        else:
+            self._enfileirar(dados, endereco)
+
+    def _enfileirar(self, dados, endereco):
+        try:
+            self.fila.put_nowait((dados, endereco))
+        except asyncio.QueueFull:
+            self.estatisticas.descartados += 1
+
+
+class ServicoEmThread:
+    """
+    Base dos serviços asyncio que também podem rodar em uma thread própria
+    (receptor, distribuidor e assinantes da difusão). A subclasse define a
+    corrotina executar(ao_iniciar) e os atributos _loop, _parar e _thread.
+    """
+
+    def iniciar_em_thread(self):
+        """
+        Roda o serviço em uma thread própria, com seu próprio event loop.
+        Só retorna depois que o socket estiver aberto; se não for possível
+        abri-lo, o erro é levantado aqui.
+        """
+        pronto = threading.Event()
+        erros = []
+
+        def rodar():
+            try:
+                asyncio.run(self.executar(ao_iniciar=pronto.set))
+            except OSError as e:
+                erros.append(e)
+                pronto.set()
+
+        self._thread = threading.Thread(target=rodar, daemon=True)
+        self._thread.start()
+        pronto.wait()
+        if erros:
+            self._thread = None
+            raise erros[0]
+
+    def parar(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._parar.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class Receptor(ServicoEmThread):
+    """
+    Serviço de recepção de boletins por UDP.
+
+    Os assinantes são funções chamadas com a lista de boletins decodificados
+    de cada lote (cada boletim é uma lista de campos). Elas rodam na thread
+    do receptor e não devem bloquear. Uma exceção de um assinante é escrita
+    no stderr e contada em erros_assinantes; os outros assinantes e os
+    lotes seguintes continuam sendo atendidos.
+    """
+
+    def __init__(self, porta, host="", tamanho_fila=TAMANHO_FILA, tamanho_lote=TAMANHO_LOTE,
+                 decodificar=decodificar_boletim):
+        self.porta = porta
+        self.host = host
+        self.tamanho_fila = tamanho_fila
+        self.tamanho_lote = tamanho_lote
+        self.decodificar = decodificar
+        self.estatisticas = Estatisticas()
+        self.perfil = None  # metricas.PerfilAmostrado para os lotes
+        self._assinantes = []
+        self.endereco = None
+        self._loop = None
+        self._parar = None
+        self._thread = None
+
+    def assinar(self, assinante):
+        self._assinantes.append(assinante)
+
+    def cancelar_assinatura(self, assinante):
+        self._assinantes.remove(assinante)
+
+    def _criar_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TAMANHO_BUFFER_SOCKET)
+        sock.bind((self.host, self.porta))
+        self.endereco = sock.getsockname()
+        return sock
+
+    async def executar(self, ao_iniciar=None):
+        self._loop = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+        fila = asyncio.Queue(self.tamanho_fila)
+        transporte, _ = await self._loop.create_datagram_endpoint(
+            lambda: ProtocoloBoletim(fila, self.estatisticas), sock=self._criar_socket()
+        )
+        self._registrar_metricas(fila)
+        if ao_iniciar is not None:
+            ao_iniciar()
+        consumidor = asyncio.ensure_future(self._consumir(fila))
+        try:
+            await self._parar.wait()
+        finally:
+            transporte.close()
+            consumidor.cancel()
+
+    def _registrar_metricas(self, fila):
+        # Lidas só na coleta; com vários receptores no processo, vale o último iniciado
+        metricas.coletar("stanag_receptor_fila", "Datagramas esperando decodificação", fila.qsize)
+        for nome, ajuda in (("recebidos", "Datagramas recebidos"),
+                            ("processados", "Boletins decodificados e entregues"),
+                            ("descartados", "Datagramas descartados com a fila cheia"),
+                            ("invalidos", "Datagramas inválidos ou corrompidos"),
+                            ("lotes", "Lotes entregues aos assinantes"),
+                            ("acks_descartados", "ACKs do transporte confiável não enviados"),
+                            ("erros_assinantes", "Exceções levantadas pelos assinantes")):
+            metricas.coletar(f"stanag_receptor_{nome}_total", ajuda,
+                             partial(getattr, self.estatisticas, nome), "counter")
+
+    async def _consumir(self, fila):
+        while True:
+            lote = [await fila.get()]
+            while len(lote) < self.tamanho_lote and not fila.empty():
+                lote.append(fila.get_nowait())
+            if self.perfil is not None:
+                self.perfil.executar(self._processar_lote, lote)
+            else:
+                self._processar_lote(lote)
+
+    def _processar_lote(self, lote):
+        inicio = time.perf_counter()
+        decodificados = decodificar_lote(self.decodificar, [dados for dados, _ in lote])
+        tempo_decodificacao_lote.observar(time.perf_counter() - inicio)
+        self._entregar([campos for campos in decodificados if campos is not None], len(lote))
+
+    def _entregar(self, boletins, tamanho_lote):
+        self.estatisticas.lotes += 1
+        self.estatisticas.processados += len(boletins)
+        self.estatisticas.invalidos += tamanho_lote - len(boletins)
+        if boletins:
+            inicio = time.perf_counter()
+            for assinante in list(self._assinantes):
+                try:
+                    assinante(boletins)
+                except Exception as e:
+                    self.estatisticas.erros_assinantes += 1
+                    print(f"Erro no assinante {assinante!r} do receptor: {e!r}", file=sys.stderr)
+            tempo_entrega_lote.observar(time.perf_counter() - inicio)
+
+
+class Estacao:
+    """Último boletim e contadores de uma estação (IP de origem + LaLaLaLoLoLo)."""
+
+    __slots__ = ("chave", "origem", "boletim", "recebido_em", "boletins")
+
+    def __init__(self, chave, origem):
+        self.chave = chave
+        self.origem = origem
+        self.boletim = None
+        self.recebido_em = 0.0
+        self.boletins = 0
+
+
+class ReceptorMultiplo(Receptor):
+    """
+    Receptor para muitas estações ao mesmo tempo.
+
+    Escuta em várias portas (com SO_REUSEPORT, várias instâncias podem
+    dividir a mesma porta) e, a cada vez que um socket fica legível, lê todos
+    os datagramas disponíveis de uma vez, como um recvmmsg. A decodificação
+    vai para um pool de threads ou de processos, com até `trabalhadores`
+    lotes em andamento. Os boletins são separados por estação, com o último
+    boletim de cada uma disponível em ultimo_da_estacao().
+    """
+
+    def __init__(self, portas, host="", tamanho_fila=TAMANHO_FILA, tamanho_lote=TAMANHO_LOTE,
+                 decodificar=decodificar_boletim, trabalhadores=1, processos=False, reuse_port=False):
+        super().__init__(portas[0], host, tamanho_fila, tamanho_lote, decodificar)
+        self.portas = list(portas)
+        self.trabalhadores = trabalhadores
+        self.processos = processos
+        self.reuse_port = reuse_port
+        self.enderecos = []
+        self._estacoes = {}
+        self._lock_estacoes = threading.Lock()
+
+    def _criar_socket_porta(self, porta):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TAMANHO_BUFFER_SOCKET)
+        sock.bind((self.host, porta))
+        sock.setblocking(False)
+        return sock
+
+    async def executar(self, ao_iniciar=None):
+        self._loop = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+        fila = asyncio.Queue(self.tamanho_fila)
+        sockets = [self._criar_socket_porta(porta) for porta in self.portas]
+        self.enderecos = [sock.getsockname() for sock in sockets]
+        self.endereco = self.enderecos[0]
+
+        executor_classe = ProcessPoolExecutor if self.processos else ThreadPoolExecutor
+        executor = executor_classe(self.trabalhadores)
+        for sock in sockets:
+            protocolo = ProtocoloBoletim(fila, self.estatisticas)
+            protocolo.connection_made(sock)
+            self._loop.add_reader(sock.fileno(), self._ler_tudo, sock, protocolo)
+        self._registrar_metricas(fila)
+        if ao_iniciar is not None:
+            ao_iniciar()
+        consumidores = [asyncio.ensure_future(self._consumir_em_pool(fila, executor))
+                        for _ in range(self.trabalhadores)]
+        try:
+            await self._parar.wait()
+        finally:
+            for sock in sockets:
+                self._loop.remove_reader(sock.fileno())
+                sock.close()
+            for consumidor in consumidores:
+                consumidor.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _ler_tudo(self, sock, protocolo):
+        # Esvazia o buffer do socket em uma única chamada do event loop
+        for _ in range(self.tamanho_lote):
+            try:
+                dados, endereco = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self.estatisticas.invalidos += 1
+                return
+            protocolo.datagram_received(dados, endereco)
+
+    async def _consumir_em_pool(self, fila, executor):
+        tarefa = partial(decodificar_lote, self.decodificar)
+        while True:
+            lote = [await fila.get()]
+            while len(lote) < self.tamanho_lote and not fila.empty():
+                lote.append(fila.get_nowait())
+            recebido_em = time.time()
+            inicio = time.perf_counter()
+            decodificados = await self._loop.run_in_executor(executor, tarefa, [dados for dados, _ in lote])
+            tempo_decodificacao_lote.observar(time.perf_counter() - inicio)
+            # O perfil amostrado mede só esta parte; a decodificação roda no pool
+            if self.perfil is not None:
+                self.perfil.executar(self._registrar_lote, lote, decodificados, recebido_em)
+            else:
+                self._registrar_lote(lote, decodificados, recebido_em)
+
+    def _registrar_lote(self, lote, decodificados, recebido_em):
+        boletins = []
+        with self._lock_estacoes:
+            for (_, endereco), campos in zip(lote, decodificados):
+                if campos is None:
+                    continue
+                boletins.append(campos)
+                chave = (endereco[0], campos[1])
+                estacao = self._estacoes.get(chave)
+                if estacao is None:
+                    estacao = self._estacoes[chave] = Estacao(chave, endereco)
+                estacao.boletins += 1
+                if recebido_em >= estacao.recebido_em:
+                    estacao.boletim, estacao.recebido_em, estacao.origem = campos, recebido_em, endereco
+        self._entregar(boletins, len(lote))
+
+    def ultimo_da_estacao(self, ip, posicao):
+        """Retorna os campos do último boletim da estação, ou None."""
+        with self._lock_estacoes:
+            estacao = self._estacoes.get((ip, posicao))
+            return None if estacao is None else estacao.boletim
+
+    def estacoes(self):
+        """Retorna a lista das estações conhecidas (cópia)."""
+        with self._lock_estacoes:
+            return list(self._estacoes.values())
+
+
+async def _relatar(receptor, intervalo):
+    estatisticas = receptor.estatisticas
+    anteriores, instante = (0, 0), time.perf_counter()
+    while True:
+        await asyncio.sleep(intervalo)
+        agora = time.perf_counter()
+        atuais = (estatisticas.recebidos, estatisticas.processados)
+        datagramas, boletins = ((a - b) / (agora - instante) for a, b in zip(atuais, anteriores))
+        anteriores, instante = atuais, agora
+        print(f"{datagramas:.0f} datagramas/s  {boletins:.0f} boletins/s  "
+              f"{len(receptor.estacoes())} estações  {estatisticas}", flush=True)
+
+
+def main(argv=None):
+    import banco
+
+    parser = argparse.ArgumentParser(description="Recebe boletins STANAG 4082 por UDP e grava no banco.")
+    parser.add_argument("--porta", type=int, nargs="+", required=True, help="uma ou mais portas")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--trabalhadores", type=int, default=1, help="lotes decodificados em paralelo")
+    parser.add_argument("--processos", action="store_true", help="decodifica em processos em vez de threads")
+    parser.add_argument("--reuseport", action="store_true", help="usa SO_REUSEPORT para dividir a porta")
+    parser.add_argument("--banco", default=banco.CAMINHO_BANCO)
+    parser.add_argument("--delta", action="store_true",
+                        help="grava cada boletim como delta do quadro-chave da estação")
+    parser.add_argument("--acervo", help="acrescenta os boletins recebidos também neste acervo binário")
+    parser.add_argument("--fila", type=int, default=TAMANHO_FILA, help="tamanho máximo da fila de datagramas")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="datagramas processados por lote")
+    parser.add_argument("--intervalo", type=float, default=5.0, help="segundos entre relatórios")
+    metricas.adicionar_argumentos(parser)
+    args = parser.parse_args(argv)
+
+    receptor = ReceptorMultiplo(args.porta, args.host, args.fila, args.lote,
+                                trabalhadores=args.trabalhadores, processos=args.processos,
+                                reuse_port=args.reuseport)
+    receptor.perfil, encerrar_metricas = metricas.iniciar_pela_linha_de_comando(args)
+    acervo = None
+    if args.acervo:
+        from acervo import Acervo
+
+        acervo = Acervo(args.acervo, "a")
+        receptor.assinar(acervo.acrescentar)
+    with banco.BancoDados(args.banco, delta=args.delta) as bd:
+        bd.configurar()
+        receptor.assinar(bd.gravar_em_segundo_plano)
+
+        async def principal():
+            relatorio = asyncio.ensure_future(_relatar(receptor, args.intervalo))
+            try:
+                await receptor.executar()
+            finally:
+                relatorio.cancel()
+
+        print(f"Escutando nas portas {', '.join(map(str, args.porta))}...", flush=True)
+        try:
+            asyncio.run(principal())
+        except KeyboardInterrupt:
+            pass
+    if acervo is not None:
+        acervo.fechar()
+    encerrar_metricas()
+    print(receptor.estatisticas)
+    for estacao in sorted(receptor.estacoes(), key=lambda e: e.chave):
+        print(f"  {estacao.chave[0]} {estacao.chave[1]}: {estacao.boletins} boletins")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Tabelas e funções básicas do boletim meteorológico STANAG 4082 (METCM),
+sem nenhuma dependência de interface gráfica.
+"""
+from bisect import bisect_left
+
+import numpy as np
+
+# Nomes dos campos do boletim, na ordem em que são transmitidos
+CAMPOS_CABECALHO = ["METCMQ", "LaLaLaLoLoLo", "YYGoGoGoG", "hhhPdPdPd"]
+CAMPOS_ZONAS = [f"zona{i}" for i in range(32)]
+CAMPOS_BOLETIM = CAMPOS_CABECALHO + CAMPOS_ZONAS
+
+NUMERO_ZONAS = 32
+ZONA_INVALIDA = -1
+
+# Limite superior (em metros) de cada zona, indexado pelo número da zona.
+# A zona 0 é a superfície; a zona 12 vai de 5000 a 6000 m, como na norma
+# (não existe lacuna entre 5500 e 6000 m).
+LIMITES_ZONAS = (
+    0, 200, 500, 1000, 1500, 2000, 2500, 3000,
+    3500, 4000, 4500, 5000, 6000, 7000, 8000, 9000,
+    10000, 11000, 12000, 13000, 14000, 15000, 16000, 17000,
+    18000, 19000, 20000, 22000, 24000, 26000, 28000, 30000,
+)
+_LIMITES_ARRAY = np.asarray(LIMITES_ZONAS)
+
+# Intervalo (min, max) de cada zona, útil para exibição
+INTERVALOS_ZONAS = tuple(
+    (LIMITES_ZONAS[i - 1] if i else 0, LIMITES_ZONAS[i]) for i in range(NUMERO_ZONAS)
+)
+
+ALTURA_MAXIMA = LIMITES_ZONAS[-1]
+
+
+# Função para encontrar a zona de uma altura
+def zona_para_altura(altura):
+    """
+    Retorna o número da zona que contém a altura (em metros) ou ZONA_INVALIDA.
+
+    Uma altura exatamente sobre a fronteira entre duas zonas pertence à zona
+    de baixo (o limite superior é inclusivo), e a altura 0 é a zona 0.
+    """
+    if not 0 <= altura <= ALTURA_MAXIMA:  # também recusa NaN
+        return ZONA_INVALIDA
+    return bisect_left(LIMITES_ZONAS, altura)
+
+
+# Versão vetorizada de zona_para_altura
+def zones_for_heights(heights):
+    """
+    Recebe uma lista ou array de alturas (em metros) e retorna, em uma única
+    passada, um array de inteiros com o número da zona de cada altura.
+    Alturas fora de 0..30000 m, ou NaN, recebem ZONA_INVALIDA.
+    """
+    alturas = np.asarray(heights)
+    zonas = np.searchsorted(_LIMITES_ARRAY, alturas, side="left")
+    invalidas = (alturas < 0) | (alturas > ALTURA_MAXIMA) | np.isnan(alturas)
+    return np.where(invalidas, ZONA_INVALIDA, zonas)
+
+
+# Octantes do globo (dígito Q de METCMQ): sinal da latitude, sinal da
+# longitude e se a longitude fica entre 90 e 180 graus (dígito das centenas
+# omitido em LoLoLo)
+OCTANTES = {
+    0: (1, -1, False), 1: (1, -1, True), 2: (1, 1, True), 3: (1, 1, False),
+    5: (-1, -1, False), 6: (-1, -1, True), 7: (-1, 1, True), 8: (-1, 1, False),
+}
+
+
+# Função para decodificar a posição do cabeçalho
+def decodificar_posicao(metcmq, lalalalololo):
+    """
+    Decodifica os grupos METCMQ e LaLaLaLoLoLo em (latitude, longitude), em
+    décimos de grau com sinal (norte e leste positivos).
+    Retorna (None, None) se os grupos não forem válidos.
+    """
+    if len(metcmq) != 6 or not metcmq[5:].isdigit() or int(metcmq[5]) not in OCTANTES:
+        return None, None
+    if len(lalalalololo) != 6 or not lalalalololo.isdigit():
+        return None, None
+
+    sinal_lat, sinal_lon, acima_de_90 = OCTANTES[int(metcmq[5])]
+    latitude = int(lalalalololo[:3])
+    longitude = int(lalalalololo[3:])
+    if latitude > 900:
+        return None, None
+    if acima_de_90 and longitude < 900:
+        longitude += 1000
+    return sinal_lat * latitude, sinal_lon * longitude
+
+
+# Função para decodificar o grupo de data e validade
+def decodificar_validade(yygogogog):
+    """
+    Decodifica YYGoGoGoG em (dia do mês, hora em décimos de hora, duração da
+    validade em horas). Retorna (None, None, None) se o grupo for inválido.
+    """
+    if len(yygogogog) != 6 or not yygogogog.isdigit():
+        return None, None, None
+    dia, hora, duracao = int(yygogogog[:2]), int(yygogogog[2:5]), int(yygogogog[5])
+    if not 1 <= dia <= 31 or hora >= 240:
+        return None, None, None
+    return dia, hora, duracao
+
+
+# Função para decodificar o grupo do ponto de referência (MDP)
+def decodificar_mdp(hhhpdpdpd):
+    """
+    Decodifica hhhPdPdPd em (altitude em metros, pressão em mb).
+    A pressão vem sem o dígito do milhar: valores abaixo de 500 são 1xxx mb.
+    Retorna (None, None) se o grupo for inválido.
+    """
+    if len(hhhpdpdpd) != 6 or not hhhpdpdpd.isdigit():
+        return None, None
+    pressao = int(hhhpdpdpd[3:])
+    if pressao < 500:
+        pressao += 1000
+    return int(hhhpdpdpd[:3]) * 10, pressao
@@ -0,0 +1,63 @@
+"""
+Relatório do tempo de importação dos apps, para acompanhar a latência de
+abertura. Importa cada módulo em um interpretador novo com -X importtime e
+mostra o total e os módulos que mais pesaram.
+
+    python tempo_inicializacao.py                   # aplicativo1 e aplicativo2
+    python tempo_inicializacao.py nucleo --top 10
+
+O tempo até o primeiro quadro é registrado pelos próprios apps no log do
+Kivy ("Inicializacao: primeiro quadro em ... ms").
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+
+
+# Função para medir a importação de um módulo em um processo separado
+def medir_importacao(modulo):
+    """
+    Retorna (total em ms, lista de (próprio ms, acumulado ms, nome)) a partir
+    da saída de -X importtime.
+    """
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=PASTA, capture_output=True, text=True,
+    )
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1])
+
+    modulos = []
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        modulos.append((int(proprio) / 1000, int(acumulado) / 1000, nome.strip()))
+    total = next(acumulado for _, acumulado, nome in reversed(modulos) if nome == modulo)
+    return total, modulos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mostra o tempo de importação dos apps.")
+    parser.add_argument("modulos", nargs="*", default=["aplicativo1", "aplicativo2"])
+    parser.add_argument("--top", type=int, default=15, help="quantos módulos mostrar")
+    args = parser.parse_args(argv)
+
+    for modulo in args.modulos:
+        try:
+            total, modulos = medir_importacao(modulo)
+        except RuntimeError as e:
+            print(f"{modulo}: não foi possível importar ({e})")
+            continue
+        print(f"{modulo}: {total:.1f} ms para importar")
+        print(f"  {'próprio ms':>10} {'acumulado ms':>12}  módulo")
+        for proprio, acumulado, nome in sorted(modulos, key=lambda m: m[0], reverse=True)[:args.top]:
+            print(f"  {proprio:>10.1f} {acumulado:>12.1f}  {nome}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+"""
+Camada de transporte confiável sobre UDP para os boletins.
+
+Cada datagrama é um segmento numerado da sessão do emissor:
+
+    DADOS: B magia  B tipo  I sessão  I seq  H índice  H total  + carga
+    ACK:   B magia  B tipo  I sessão  I próximo seq esperado  Q máscara
+
+Com total == 0, a carga traz uma ou mais mensagens inteiras (H comprimento +
+bytes), agrupadas até caber na MTU. Uma mensagem que não cabe assim é
+quebrada em `total` segmentos consecutivos sem prefixo, com índice
+0..total-1 (total == 1 quando ela cabe num só segmento sem o comprimento).
+
+O ACK é cumulativo (todos os seq menores que o informado chegaram) e
+seletivo: o bit i da máscara indica que o seq (próximo + 1 + i) também
+chegou. O emissor mantém até `janela` segmentos sem confirmação,
+retransmite quando o temporizador (calculado como no TCP, RFC 6298) expira
+ou depois de três ACKs repetidos, e nunca desiste de um segmento; as
+estatísticas mostram quantas retransmissões foram necessárias.
+
+O lado receptor não faz E/S (RemontagemConfiavel): o Receptor do app usa
+essa classe para responder os ACKs e entregar as mensagens em ordem.
+
+Teste local com um enlace com perdas:
+    python transporte.py --boletins 5000 --perda 0.1 --duplicacao 0.02 --reordenacao 0.05
+"""
+import argparse
+import heapq
+import random
+import select
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+
+MAGIA_TRANSPORTE = 0xA8
+TIPO_DADOS = 1
+TIPO_ACK = 2
+
+SEGMENTO = struct.Struct("!BBIIHH")
+ACK = struct.Struct("!BBIIQ")
+COMPRIMENTO = struct.Struct("!H")
+BITS_MASCARA = 64
+
+MTU_PADRAO = 1400  # carga útil do UDP que cabe em um quadro Ethernet sem fragmentar
+JANELA_PADRAO = 64
+RTO_INICIAL = 0.2
+RTO_MINIMO = 0.05
+RTO_MAXIMO = 2.0
+TAMANHO_BUFFER_SIMULADOR = 4 * 1024 * 1024  # como o do receptor, para aguentar rajadas
+LEITURAS_POR_VEZ = 256
+
+
+class EmissorConfiavel:
+    """
+    Envia mensagens (bytes) de forma confiável para `destino`, usando um
+    único socket durante toda a vida do emissor. enviar() só enfileira; a
+    transmissão, os ACKs e as retransmissões ficam em uma thread própria.
+    mensagens_confirmadas conta as mensagens já entregues, na ordem em que
+    foram enviadas.
+    """
+
+    def __init__(self, destino, mtu=MTU_PADRAO, janela=JANELA_PADRAO, rto_inicial=RTO_INICIAL):
+        self.destino = destino
+        self.mtu = mtu
+        self.janela = janela
+        self.sessao = random.getrandbits(32)
+        self.rto = rto_inicial
+        self._srtt = None
+        self._rttvar = None
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.connect(destino)
+        self._sock.setblocking(False)
+
+        self._condicao = threading.Condition()
+        self._pendentes = deque()           # mensagens ainda não segmentadas
+        self._prontos = deque()             # segmentos montados, aguardando janela
+        self._em_voo = OrderedDict()        # seq -> [segmento, enviado_em, tentativas]
+        self._fins = deque()                # (seq, mensagens completas até esse segmento)
+        self._montadas = 0
+        self._proximo_seq = 0
+        self._ultimo_ack = -1
+        self._acks_repetidos = 0
+        self._fechando = False
+        self._descartar = False
+        self._encerrado = None
+
+        self.mensagens = 0
+        self.segmentos = 0
+        self.retransmissoes = 0
+        self.confirmados = 0
+        self.mensagens_confirmadas = 0
+
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    def enviar(self, mensagem):
+        if len(mensagem) > 0xFFFF * self._carga_maxima:
+            raise ValueError("Mensagem grande demais para o transporte.")
+        with self._condicao:
+            self._pendentes.append(bytes(mensagem))
+            self.mensagens += 1
+
+    @property
+    def _carga_maxima(self):
+        return self.mtu - SEGMENTO.size
+
+    @property
+    def pendentes(self):
+        """Segmentos e mensagens ainda não confirmados."""
+        with self._condicao:
+            return len(self._pendentes) + len(self._prontos) + len(self._em_voo)
+
+    def aguardar(self, timeout=None):
+        """Espera até tudo ser confirmado. Retorna False se o tempo acabar."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._condicao:
+            while self._pendentes or self._prontos or self._em_voo:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._condicao.wait(restante)
+        return True
+
+    def fechar(self, aguardar=True, limite=None):
+        """
+        Encerra o emissor. Com aguardar=True, espera tudo ser confirmado por
+        até `limite` segundos (None espera para sempre, o que nunca termina
+        se o destino sumiu) e descarta o que sobrar; com False, descarta o
+        que estiver pendente. Retorna True se nada foi descartado. Chamadas
+        repetidas só retornam o resultado da primeira.
+        """
+        if self._encerrado is not None:
+            return self._encerrado
+        completo = aguardar and self.aguardar(limite)
+        with self._condicao:
+            self._fechando = True
+            self._descartar = not completo
+        self._thread.join()
+        self._sock.close()
+        self._encerrado = completo
+        return completo
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *exc):
+        # Saindo por exceção não há por que esperar os ACKs
+        self.fechar(aguardar=tipo is None)
+
+    # Montagem dos segmentos
+
+    def _montar_segmentos(self):
+        # Chamado com o lock; só monta quando não há segmentos prontos, assim
+        # as mensagens que chegam enquanto a janela está cheia são agrupadas
+        carga_maxima = self._carga_maxima
+        if self._pendentes and len(self._pendentes[0]) + COMPRIMENTO.size > carga_maxima:
+            mensagem = self._pendentes.popleft()
+            partes = [mensagem[i:i + carga_maxima] for i in range(0, len(mensagem), carga_maxima)]
+            for indice, parte in enumerate(partes):
+                self._prontos.append(self._segmento(indice, len(partes), parte))
+            self._montadas += 1
+            self._fins.append((self._proximo_seq - 1, self._montadas))
+            return
+
+        carga = bytearray()
+        while self._pendentes and len(carga) + COMPRIMENTO.size + len(self._pendentes[0]) <= carga_maxima:
+            mensagem = self._pendentes.popleft()
+            carga += COMPRIMENTO.pack(len(mensagem))
+            carga += mensagem
+            self._montadas += 1
+        if carga:
+            self._prontos.append(self._segmento(0, 0, bytes(carga)))
+            self._fins.append((self._proximo_seq - 1, self._montadas))
+
+    def _segmento(self, indice, total, carga):
+        seq = self._proximo_seq
+        self._proximo_seq += 1
+        return seq, SEGMENTO.pack(MAGIA_TRANSPORTE, TIPO_DADOS, self.sessao, seq, indice, total) + carga
+
+    # Laço principal
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                if self._fechando and (self._descartar or not (self._pendentes or self._prontos or self._em_voo)):
+                    self._condicao.notify_all()
+                    return
+                agora = time.monotonic()
+                while len(self._em_voo) < self.janela:
+                    if not self._prontos:
+                        self._montar_segmentos()
+                        if not self._prontos:
+                            break
+                    seq, segmento = self._prontos.popleft()
+                    self._transmitir(segmento)
+                    self._em_voo[seq] = [segmento, agora, 1]
+                    self.segmentos += 1
+                espera = self._retransmitir_expirados(agora)
+
+            # Espera por ACKs até o próximo vencimento (no máximo 5 ms, para
+            # atender logo as mensagens novas)
+            prontos, _, _ = select.select([self._sock], [], [], min(espera, 0.005))
+            if prontos:
+                self._ler_acks()
+
+    def _transmitir(self, segmento):
+        try:
+            self._sock.send(segmento)
+        except (BlockingIOError, ConnectionRefusedError):
+            # Buffer cheio ou destino ainda fechado: o temporizador retransmite
+            pass
+
+    def _retransmitir_expirados(self, agora):
+        proximo_vencimento = RTO_MAXIMO
+        for seq, item in self._em_voo.items():
+            segmento, enviado_em, tentativas = item
+            vencimento = enviado_em + self.rto * (2 ** min(tentativas - 1, 6))
+            if vencimento <= agora:
+                self._retransmitir(seq, item, agora)
+                vencimento = agora + self.rto * (2 ** min(item[2] - 1, 6))
+            proximo_vencimento = min(proximo_vencimento, vencimento - agora)
+        return max(proximo_vencimento, 0)
+
+    def _retransmitir(self, seq, item, agora):
+        self._transmitir(item[0])
+        item[1] = agora
+        item[2] += 1
+        self.retransmissoes += 1
+
+    def _ler_acks(self):
+        while True:
+            try:
+                dados = self._sock.recv(ACK.size)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            if len(dados) != ACK.size:
+                continue
+            magia, tipo, sessao, proximo, mascara = ACK.unpack(dados)
+            if magia != MAGIA_TRANSPORTE or tipo != TIPO_ACK or sessao != self.sessao:
+                continue
+            with self._condicao:
+                self._processar_ack(proximo, mascara, time.monotonic())
+
+    def _processar_ack(self, proximo, mascara, agora):
+        confirmados = [seq for seq in self._em_voo if seq < proximo]
+        while mascara:
+            bit = (mascara & -mascara).bit_length() - 1
+            mascara &= mascara - 1
+            if proximo + 1 + bit in self._em_voo:
+                confirmados.append(proximo + 1 + bit)
+
+        for seq in confirmados:
+            _, enviado_em, tentativas = self._em_voo.pop(seq)
+            if tentativas == 1:
+                # Algoritmo de Karn: só amostras de segmentos não retransmitidos
+                self._atualizar_rto(agora - enviado_em)
+        self.confirmados += len(confirmados)
+        # O ACK cumulativo diz até onde as mensagens foram entregues em ordem
+        while self._fins and self._fins[0][0] < proximo:
+            self.mensagens_confirmadas = self._fins.popleft()[1]
+
+        # Retransmissão rápida depois de três ACKs repetidos com lacunas
+        if proximo == self._ultimo_ack and not confirmados:
+            self._acks_repetidos += 1
+            if self._acks_repetidos == 3 and proximo in self._em_voo:
+                self._retransmitir(proximo, self._em_voo[proximo], agora)
+        else:
+            self._ultimo_ack = proximo
+            self._acks_repetidos = 0
+        if confirmados:
+            self._condicao.notify_all()
+
+    def _atualizar_rto(self, amostra):
+        if self._srtt is None:
+            self._srtt, self._rttvar = amostra, amostra / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - amostra)
+            self._srtt = 0.875 * self._srtt + 0.125 * amostra
+        self.rto = min(RTO_MAXIMO, max(RTO_MINIMO, self._srtt + 4 * self._rttvar))
+
+
+class RemontagemConfiavel:
+    """
+    Estado do lado receptor para um emissor (endereço). processar() recebe
+    um segmento e retorna (ack, mensagens), onde `ack` são os bytes a
+    responder ao emissor e `mensagens` as mensagens completas, em ordem.
+    """
+
+    def __init__(self, janela=1024):
+        self.janela = janela
+        self.sessao = None
+        self.esperado = 0
+        self._fora_de_ordem = {}
+        self._fragmentos = []
+        self.duplicados = 0
+
+    def processar(self, dados):
+        magia, tipo, sessao, seq, indice, total = SEGMENTO.unpack_from(dados)
+        if magia != MAGIA_TRANSPORTE or tipo != TIPO_DADOS:
+            raise ValueError("Segmento inválido.")
+        if sessao != self.sessao:
+            # Emissor novo (ou reiniciado): começa do zero
+            self.sessao = sessao
+            self.esperado = 0
+            self._fora_de_ordem.clear()
+            self._fragmentos.clear()
+
+        mensagens = []
+        if seq < self.esperado or seq in self._fora_de_ordem:
+            self.duplicados += 1
+        elif seq < self.esperado + self.janela:
+            self._fora_de_ordem[seq] = (indice, total, bytes(dados[SEGMENTO.size:]))
+            while self.esperado in self._fora_de_ordem:
+                self._entregar(self._fora_de_ordem.pop(self.esperado), mensagens)
+                self.esperado += 1
+        return self._ack(), mensagens
+
+    def _entregar(self, segmento, mensagens):
+        indice, total, carga = segmento
+        if total:
+            if indice == 0:
+                self._fragmentos = []
+            self._fragmentos.append(carga)
+            if indice == total - 1:
+                mensagens.append(b"".join(self._fragmentos))
+                self._fragmentos = []
+            return
+        posicao = 0
+        while posicao < len(carga):
+            (comprimento,) = COMPRIMENTO.unpack_from(carga, posicao)
+            posicao += COMPRIMENTO.size
+            mensagens.append(carga[posicao:posicao + comprimento])
+            posicao += comprimento
+
+    def _ack(self):
+        mascara = 0
+        for seq in self._fora_de_ordem:
+            deslocamento = seq - self.esperado - 1
+            if deslocamento < BITS_MASCARA:
+                mascara |= 1 << deslocamento
+        return ACK.pack(MAGIA_TRANSPORTE, TIPO_ACK, self.sessao, self.esperado, mascara)
+
+
+class SimuladorEnlace:
+    """
+    Proxy UDP local que imita um enlace de rádio ruim entre um emissor e
+    `destino`: perde, duplica, atrasa e reordena datagramas nos dois
+    sentidos. O emissor deve enviar para `simulador.endereco`.
+
+    `recebidos` conta os datagramas que o simulador leu, `perdidos` os que
+    ele descartou de propósito, `encaminhados` os que saíram (com as
+    cópias) e `falhas` os que não puderam ser enviados. O que o emissor
+    mandou e não entrou em `recebidos` transbordou o buffer do simulador.
+    """
+
+    def __init__(self, destino, perda=0.0, duplicacao=0.0, reordenacao=0.0, atraso=0.001,
+                 semente=None):
+        self.destino = destino
+        self.perda = perda
+        self.duplicacao = duplicacao
+        self.reordenacao = reordenacao
+        self.atraso = atraso
+        self._rng = random.Random(semente)
+        self._cliente = None
+        self._agenda = []
+        self._contador = 0
+        self._rodando = True
+        self.recebidos = 0
+        self.encaminhados = 0
+        self.perdidos = 0
+        self.falhas = 0
+
+        self._lado_cliente = self._criar_socket()
+        self._lado_cliente.bind(("127.0.0.1", 0))
+        self._lado_destino = self._criar_socket()
+        self._lado_destino.connect(destino)
+        self.endereco = self._lado_cliente.getsockname()
+
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _criar_socket():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TAMANHO_BUFFER_SIMULADOR)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TAMANHO_BUFFER_SIMULADOR)
+        sock.setblocking(False)
+        return sock
+
+    def _agendar(self, dados, enviar):
+        if self._rng.random() < self.perda:
+            self.perdidos += 1
+            return
+        copias = 2 if self._rng.random() < self.duplicacao else 1
+        for _ in range(copias):
+            atraso = self.atraso
+            if self._rng.random() < self.reordenacao:
+                atraso += self._rng.uniform(0, 10 * self.atraso + 0.005)
+            self._contador += 1
+            heapq.heappush(self._agenda, (time.monotonic() + atraso, self._contador, enviar, dados))
+
+    def _executar(self):
+        sockets = [self._lado_cliente, self._lado_destino]
+        while self._rodando:
+            espera = 0.01
+            if self._agenda:
+                espera = max(0, min(espera, self._agenda[0][0] - time.monotonic()))
+            prontos, _, _ = select.select(sockets, [], [], espera)
+            for sock in prontos:
+                self._ler(sock)
+            agora = time.monotonic()
+            while self._agenda and self._agenda[0][0] <= agora:
+                _, _, enviar, dados = heapq.heappop(self._agenda)
+                try:
+                    enviar(dados)
+                    self.encaminhados += 1
+                except OSError:
+                    self.falhas += 1
+
+    def _ler(self, sock):
+        # Esvazia o buffer aos poucos, sem atrasar muito o que já está agendado
+        for _ in range(LEITURAS_POR_VEZ):
+            try:
+                dados, endereco = sock.recvfrom(65535)
+            except ConnectionRefusedError:
+                continue
+            except BlockingIOError:
+                return
+            self.recebidos += 1
+            if sock is self._lado_cliente:
+                self._cliente = endereco
+                self._agendar(dados, self._lado_destino.send)
+            elif self._cliente is not None:
+                cliente = self._cliente
+                self._agendar(dados, lambda d: self._lado_cliente.sendto(d, cliente))
+
+    def fechar(self):
+        self._rodando = False
+        self._thread.join()
+        self._lado_cliente.close()
+        self._lado_destino.close()
+
+
+# Função para conferir o enquadramento nos tamanhos em volta da carga máxima
+def verificar_fronteiras(mtu=MTU_PADRAO, timeout=5.0):
+    """
+    Envia por loopback mensagens de carga_maxima-2 a carga_maxima+1 bytes
+    (intercaladas com mensagens pequenas, que são agrupadas) e confere que
+    chegam intactas e em ordem. Retorna os tamanhos que falharam.
+    """
+    carga_maxima = mtu - SEGMENTO.size
+    mensagens = []
+    for tamanho in range(carga_maxima - 2, carga_maxima + 2):
+        mensagens.append(bytes((i * 7 + tamanho) % 256 for i in range(tamanho)))
+        mensagens.append(b"x" * (tamanho % 5 + 1))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(0.05)
+    remontagem = RemontagemConfiavel()
+    recebidas = []
+    emissor = EmissorConfiavel(sock.getsockname(), mtu)
+    try:
+        for mensagem in mensagens:
+            emissor.enviar(mensagem)
+        limite = time.monotonic() + timeout
+        while len(recebidas) < len(mensagens) and time.monotonic() < limite:
+            try:
+                dados, endereco = sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            ack, novas = remontagem.processar(dados)
+            sock.sendto(ack, endereco)
+            recebidas.extend(novas)
+    finally:
+        emissor.fechar(aguardar=False)
+        sock.close()
+
+    falhas = [len(mensagem) for mensagem, recebida in zip(mensagens, recebidas) if mensagem != recebida]
+    return falhas + [len(mensagem) for mensagem in mensagens[len(recebidas):]]
+
+
+def main(argv=None):
+    from gerador import gerar_boletins
+    from protocolo import codificar_boletim, decodificar_boletim
+    from receptor import Receptor
+
+    parser = argparse.ArgumentParser(description="Testa o transporte confiável em um enlace local com perdas.")
+    parser.add_argument("--boletins", type=int, default=2000)
+    parser.add_argument("--perda", type=float, default=0.05)
+    parser.add_argument("--duplicacao", type=float, default=0.0)
+    parser.add_argument("--reordenacao", type=float, default=0.0)
+    parser.add_argument("--atraso", type=float, default=0.001, help="atraso do enlace em segundos")
+    parser.add_argument("--mtu", type=int, default=MTU_PADRAO)
+    parser.add_argument("--janela", type=int, default=JANELA_PADRAO)
+    parser.add_argument("--porta", type=int, default=0, help="porta do receptor (0 = qualquer livre)")
+    parser.add_argument("--limite", type=float, default=120.0, help="tempo máximo de espera pelos ACKs, em segundos")
+    args = parser.parse_args(argv)
+
+    falhas = verificar_fronteiras(args.mtu)
+    print(f"fronteiras da MTU: {'ok' if not falhas else 'FALHA nos tamanhos ' + str(falhas)}")
+
+    boletins = gerar_boletins(args.boletins, semente=12)
+    recebidos = []
+    receptor = Receptor(args.porta, "127.0.0.1")
+    receptor.assinar(recebidos.extend)
+    receptor.iniciar_em_thread()
+    simulador = SimuladorEnlace(receptor.endereco, args.perda, args.duplicacao, args.reordenacao,
+                                args.atraso, semente=1)
+
+    inicio = time.perf_counter()
+    with EmissorConfiavel(simulador.endereco, args.mtu, args.janela) as emissor:
+        for boletim in boletins:
+            emissor.enviar(codificar_boletim(boletim))
+        completo = emissor.fechar(limite=args.limite)
+        duracao = time.perf_counter() - inicio
+    time.sleep(0.05)
+    simulador.fechar()
+    receptor.parar()
+
+    em_ordem = recebidos == [decodificar_boletim(codificar_boletim(b)) for b in boletins]
+    print(f"{len(recebidos)}/{len(boletins)} boletins entregues {'em ordem' if em_ordem else 'COM ERRO'}"
+          f"{'' if completo else ' (tempo esgotado)'} em {duracao:.2f} s "
+          f"({len(boletins) / duracao:,.0f} boletins/s)")
+    print(f"segmentos={emissor.segmentos} retransmissoes={emissor.retransmissoes} "
+          f"perdidos_no_enlace={simulador.perdidos} rto_final={emissor.rto * 1000:.0f} ms")
+    return 0 if em_ordem and completo and not falhas else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,321 @@
+"""
+Validação dos boletins STANAG 4082, sem dependência da interface.
+
+As regras de cada grupo são compiladas uma vez (expressões regulares e
+tabelas de faixas) e usadas de três formas:
+    - validar_boletim: um boletim inteiro, devolvendo todos os erros de
+      uma vez;
+    - validar_lote: muitos boletins em uma passada, com as zonas
+      decodificadas e conferidas em lote pelo NumPy (importação em massa);
+    - ValidadorIncremental: o formulário do app de entrada, que revalida só
+      o campo que mudou a cada tecla.
+
+Cada problema é um ErroValidacao com o índice do campo (na ordem de
+CAMPOS_BOLETIM), um código e a mensagem. Erros de gravidade "erro" impedem
+o boletim de ser salvo; os de gravidade "aviso" (valores fora da faixa
+plausível) só chamam a atenção do operador.
+
+O METCM não tem um grupo de soma de verificação no cabeçalho; a
+integridade na transmissão é conferida pelo CRC dos quadros (protocolo.py).
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from decodificador import TAMANHO_ZONA, decodificar_zonas, empacotar_zonas
+from stanag import CAMPOS_BOLETIM, CAMPOS_CABECALHO, NUMERO_ZONAS, OCTANTES
+
+ERRO = "erro"
+AVISO = "aviso"
+
+TAMANHO_GRUPO = 6
+PRIMEIRA_ZONA = len(CAMPOS_CABECALHO)
+
+# Estrutura de cada grupo do cabeçalho e a mensagem quando ela não é seguida;
+# re.ASCII para \d não aceitar dígitos de outros alfabetos (como "٣")
+REGRAS_CABECALHO = [
+    (re.compile(f"METCM[{''.join(map(str, sorted(OCTANTES)))}]", re.ASCII),
+     "deve ser METCM seguido do octante (0 a 3 ou 5 a 8)"),
+    (re.compile(r"(?:[0-8]\d\d|900)\d{3}", re.ASCII),
+     "deve ter a latitude (até 900 décimos de grau) e a longitude em 6 dígitos"),
+    (re.compile(r"(?:0[1-9]|[12]\d|3[01])(?:[01]\d\d|2[0-3]\d)\d", re.ASCII),
+     "deve ter o dia (01 a 31), a hora em décimos (000 a 239) e a duração"),
+    (re.compile(r"\d{6}", re.ASCII),
+     "deve ter a altitude e a pressão do MDP em 6 dígitos"),
+]
+
+REGRA_ZONA = re.compile(r"\d{16}", re.ASCII)
+
+# Faixas aceitas para os campos da zona (unidades do DTYPE_ZONA): direção
+# fora de 0..6390 mils é erro de formato; o resto só é implausível
+FAIXAS_ZONA = [
+    ("direcao_vento", 0, 6390, ERRO, "direção do vento", "mils"),
+    ("velocidade_vento", 0, 250, AVISO, "velocidade do vento", "nós"),
+    ("temperatura", 180.0, 330.0, AVISO, "temperatura virtual", "K"),
+    ("pressao", 10, 1100, AVISO, "pressão do ar", "mb"),
+]
+
+
+class ErroValidacao:
+    """Um problema encontrado em um campo do boletim."""
+
+    __slots__ = ("campo", "codigo", "mensagem", "gravidade")
+
+    def __init__(self, campo, codigo, mensagem, gravidade=ERRO):
+        self.campo = campo
+        self.codigo = codigo
+        self.mensagem = mensagem
+        self.gravidade = gravidade
+
+    @property
+    def nome(self):
+        return CAMPOS_BOLETIM[self.campo] if self.campo is not None else None
+
+    def __eq__(self, outro):
+        return isinstance(outro, ErroValidacao) and (
+            (self.campo, self.codigo, self.mensagem, self.gravidade)
+            == (outro.campo, outro.codigo, outro.mensagem, outro.gravidade))
+
+    def __repr__(self):
+        return f"ErroValidacao({self.campo}, {self.codigo!r}, {self.mensagem!r}, {self.gravidade!r})"
+
+
+def _nome_exibicao(campo):
+    return f"'{CAMPOS_CABECALHO[campo]}'" if campo < PRIMEIRA_ZONA else f"Zona {campo - PRIMEIRA_ZONA}"
+
+
+# Função para validar um campo isolado (resultados guardados por texto)
+@lru_cache(maxsize=8192)
+def validar_campo(campo, texto):
+    """
+    Aplica as regras que dependem só do próprio campo (índice em
+    CAMPOS_BOLETIM) e retorna uma tupla de ErroValidacao.
+    """
+    texto = texto.strip()
+    if campo < PRIMEIRA_ZONA:
+        if len(texto) != TAMANHO_GRUPO:
+            return (ErroValidacao(campo, "tamanho",
+                                  f"O campo {_nome_exibicao(campo)} deve conter exatamente 6 caracteres."),)
+        regra, descricao = REGRAS_CABECALHO[campo]
+        if not regra.fullmatch(texto):
+            return (ErroValidacao(campo, "formato", f"O campo {_nome_exibicao(campo)} {descricao}."),)
+        return ()
+
+    # Zonas vazias são permitidas
+    if not texto:
+        return ()
+    if len(texto) != TAMANHO_ZONA or not REGRA_ZONA.fullmatch(texto):
+        return (ErroValidacao(campo, "formato",
+                              f"O campo {_nome_exibicao(campo)} deve conter exatamente 16 caracteres numéricos."),)
+    valores = {
+        "zona": int(texto[:2]), "direcao_vento": int(texto[2:5]) * 10, "velocidade_vento": int(texto[5:8]),
+        "temperatura": int(texto[8:12]) / 10, "pressao": int(texto[12:]),
+    }
+    erros = []
+    if valores["zona"] != campo - PRIMEIRA_ZONA:
+        erros.append(_erro_numero(campo, valores["zona"]))
+    for nome, minimo, maximo, gravidade, descricao, unidade in FAIXAS_ZONA:
+        if not minimo <= valores[nome] <= maximo:
+            erros.append(_erro_faixa(campo, valores[nome], minimo, maximo, gravidade, descricao, unidade))
+    return tuple(erros)
+
+
+def _erro_numero(campo, numero):
+    return ErroValidacao(campo, "numero_zona",
+                         f"O campo {_nome_exibicao(campo)} começa com o número de zona {numero:02d}.")
+
+
+def _erro_faixa(campo, valor, minimo, maximo, gravidade, descricao, unidade):
+    return ErroValidacao(campo, "faixa",
+                         f"O campo {_nome_exibicao(campo)} tem {descricao} {valor:g} {unidade}, "
+                         f"fora da faixa {minimo:g} a {maximo:g}.", gravidade)
+
+
+def _erro_pressao(campo, anterior):
+    return ErroValidacao(campo, "pressao_crescente",
+                         f"O campo {_nome_exibicao(campo)} tem pressão maior que a da "
+                         f"{_nome_exibicao(anterior)}, abaixo dela.", AVISO)
+
+
+def _erros_pressao(pressoes):
+    """
+    Regra entre zonas: a pressão não pode subir com a altura. `pressoes` tem
+    a pressão de cada zona válida ou None.
+    """
+    erros = []
+    anterior = None
+    for zona, pressao in enumerate(pressoes):
+        if pressao is None:
+            continue
+        if anterior is not None and pressao > pressoes[anterior]:
+            erros.append(_erro_pressao(PRIMEIRA_ZONA + zona, PRIMEIRA_ZONA + anterior))
+        anterior = zona
+    return erros
+
+
+def _pressao_valida(texto, erros):
+    texto = texto.strip()
+    if not texto or any(erro.gravidade == ERRO for erro in erros):
+        return None
+    return int(texto[12:])
+
+
+def _completar(campos):
+    if len(campos) > len(CAMPOS_BOLETIM):
+        return None
+    return list(campos) + [""] * (len(CAMPOS_BOLETIM) - len(campos))
+
+
+def _erro_quantidade(campos):
+    return ErroValidacao(None, "quantidade",
+                         f"O boletim tem {len(campos)} campos; o máximo é {len(CAMPOS_BOLETIM)}.")
+
+
+# Função para validar um boletim inteiro
+def validar_boletim(campos):
+    """
+    Valida os campos de um boletim (na ordem de CAMPOS_BOLETIM; zonas que
+    faltarem no fim contam como vazias) e retorna a lista com todos os
+    ErroValidacao encontrados, vazia se o boletim estiver correto.
+    """
+    completos = _completar(campos)
+    if completos is None:
+        return [_erro_quantidade(campos)]
+    erros = []
+    pressoes = []
+    for campo, texto in enumerate(completos):
+        erros_campo = validar_campo(campo, texto or "")
+        erros.extend(erros_campo)
+        if campo >= PRIMEIRA_ZONA:
+            pressoes.append(_pressao_valida(texto or "", erros_campo))
+    erros.extend(_erros_pressao(pressoes))
+    return erros
+
+
+# Função para validar muitos boletins de uma vez
+def validar_lote(boletins):
+    """
+    Valida uma sequência de boletins e retorna uma lista com a lista de
+    erros de cada um (as mesmas de validar_boletim). As zonas de todos os
+    boletins são decodificadas e conferidas juntas, com operações do NumPy.
+    """
+    boletins = list(boletins)
+    erros = [[] for _ in boletins]
+    completos = []
+    excedentes = []
+    for i, campos in enumerate(boletins):
+        completo = _completar(campos)
+        if completo is None:
+            excedentes.append(i)
+            completo = [""] * len(CAMPOS_BOLETIM)
+        for campo in range(PRIMEIRA_ZONA):
+            erros[i].extend(validar_campo(campo, completo[campo] or ""))
+        completos.append(completo)
+    if not boletins:
+        return erros
+
+    zonas = [(zona or "").strip() for completo in completos for zona in completo[PRIMEIRA_ZONA:]]
+    registros, validos = decodificar_zonas(empacotar_zonas(zonas))
+    comprimentos = np.fromiter(map(len, zonas), np.int64, len(zonas)).reshape(validos.shape)
+    vazias = comprimentos == 0
+    # decodificar_zonas usa os últimos 16 caracteres: o tamanho é conferido à parte
+    validos &= comprimentos == TAMANHO_ZONA
+    problemas = {"formato": ~vazias & ~validos}
+    problemas["numero_zona"] = validos & (registros["zona"] != np.arange(NUMERO_ZONAS))
+    for nome, minimo, maximo, _, _, _ in FAIXAS_ZONA:
+        problemas[nome] = validos & ((registros[nome] < minimo) | (registros[nome] > maximo))
+
+    # Pressão subindo: compara cada zona com a última zona anterior sem erro
+    sem_erro = validos & ~problemas["numero_zona"]
+    for nome, _, _, gravidade, _, _ in FAIXAS_ZONA:
+        if gravidade == ERRO:
+            sem_erro &= ~problemas[nome]
+    indices = np.where(sem_erro, np.arange(NUMERO_ZONAS), -1)
+    anteriores = np.maximum.accumulate(indices, axis=1)
+    anteriores = np.concatenate([np.full((len(anteriores), 1), -1), anteriores[:, :-1]], axis=1)
+    pressao_anterior = np.take_along_axis(registros["pressao"], np.maximum(anteriores, 0), axis=1)
+    problemas["pressao_crescente"] = sem_erro & (anteriores >= 0) & (registros["pressao"] > pressao_anterior)
+
+    faixas = {nome: (minimo, maximo, gravidade, descricao, unidade)
+              for nome, minimo, maximo, gravidade, descricao, unidade in FAIXAS_ZONA}
+    qualquer = np.zeros(validos.shape, dtype=bool)
+    for mascara in problemas.values():
+        qualquer |= mascara
+    # Os erros são montados na mesma ordem de validar_boletim: por campo,
+    # e a regra de pressão entre zonas no fim
+    for i, zona in zip(*np.nonzero(qualquer)):
+        campo = PRIMEIRA_ZONA + int(zona)
+        if problemas["formato"][i, zona]:
+            erros[i].extend(validar_campo(campo, zonas[i * NUMERO_ZONAS + zona]))
+            continue
+        registro = registros[i, zona]
+        if problemas["numero_zona"][i, zona]:
+            erros[i].append(_erro_numero(campo, int(registro["zona"])))
+        for nome in faixas:
+            if problemas[nome][i, zona]:
+                valor = registro[nome].item()
+                erros[i].append(_erro_faixa(campo, round(valor, 1) if nome == "temperatura" else valor,
+                                            *faixas[nome]))
+    for i, zona in zip(*np.nonzero(problemas["pressao_crescente"])):
+        erros[i].append(_erro_pressao(PRIMEIRA_ZONA + int(zona), PRIMEIRA_ZONA + int(anteriores[i, zona])))
+    for i in excedentes:
+        erros[i] = [_erro_quantidade(boletins[i])]
+    return erros
+
+
+class ValidadorIncremental:
+    """
+    Estado de validação de um formulário com os 36 campos. Cada chamada a
+    atualizar revalida só o campo alterado (e reaproveita o resultado se o
+    texto não mudou); a regra de pressão entre zonas é refeita a partir das
+    pressões já decodificadas de cada zona.
+    """
+
+    def __init__(self):
+        self._textos = [None] * len(CAMPOS_BOLETIM)
+        self._erros_campo = [()] * len(CAMPOS_BOLETIM)
+        self._pressoes = [None] * NUMERO_ZONAS
+        self._erros_pressao = {}
+
+    def atualizar(self, campo, texto):
+        """
+        Registra o novo texto do campo e retorna o conjunto de campos cujos
+        erros mudaram (o próprio campo e, pela regra de pressão, outras zonas).
+        """
+        texto = texto.strip()
+        if texto == self._textos[campo]:
+            return set()
+        self._textos[campo] = texto
+        anteriores = self.erros_do_campo(campo)
+        self._erros_campo[campo] = validar_campo(campo, texto)
+        alterados = {campo} if self.erros_do_campo(campo) != anteriores else set()
+        if campo < PRIMEIRA_ZONA:
+            return alterados
+
+        self._pressoes[campo - PRIMEIRA_ZONA] = _pressao_valida(texto, self._erros_campo[campo])
+        novos = {erro.campo: erro for erro in _erros_pressao(self._pressoes)}
+        for outro in set(novos) | set(self._erros_pressao):
+            if novos.get(outro) != self._erros_pressao.get(outro):
+                alterados.add(outro)
+        self._erros_pressao = novos
+        return alterados
+
+    def erros_do_campo(self, campo):
+        erros = list(self._erros_campo[campo])
+        if campo in self._erros_pressao:
+            erros.append(self._erros_pressao[campo])
+        return erros
+
+    def erros(self):
+        """Todos os erros atuais, na ordem dos campos (campos nunca preenchidos contam como vazios)."""
+        erros = []
+        for campo in range(len(CAMPOS_BOLETIM)):
+            if self._textos[campo] is None:
+                self._erros_campo[campo] = validar_campo(campo, "")
+                self._textos[campo] = ""
+            erros.extend(self.erros_do_campo(campo))
+        return erros
+
+    def valido(self):
+        return not any(erro.gravidade == ERRO for erro in self.erros())
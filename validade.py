@@ -0,0 +1,253 @@
+"""
+Validade dos boletins a partir do grupo YYGoGoGoG do cabeçalho.
+
+YY é o dia do mês, GoGoGo a hora do início da validade em décimos de hora
+(UTC) e G a duração da validade em horas. Como o grupo não traz mês nem ano,
+o dia é resolvido para o mês (anterior, atual ou seguinte) que deixa o
+início mais perto de um instante de referência, normalmente o recebimento.
+
+IndiceValidade guarda o intervalo [início, fim] de cada boletim recebido em
+listas ordenadas pelo início (uma geral e uma por estação) e em um heap
+ordenado pelo fim. Achar o boletim vigente em um instante é uma busca
+binária; os vencidos saem pelo topo do heap e só são marcados como
+removidos, porque tirar um item do meio da lista custa O(n). As listas são
+compactadas de uma vez quando as marcas passam da metade das entradas, o
+que dá O(1) amortizado por remoção; as consultas pulam as marcadas.
+"""
+import calendar
+import heapq
+import math
+import threading
+import time
+from bisect import bisect_right, insort
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import numpy as np
+
+from perfil import combinar, perfil_do_boletim
+from stanag import decodificar_validade
+
+# Maior duração que o dígito G pode indicar
+DURACAO_MAXIMA = 9 * 3600
+
+# Maior distância entre o início resolvido e a referência (meio mês)
+MARGEM_REFERENCIA = 16 * 86400
+
+
+# Função para converter dia do mês e hora em um instante (segundos desde 1970)
+def inicio_validade(dia, hora, referencia):
+    """
+    `hora` em décimos de hora. Entre os meses vizinhos ao da referência,
+    usa o que deixa o início mais perto dela; meses que não têm o dia
+    (31 de abril, por exemplo) são pulados.
+    """
+    data = datetime.fromtimestamp(referencia, timezone.utc)
+    melhor = None
+    for deslocamento in (-1, 0, 1):
+        ano, mes = divmod(data.year * 12 + data.month - 1 + deslocamento, 12)
+        mes += 1
+        if dia > calendar.monthrange(ano, mes)[1]:
+            continue
+        inicio = calendar.timegm((ano, mes, dia, 0, 0, 0)) + hora * 360
+        if melhor is None or abs(inicio - referencia) < abs(melhor - referencia):
+            melhor = inicio
+    return melhor
+
+
+# Versão vetorizada de inicio_validade, para muitos boletins de uma vez
+def inicios_validade(dias, horas, referencias):
+    """
+    Recebe arrays de dia do mês, hora (décimos) e referência (segundos desde
+    1970) e retorna os inícios em segundos desde 1970 (float); dias
+    inválidos (0, por exemplo) saem como NaN.
+    """
+    dias = np.asarray(dias, dtype=np.int64)
+    referencias = np.asarray(referencias, dtype=np.float64)
+    mes = referencias.astype("datetime64[s]").astype("datetime64[M]")
+    melhor = np.full(len(dias), np.nan)
+    for deslocamento in (-1, 0, 1):
+        candidato = mes + np.timedelta64(deslocamento, "M")
+        data = candidato.astype("datetime64[D]") + (dias - 1)
+        # Se o dia não existe no mês, a data cai no mês seguinte
+        existe = (dias >= 1) & (data.astype("datetime64[M]") == candidato)
+        inicio = data.astype("datetime64[s]").astype(np.float64) + np.asarray(horas) * 360
+        mais_perto = existe & ~(np.abs(melhor - referencias) <= np.abs(inicio - referencias))
+        melhor = np.where(mais_perto, inicio, melhor)
+    return melhor
+
+
+# Função para calcular o intervalo de validade de um grupo YYGoGoGoG
+def intervalo_validade(yygogogog, referencia):
+    """Retorna (início, fim) em segundos desde 1970, ou None se o grupo for inválido."""
+    # A referência só decide o mês, então basta a hora dela: boletins
+    # recebidos na mesma hora com o mesmo grupo reaproveitam o resultado
+    return _intervalo_validade(yygogogog, int(referencia // 3600))
+
+
+@lru_cache(maxsize=4096)
+def _intervalo_validade(yygogogog, hora_referencia):
+    dia, hora, duracao = decodificar_validade(yygogogog)
+    if dia is None:
+        return None
+    inicio = inicio_validade(dia, hora, hora_referencia * 3600)
+    return inicio, inicio + duracao * 3600
+
+
+# Função para montar o grupo YYGoGoGoG de uma validade que começa em `instante`
+def codificar_validade(instante, duracao):
+    """
+    `duracao` em horas inteiras (1 a 9). A hora é truncada para décimos,
+    então a validade nunca começa depois de `instante`.
+    """
+    data = datetime.fromtimestamp(instante, timezone.utc)
+    decimos = (data.hour * 3600 + data.minute * 60 + data.second) // 360
+    return f"{data.day:02d}{decimos:03d}{duracao}"
+
+
+# Função para saber se um boletim (RegistroBoletim) vale no instante informado
+def boletim_valido(registro, instante):
+    intervalo = intervalo_validade(registro.cabecalho[2], registro.recebido_em)
+    return intervalo is not None and intervalo[0] <= instante <= intervalo[1]
+
+
+# Função para inserir uma entrada mantendo a lista ordenada
+def _inserir_em_ordem(lista, entrada):
+    # Os boletins costumam chegar na ordem da validade: o caso comum é
+    # acrescentar no fim, sem a busca binária pela lista inteira
+    if not lista or lista[-1] < entrada:
+        lista.append(entrada)
+    else:
+        insort(lista, entrada)
+
+
+class IndiceValidade:
+    """
+    Índice de intervalos de validade dos boletins. Os boletins cujo fim da
+    validade ficou mais de `retencao` segundos para trás são descartados;
+    uma retenção maior que zero permite consultar e interpolar horários
+    passados. Boletins com YYGoGoGoG inválido não entram no índice.
+    """
+
+    def __init__(self, retencao=0, relogio=time.time):
+        self.retencao = retencao
+        self.relogio = relogio
+        self._lock = threading.Lock()
+        # Entradas (início, id, fim, registro), ordenadas por (início, id)
+        self._entradas = []
+        self._por_estacao = {}
+        self._fins = []  # heap de (fim, início, id, estação)
+        self._removidos = set()  # (início, id) vencidos ainda nas listas
+        # Resposta de vigente() para "agora", que vale até o instante guardado
+        self._vigente_agora = (-math.inf, None)
+
+    def adicionar(self, registro):
+        """Indexa um RegistroBoletim; pode ser registrada com ArmazemBoletins.assinar."""
+        intervalo = intervalo_validade(registro.cabecalho[2], registro.recebido_em)
+        if intervalo is None:
+            return
+        inicio, fim = intervalo
+        entrada = (inicio, registro.id, fim, registro)
+        with self._lock:
+            _inserir_em_ordem(self._entradas, entrada)
+            _inserir_em_ordem(self._por_estacao.setdefault(registro.estacao, []), entrada)
+            heapq.heappush(self._fins, (fim, inicio, registro.id, registro.estacao))
+            self._vigente_agora = (-math.inf, None)
+            self._expirar()
+
+    def _expirar(self):
+        limite = self.relogio() - self.retencao
+        while self._fins and self._fins[0][0] < limite:
+            _, inicio, boletim_id, _ = heapq.heappop(self._fins)
+            self._removidos.add((inicio, boletim_id))
+        if len(self._removidos) * 2 > len(self._entradas):
+            self._compactar()
+
+    def _compactar(self):
+        removidos = self._removidos
+        self._entradas = [entrada for entrada in self._entradas if entrada[:2] not in removidos]
+        for estacao, entradas in list(self._por_estacao.items()):
+            entradas = [entrada for entrada in entradas if entrada[:2] not in removidos]
+            if entradas:
+                self._por_estacao[estacao] = entradas
+            else:
+                del self._por_estacao[estacao]
+        self._removidos = set()
+
+    def __len__(self):
+        return len(self._entradas) - len(self._removidos)
+
+    def vigente(self, instante=None, estacao=None):
+        """
+        Retorna o boletim válido em `instante` (padrão: agora) com o início
+        de validade mais recente, de qualquer estação ou só da estação
+        informada (octante, LaLaLaLoLoLo). Retorna None se nenhum valer.
+        """
+        agora = instante is None and estacao is None
+        instante = self.relogio() if instante is None else instante
+        with self._lock:
+            # A interface pergunta "agora" a cada consulta; a resposta só muda
+            # quando chega um boletim, quando ela vence ou quando começa a
+            # validade de um boletim recebido antes da hora
+            if agora and instante < self._vigente_agora[0]:
+                return self._vigente_agora[1]
+            self._expirar()
+            entradas = self._entradas if estacao is None else self._por_estacao.get(estacao, [])
+            # Só os boletins iniciados até DURACAO_MAXIMA antes ainda podem valer
+            i = bisect_right(entradas, (instante, math.inf))
+            j = self._seguinte(entradas, i)
+            ate = entradas[j][0] if j < len(entradas) else math.inf
+            registro = None
+            while i > 0 and entradas[i - 1][0] >= instante - DURACAO_MAXIMA:
+                i -= 1
+                if entradas[i][2] >= instante and entradas[i][:2] not in self._removidos:
+                    registro = entradas[i][3]
+                    ate = min(ate, entradas[i][2])
+                    break
+            if agora:
+                self._vigente_agora = (ate, registro)
+        return registro
+
+    def vigentes(self, instante=None):
+        """Retorna um dicionário estação -> boletim válido em `instante`."""
+        with self._lock:
+            estacoes = list(self._por_estacao)
+        vigentes = {}
+        for estacao in estacoes:
+            registro = self.vigente(instante, estacao)
+            if registro is not None:
+                vigentes[estacao] = registro
+        return vigentes
+
+    def interpolar(self, estacao, instante, altura):
+        """
+        Valores da estação na altura informada, interpolados linearmente no
+        tempo entre os dois boletins consecutivos cujo início de validade
+        cerca `instante` (o vento pelas componentes u/v). Depois do último
+        boletim, usa o último enquanto ele for válido. Retorna um registro
+        perfil.DTYPE_PERFIL ou None.
+        """
+        with self._lock:
+            self._expirar()
+            entradas = self._por_estacao.get(estacao, [])
+            i = bisect_right(entradas, (instante, math.inf))
+            j = self._seguinte(entradas, i)
+            seguinte = entradas[j] if j < len(entradas) else None
+            while i > 0 and entradas[i - 1][:2] in self._removidos:
+                i -= 1
+            anterior = entradas[i - 1] if i > 0 else None
+        if anterior is None:
+            return None
+        if seguinte is None:
+            return perfil_do_boletim(anterior[3]).em(altura) if anterior[2] >= instante else None
+
+        peso = (instante - anterior[0]) / (seguinte[0] - anterior[0])
+        valores = np.concatenate([perfil_do_boletim(entrada[3]).consultar(altura)
+                                  for entrada in (anterior, seguinte)])
+        return combinar(valores, [1 - peso, peso])
+
+    def _seguinte(self, entradas, i):
+        # Primeira posição a partir de i que não foi removida
+        while i < len(entradas) and entradas[i][:2] in self._removidos:
+            i += 1
+        return i